@@ -0,0 +1,74 @@
+"""
+Benchmark for the overhead of handle_analytics_errors.
+
+Compares the current wrapper with the previous implementation, which called
+inspect.stack() and re-imported ga4mp on every call, at a few call stack
+depths (the old cost grew with the depth of the stack).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_error_handling
+"""
+
+
+import inspect
+import timeit
+
+import ga4py.error_handling as error_handling
+
+
+def legacy_handle_analytics_errors(func):
+    """
+    The wrapper as it was before caller resolution was made lazy, with the
+    error reporting removed (this benchmark never errors).
+    """
+
+    def ret_fun(*args, **kwargs):
+        try:
+            calling_function = inspect.stack()[1].function
+        except:
+            calling_function = "[unknown]"
+
+        try:
+            from ga4mp import GtagMP # type: ignore
+            from ga4mp.store import DictStore # type: ignore
+        except Exception:
+            return
+
+        return func(*args, **kwargs)
+
+    return ret_fun
+
+
+def tracked_work(value):
+    return value
+
+
+legacy = legacy_handle_analytics_errors(tracked_work)
+current = error_handling.handle_analytics_errors(tracked_work)
+
+
+def call_at_depth(depth, function):
+    # Build up a call stack of the given depth before calling function
+    if depth == 0:
+        return function(1)
+    return call_at_depth(depth - 1, function)
+
+
+def time_per_call(function, depth, number):
+    total = min(timeit.repeat(lambda: call_at_depth(depth, function), number=number, repeat=5))
+    baseline = min(timeit.repeat(lambda: call_at_depth(depth, tracked_work), number=number, repeat=5))
+    return (total - baseline) / number * 1e6
+
+
+def main():
+    print(f"{'stack depth':>12} {'before (us)':>14} {'after (us)':>12} {'speed up':>10}")
+
+    for depth in (0, 10, 50):
+        before = time_per_call(legacy, depth, number=200)
+        after = time_per_call(current, depth, number=20000)
+        print(f"{depth:>12} {before:>14.2f} {after:>12.3f} {before / max(after, 1e-3):>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark for the cost of importing ga4py in a fresh interpreter.
+
+Short scripts and CLI tools pay ga4py's import time on every run, so the
+heavy dependencies (ga4mp, requests and what they import) are only imported
+when a hit is actually sent to GA4. Each scenario runs in a new Python
+process and is compared with a process which does nothing:
+
+- import: import ga4py.add_tracker
+- decorate: import, decorate a function and call it in testing_mode
+- memory: import, decorate and send a hit with the memory transport
+
+For each scenario it reports the median extra milliseconds and which heavy
+modules ended up imported (there shouldn't be any - none of these scenarios
+talk to GA4).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --runs 20 --check
+"""
+
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import time
+from typing import Dict, List
+
+
+HEAVY_MODULES = ["ga4mp", "requests", "urllib3", "asyncio", "concurrent.futures", "multiprocessing"]
+
+SCENARIOS = {
+    "import": "import ga4py.add_tracker",
+    "decorate": (
+        "from ga4py.add_tracker import analytics_hit_decorator\n"
+        "@analytics_hit_decorator(page_location='bench', testing_mode=True, logging_level='none')\n"
+        "def tool(): return 1\n"
+        "tool()\n"
+    ),
+    "memory": (
+        "from ga4py.add_tracker import analytics_hit_decorator\n"
+        "@analytics_hit_decorator(page_location='bench', transport='memory', logging_level='none')\n"
+        "def tool(): return 1\n"
+        "tool()\n"
+    ),
+}
+
+# Prints the heavy modules which were imported, as JSON
+REPORT = "\nimport sys, json\nprint(json.dumps([m for m in {modules!r} if m in sys.modules]))\n"
+
+
+def time_script(script: str, env: Dict) -> float:
+    """
+    Returns:
+    - seconds (float): how long a new interpreter took to run the script
+    """
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", script], env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def imported_modules(script: str, env: Dict) -> List[str]:
+    output = subprocess.run(
+        [sys.executable, "-c", script + REPORT.format(modules=HEAVY_MODULES)],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(options) -> List[Dict]:
+    """
+    Returns:
+    - results (list of dictionaries): median import overhead for each scenario
+    """
+
+    env = dict(os.environ)
+    env.pop("GA4_CLI_SEC", None)
+    env.pop("GA4_MID", None)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+
+    baseline = statistics.median(time_script("pass", env) for _ in range(options.runs))
+
+    results = []
+    for name, script in SCENARIOS.items():
+        if options.scenario and name not in options.scenario:
+            continue
+
+        median = statistics.median(time_script(script, env) for _ in range(options.runs))
+        heavy = imported_modules(script, env)
+        overhead_ms = (median - baseline) * 1000
+
+        failed = []
+        if overhead_ms > options.max_ms:
+            failed.append("ms")
+        if heavy:
+            failed.append("heavy_modules")
+
+        results.append({
+            "scenario": name,
+            "overhead_ms": round(overhead_ms, 1),
+            "heavy_modules": heavy,
+            "failed": failed,
+        })
+
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10, help="processes started per scenario")
+    parser.add_argument("--max-ms", type=float, default=100.0,
+                        help="largest acceptable median overhead for --check")
+    parser.add_argument("--scenario", action="append", help="only run this scenario (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--check", action="store_true", help="exit with 1 if a threshold is broken")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    options = parse_args(argv)
+    results = run(options)
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'scenario':<12}{'ms':>8}  heavy modules")
+        for result in results:
+            print(
+                f"{result['scenario']:<12}{result['overhead_ms']:>8.1f}  "
+                f"{','.join(result['heavy_modules']) or '-':<30}"
+                + ("FAIL " + ",".join(result["failed"]) if result["failed"] else "ok")
+            )
+
+    if options.check and any(result["failed"] for result in results):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
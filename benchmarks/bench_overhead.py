@@ -0,0 +1,395 @@
+"""
+Benchmark for the per-call overhead of analytics_hit_decorator.
+
+Every scenario decorates the same small function and compares it with the
+undecorated function. Hits are sent to a local stub Measurement Protocol
+server (see benchmarks/stub_server.py) so nothing leaves the machine. For
+each scenario it reports:
+
+- p50 / p99 overhead per call (microseconds, decorated minus undecorated)
+- memory allocated per call (peak KiB, from tracemalloc) and memory blocks
+  still held per call afterwards (anything much above 0 is a leak)
+- calls per second with several threads calling at once
+
+Run with --check to exit with an error if a scenario goes over its budget
+(for CI). The budgets are what each mode is meant to cost, not timings from
+one machine:
+
+- modes which build no hit (skip_stages, summary_mode, sampled_1pct): 50us
+  and 4 KiB per call
+- modes which build hits but don't wait for the network (testing_mode,
+  null_transport, background): 250us and 32 KiB per call
+- inline modes: 1ms and 96 KiB per call on top of the sends themselves.
+  What a send costs depends on the machine and the stub latency, so it is
+  measured - the p50 of a plain HTTP POST of one hit to the stub server over
+  a keep-alive session - and each hit the scenario waits for adds that to
+  its budget
+- every mode: memory still held after the calls grows by less than half a
+  block per call. It is measured as the smaller growth over two rounds of
+  a fixed number of calls after a warm up round (whatever --calls is), so
+  caches and connections set up once don't count while a real leak grows
+  both rounds, and the stub server's own allocations are left out
+
+--threshold-scale multiplies the time budgets (e.g. on slow CI machines).
+
+The *_failing scenarios close the circuit breaker again before every call
+(outside the timed part where calls are timed one at a time), so they
+measure calls whose sends really fail rather than the breaker refusing
+sends once it has opened.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_overhead
+    python -m benchmarks.bench_overhead --latency-ms 5 --failure-rate 0.3 --check
+"""
+
+
+import os
+import gc
+import sys
+import time
+import json
+import argparse
+import tracemalloc
+import http.server
+import socketserver
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple
+from unittest import mock
+
+import ga4py.alerts as alerts
+import ga4py.config as config
+import ga4py.delivery as delivery
+import ga4py.dispatcher as dispatcher
+import ga4py.tracker_registry as tracker_registry
+from ga4py.add_tracker import analytics_hit_decorator
+import benchmarks.stub_server as stub_server
+from benchmarks.stub_server import StubServer
+
+
+class Scenario(NamedTuple):
+    name: str
+    static_args: Dict
+    network_hits: int # hits per call which wait for the stub server
+    failing: bool # use the stub server's failure rate
+    alerts: bool # send error alerts to the stub server
+    max_p50_us: float # allowed p50 overhead on top of the sends waited for
+    max_alloc_kib: float
+
+
+# Budgets for each kind of mode (see the module docstring)
+NO_HIT_BUDGET = (50, 4)
+NO_WAIT_BUDGET = (250, 32)
+INLINE_BUDGET = (1000, 96)
+
+# Memory blocks still held per call which count as a leak
+MAX_RETAINED_BLOCKS = 0.5
+
+# Calls in each round of the retained memory measurement, and how many frames
+# of each allocation's traceback tracemalloc keeps while measuring it (enough
+# to reach the stub server's code from anything it calls)
+RETAINED_ROUND_CALLS = 20
+TRACEBACK_FRAMES = 12
+
+SCENARIOS = [
+    Scenario("testing_mode", {"testing_mode": True}, 0, False, False, *NO_WAIT_BUDGET),
+    Scenario("skip_stages", {"skip_stage": ["start", "end"]}, 0, False, False, *NO_HIT_BUDGET),
+    Scenario("summary_mode", {"summary_mode": True}, 0, False, False, *NO_HIT_BUDGET),
+    Scenario("sampled_1pct", {"sample_rate": 0.01}, 0, False, False, *NO_HIT_BUDGET),
+    Scenario("null_transport", {"transport": "null"}, 0, False, False, *NO_WAIT_BUDGET),
+    Scenario("background", {"dispatch_mode": "background"}, 0, False, False, *NO_WAIT_BUDGET),
+    Scenario("inline", {}, 2, False, False, *INLINE_BUDGET),
+    Scenario("inline_failing", {}, 2, True, False, *INLINE_BUDGET),
+    Scenario("inline_failing_alerts", {}, 2, True, True, *INLINE_BUDGET),
+]
+
+BASE_ARGS = {"page_location": "benchmark", "logging_level": ""}
+
+ENVIRONMENT = {
+    "GA4_CLI_SEC": "bench-secret",
+    "GA4_MID": "G-BENCH",
+    "GA4_ANALYTICS_TEST": "FALSE",
+    "GA4_DISPATCH_MODE": "inline",
+    "GA4_SPOOL_DIR": "",
+    "GA4_ERROR_API_ENDPOINT": "",
+}
+
+
+def work(value):
+    return value + 1
+
+
+def percentile(values: List[float], wanted: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(wanted / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def call_times(function, calls: int, before_call=None) -> List[float]:
+    # Time each call on its own so we get the spread, not just the mean
+    timer = time.perf_counter_ns
+    times = []
+    for i in range(calls):
+        if before_call is not None:
+            before_call()
+        start = timer()
+        function(i)
+        times.append((timer() - start) / 1000)
+    return times
+
+
+def allocations(function, calls: int, before_call=None):
+    """
+    Returns:
+    - alloc_kib (float): average peak memory allocated by one call
+    - retained_blocks (float): memory blocks still held per call - the
+                                smaller growth over two rounds of
+                                RETAINED_ROUND_CALLS calls after a warm up
+                                round. Anything set up once doesn't count and
+                                a one-off allocation during a round (e.g. a
+                                new keep-alive connection) only affects one
+                                of them, while a leak grows both. Blocks
+                                allocated by the stub server's own threads
+                                aren't counted
+    """
+
+    tracemalloc.start()
+    try:
+        peaks = []
+        for i in range(calls):
+            if before_call is not None:
+                before_call()
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            function(i)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+
+    # Allocations made by the stub server's threads (handler objects,
+    # responses still being written) have one of these modules in their
+    # traceback - the library's never do
+    server_code = [
+        tracemalloc.Filter(False, module.__file__, all_frames=True)
+        for module in (socketserver, http.server, stub_server)
+    ]
+
+    def held_blocks():
+        dispatcher.flush(5)
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(server_code)
+        return len(snapshot.traces)
+
+    def call_round():
+        for i in range(RETAINED_ROUND_CALLS):
+            if before_call is not None:
+                before_call()
+            function(i)
+
+    tracemalloc.start(TRACEBACK_FRAMES)
+    try:
+        call_round()
+        held = [held_blocks()]
+        for _ in range(2):
+            call_round()
+            held.append(held_blocks())
+    finally:
+        tracemalloc.stop()
+
+    retained = min(max(0, after - before) for before, after in zip(held, held[1:]))
+
+    return sum(peaks) / len(peaks) / 1024, retained / RETAINED_ROUND_CALLS
+
+
+def send_time(server: StubServer, calls: int) -> float:
+    """
+    p50 time (microseconds) of a plain HTTP POST of one hit to the stub
+    server over a keep-alive session - what an inline send costs before the
+    library adds anything.
+    """
+
+    import requests
+
+    payload = json.dumps({
+        "client_id": "1234567890.1700000000",
+        "events": [{"name": "pageview", "params": {"page_location": "benchmark", "stage": "start"}}],
+    }).encode("utf-8")
+    headers = {"Content-Type": "application/json; charset=utf-8"}
+
+    with requests.Session() as session:
+        def post(_):
+            session.post(server.collect_url, data=payload, headers=headers, timeout=10)
+
+        call_times(post, min(20, calls))
+        times = call_times(post, calls)
+
+    server.reset_counts()
+    return percentile(times, 50)
+
+
+def throughput(function, threads: int, calls: int, before_call=None) -> float:
+    per_thread = max(1, calls // threads)
+
+    def run(_):
+        for i in range(per_thread):
+            # Counted in the throughput, but tiny next to a failed send
+            if before_call is not None:
+                before_call()
+            function(i)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(run, range(threads)))
+    elapsed = time.perf_counter() - start
+
+    # Background hits are sent after the calls return - that's the point -
+    # so they aren't part of the callers' throughput
+    dispatcher.flush(5)
+
+    return per_thread * threads / elapsed
+
+
+def run_scenario(
+        scenario: Scenario, server: StubServer, options, baseline: List[float], send_us: float
+        ) -> Dict:
+    server.failure_rate = options.failure_rate if scenario.failing else 0.0
+    server.reset_counts()
+
+    breaker = delivery.get_breaker()
+    breaker.reset()
+
+    # Failing sends open the breaker within a few calls - keep it closed so
+    # every call pays for its failed sends
+    before_call = breaker.reset if scenario.failing else None
+
+    environment = {"GA4_ERROR_API_ENDPOINT": server.alert_url if scenario.alerts else ""}
+
+    with mock.patch.dict(os.environ, environment):
+        config.reload_config()
+        decorated = analytics_hit_decorator(work, **BASE_ARGS, **scenario.static_args)
+
+        # Warm up (first call builds the tracker, worker threads etc)
+        call_times(decorated, min(50, options.calls), before_call)
+
+        times = call_times(decorated, options.calls, before_call)
+        alloc_kib, retained_blocks = allocations(
+            decorated, max(10, options.calls // 10), before_call
+            )
+        calls_per_second = throughput(decorated, options.threads, options.calls, before_call)
+
+        dispatcher.flush(5)
+        alerts.flush(5)
+
+    sends_us = scenario.network_hits * send_us
+    result = {
+        "scenario": scenario.name,
+        "p50_us": percentile(times, 50) - percentile(baseline, 50),
+        "p99_us": percentile(times, 99) - percentile(baseline, 99),
+        "sends_us": sends_us,
+        "alloc_kib": alloc_kib,
+        "retained_blocks": retained_blocks,
+        "calls_per_second": calls_per_second,
+        "requests": server.requests,
+        "failures": server.failures,
+        "alerts": server.alerts,
+    }
+
+    failures = []
+    if result["p50_us"] > scenario.max_p50_us * options.threshold_scale + sends_us:
+        failures.append("p50")
+    if alloc_kib > scenario.max_alloc_kib:
+        failures.append("alloc")
+    if retained_blocks > MAX_RETAINED_BLOCKS:
+        failures.append("retained")
+    result["failed"] = failures
+
+    return result
+
+
+def run(options) -> List[Dict]:
+    """
+    Run every scenario (or the ones named in options.scenario) and return
+    their results.
+    """
+
+    scenarios = [
+        scenario for scenario in SCENARIOS
+        if not options.scenario or scenario.name in options.scenario
+    ]
+
+    results = []
+    server = StubServer(latency_ms=options.latency_ms, jitter_ms=options.jitter_ms)
+
+    with server, mock.patch.dict(os.environ, ENVIRONMENT):
+        config.reload_config()
+        tracker_registry.reset_trackers()
+
+        # Send everything to the stub server rather than GA4
+        tracker = tracker_registry.get_tracker(ENVIRONMENT["GA4_CLI_SEC"], ENVIRONMENT["GA4_MID"])
+        tracker.set_endpoint(server.collect_url)
+
+        # The testing mode and error paths print - keep the report readable
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            call_times(work, min(50, options.calls))
+            baseline = call_times(work, options.calls)
+
+            server.failure_rate = 0.0
+            send_us = send_time(server, options.calls)
+
+            for scenario in scenarios:
+                results.append(run_scenario(scenario, server, options, baseline, send_us))
+
+        tracker_registry.reset_trackers()
+
+    config.reload_config()
+    return results
+
+
+def print_results(results: List[Dict]):
+    print(
+        f"{'scenario':<24}{'p50 (us)':>10}{'p99 (us)':>11}{'KiB/call':>10}"
+        f"{'held/call':>11}{'calls/s':>10}{'requests':>10}{'alerts':>8}  result"
+    )
+
+    for result in results:
+        print(
+            f"{result['scenario']:<24}{result['p50_us']:>10.1f}{result['p99_us']:>11.1f}"
+            f"{result['alloc_kib']:>10.2f}{result['retained_blocks']:>11.2f}"
+            f"{result['calls_per_second']:>10.0f}{result['requests']:>10}{result['alerts']:>8}  "
+            + ("FAIL " + ",".join(result["failed"]) if result["failed"] else "ok")
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=1000, help="calls per measurement")
+    parser.add_argument("--threads", type=int, default=8, help="threads for the throughput test")
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="stub server latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random stub latency")
+    parser.add_argument("--failure-rate", type=float, default=0.2,
+                        help="fraction of requests the stub fails in the *_failing scenarios")
+    parser.add_argument("--threshold-scale", type=float, default=1.0,
+                        help="multiply the time budgets (e.g. 2 on slow CI machines)")
+    parser.add_argument("--scenario", action="append", help="only run this scenario (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--check", action="store_true", help="exit with 1 if a threshold is broken")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    options = parse_args(argv)
+    results = run(options)
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+    if options.check and any(result["failed"] for result in results):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
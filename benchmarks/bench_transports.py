@@ -0,0 +1,130 @@
+"""
+Benchmark for the throughput of each transport.
+
+Each transport is measured two ways:
+
+- inline: one event per request through delivery.deliver (what an inline
+  tracked call does)
+- background: events queued with the dispatcher from several threads and
+  sent in batches, timed until everything has been sent
+
+The http transport sends to a local stub Measurement Protocol server (see
+benchmarks/stub_server.py) and the file transport writes to a temporary
+folder, so nothing leaves the machine.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_transports
+    python -m benchmarks.bench_transports --latency-ms 5 --events 5000
+"""
+
+
+import os
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import ga4py.config as config
+import ga4py.delivery as delivery
+import ga4py.dispatcher as dispatcher
+import ga4py.tracker_registry as tracker_registry
+import ga4py.transports as transports
+from benchmarks.stub_server import StubServer
+
+
+def make_event(i):
+    return {"name": "pageview", "params": {"page_location": "benchmark", "stage": "end", "i": i}}
+
+
+def inline_rate(tracker, transport, events: int) -> float:
+    start = time.perf_counter()
+    for i in range(events):
+        delivery.deliver(tracker, [make_event(i)], transport=transport)
+    return events / (time.perf_counter() - start)
+
+
+def background_rate(tracker, transport, events: int, threads: int) -> float:
+    per_thread = max(1, events // threads)
+
+    def run(_):
+        for i in range(per_thread):
+            dispatcher.enqueue_events(tracker, [make_event(i)], transport=transport)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(run, range(threads)))
+    dispatcher.flush(60)
+
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def run(options):
+    """
+    Returns:
+    - results (list of dictionaries): events per second for each transport
+    """
+
+    results = []
+
+    with StubServer(latency_ms=options.latency_ms) as server, \
+            tempfile.TemporaryDirectory() as temp_dir, \
+            mock.patch.dict(os.environ, {"GA4_CLI_SEC": "bench-secret", "GA4_MID": "G-BENCH"}):
+
+        config.reload_config()
+        tracker_registry.reset_trackers()
+
+        tracker = tracker_registry.get_tracker("bench-secret", "G-BENCH")
+        tracker.set_endpoint(server.collect_url)
+
+        candidates = {
+            "null": transports.NullTransport(),
+            "memory": transports.MemoryTransport(),
+            "file": transports.FileTransport(os.path.join(temp_dir, "events.ndjson")),
+            "http": transports.HttpTransport(),
+        }
+
+        for name, transport in candidates.items():
+            if options.transport and name not in options.transport:
+                continue
+
+            delivery.get_breaker(transport).reset()
+            inline = inline_rate(tracker, transport, options.events)
+            background = background_rate(tracker, transport, options.events, options.threads)
+
+            results.append({
+                "transport": name,
+                "inline_events_per_second": inline,
+                "background_events_per_second": background,
+                "requests": transport.sent_requests,
+            })
+
+        tracker_registry.reset_trackers()
+
+    config.reload_config()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--events", type=int, default=2000, help="events per measurement")
+    parser.add_argument("--threads", type=int, default=4, help="threads queueing background events")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="stub server latency")
+    parser.add_argument("--transport", action="append", help="only run this transport (repeatable)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    results = run(parse_args(argv))
+
+    print(f"{'transport':<10}{'inline events/s':>18}{'background events/s':>22}{'requests':>10}")
+    for result in results:
+        print(
+            f"{result['transport']:<10}{result['inline_events_per_second']:>18.0f}"
+            f"{result['background_events_per_second']:>22.0f}{result['requests']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
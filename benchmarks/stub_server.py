@@ -0,0 +1,108 @@
+"""
+Local stand-in for the GA4 Measurement Protocol endpoint, so the benchmarks
+can run offline.
+
+Each request waits latency_ms (plus up to jitter_ms) before answering and
+fails with a 500 with probability failure_rate. Requests to /alert are
+treated as error alert digests. Counts of what arrived are kept on the server.
+
+    with StubServer(latency_ms=20, failure_rate=0.1) as server:
+        tracker._base_domain = server.collect_url
+"""
+
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1" # Allow keep-alive like the real endpoint
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        failed = random.random() < server.failure_rate
+        server.record(self.path, body, failed)
+
+        self.send_response(500 if failed else 204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Measurement Protocol stub listening on a free local port.
+
+    Parameters:
+    - latency_ms (float - optional): [default 0] time taken to answer each request
+    - jitter_ms (float - optional): [default 0] extra random time, up to this much
+    - failure_rate (float - optional): [default 0] fraction of requests answered with a 500
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, failure_rate: float = 0.0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reset_counts()
+
+    @property
+    def collect_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/mp/collect"
+
+    @property
+    def alert_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/alert"
+
+    def reset_counts(self):
+        with self._lock:
+            self.requests = 0
+            self.events = 0
+            self.failures = 0
+            self.alerts = 0
+
+    def record(self, path: str, body: bytes, failed: bool):
+        with self._lock:
+            self.requests += 1
+            if failed:
+                self.failures += 1
+
+            if path.startswith("/alert"):
+                self.alerts += 1
+                return
+
+            try:
+                self.events += len(json.loads(body).get("events", []))
+            except Exception:
+                pass
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
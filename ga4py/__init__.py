@@ -0,0 +1,4 @@
+from ga4py.spans import span
+from ga4py.context import tracking_context
+from ga4py.metrics import stats
+from ga4py.instrument import instrument_module, instrument_class, uninstrument
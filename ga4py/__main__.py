@@ -0,0 +1,53 @@
+"""
+Command line entry point.
+
+    python -m ga4py replay [--spool-dir DIR] [--workers N] [--batch-size N]
+
+Sends hits which were written to the spool (see ga4py/spool.py) to GA4.
+"""
+
+
+import argparse
+import sys
+
+import ga4py.spool as spool
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ga4py")
+    subparsers = parser.add_subparsers(dest="command")
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="send spooled hits to GA4"
+    )
+    replay_parser.add_argument(
+        "--spool-dir", default=None, help="spool folder (default GA4_SPOOL_DIR)"
+    )
+    replay_parser.add_argument(
+        "--workers", type=int, default=4, help="spool files replayed at once"
+    )
+    replay_parser.add_argument(
+        "--batch-size", type=int, default=25, help="events per request (max 25)"
+    )
+    replay_parser.add_argument(
+        "--quiet", action="store_true", help="only print errors"
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command != "replay":
+        parser.print_help()
+        return 2
+
+    totals = spool.replay(
+        spool_dir=args.spool_dir,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        logging_level="error" if args.quiet else "all",
+    )
+
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
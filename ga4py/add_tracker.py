@@ -1,21 +1,70 @@
 import os
+import time
+import atexit
+import threading
+import inspect
+import functools
 from functools import wraps # Properly show docstrings for decorated functions
 import ga4py.error_handling as error_handling
-from typing import Tuple, List, Dict, AnyStr
-
-try:
-    from ga4mp import GtagMP
-except Exception as e:
-    print("Failed to import ga4mp - tracking will likely fail")
-
-
-def analytics_hit_decorator(func):
+import ga4py.dispatcher as dispatcher
+import ga4py.spool as spool
+import ga4py.delivery as delivery
+import ga4py.multiprocess as multiprocess
+import ga4py.transports as transports
+import ga4py.encoding as encoding
+import ga4py.spans as spans
+import ga4py.context as context
+import ga4py.dedup as dedup
+import ga4py.metrics as metrics
+import ga4py.profiling as profiling
+import ga4py.config as config
+import ga4py.plan as plan_module
+from ga4py.plan import TrackingPlan
+from ga4py.sampling import CallSampler
+import ga4py.summary as summary_module
+from ga4py.summary import CallSummary
+import ga4py.tracker_registry as tracker_registry
+from typing import Tuple, List, Dict, AnyStr, Optional
+
+# ga4mp and requests are only imported when a hit is actually sent (see
+# ga4py/tracker_registry.py) so importing this module and decorating
+# functions stays fast
+
+
+def analytics_hit_decorator(func=None, **static_args):
     """
     Decorator to add tracking to a function.
  
     When added to a function, will add a traking ping when the function 
     starts, and one when it ends. 
 
+    Coroutine functions (async def) get an async wrapper - the start, end and
+    error hits are sent from a worker thread so the event loop is never blocked,
+    and the end hit is only sent once the coroutine has actually finished.
+
+    Generator and async generator functions are tracked lazily - the start hit
+    is sent on the first next(), the end hit when the stream is exhausted or
+    closed (with "items_yielded" and "stream_ms", the time from the first item
+    to the last) and the error hit if an exception is raised while iterating.
+
+    Blocks of code inside the function can be timed with ga4py.span(name) -
+    the span durations are added to the end (or error) hit rather than being
+    sent separately (see ga4py/spans.py).
+
+    Tracking arguments which are the same for every call can be given to the
+    decorator itself, e.g. @analytics_hit_decorator(page_location="my_tool").
+    These (and the environment variables) are worked out once when the function
+    is decorated, so calls which don't pass their own arguments have very little
+    overhead. If you change the environment variables while running, call
+    ga4py.config.reload_config().
+
+    decorator parameters:
+        - func (function): the function to track (passed automatically when
+                            the decorator is used without brackets)
+
+        - **static_args (optional): default tracking arguments for every call, the same
+                                    options as ga4py_args (see the readme)
+
     function parameters:
         - ga4py_args_remove (dictionary - optional): [default None] arguments to
                                                 pass to GA4, this parameter will
@@ -47,178 +96,905 @@ def analytics_hit_decorator(func):
                                                                     sent, but will automatically include a parameter in the GA4  hit so you can 
                                                                     filter out testing events (the parameter name will be "testing" and the value will be
                                                                     "TRUE")
+
+        - GA4_DISPATCH_MODE (environment variable - optional): [default "inline"] set to "background" to have hits queued and
+                                                                    sent by a worker thread instead of before/after the function runs.
+                                                                    Can also be set per call with the "dispatch_mode" argument
+
+        - GA4_FLUSH_TIMEOUT (environment variable - optional): [default 5] the maximum number of seconds to wait at interpreter exit
+                                                                    for queued background hits to be sent
+
+        - GA4_LATENCY_BUDGET_MS (environment variable - optional): the longest (in milliseconds) an inline hit can hold up
+                                                                    your function, can also be set with the "latency_budget_ms" argument
+
+        - GA4_SPOOL_DIR (environment variable - optional): a folder to write hits which fail to send to, so they can be
+                                                                    sent later with "python -m ga4py replay"
     """
 
+    if func is None:
+        # Called with static arguments - @analytics_hit_decorator(page_location=...)
+        return functools.partial(analytics_hit_decorator, **static_args)
+
+    # Get the name of the function we're tracking (useful for error handling)
+    func_name = func.__name__
+
+    # Work out everything we can before the function is ever called (the
+    # plan and the config generation it was made from)
+    compiled = [(_compile_plan(func_name, static_args), config.generation())]
+
+    def call_plan(kwargs) -> Optional[TrackingPlan]:
+        """
+        Get the plan for this call - the compiled plan unless the caller
+        passed their own tracking arguments. None if the tracking arguments
+        couldn't be turned into a plan, so the call runs untracked.
+        """
+
+        plan, generation = compiled[0]
+        if generation != config.generation():
+            # Environment config has been reloaded since we compiled
+            generation = config.generation()
+            plan = _compile_plan(func_name, static_args)
+            compiled[0] = (plan, generation)
+
+        if kwargs:
+            # If user has included ga4py_args_remove then use it while 
+            # removing from the arguments passed, ga4py_args is used 
+            # but not removed from what is passed to the function
+            remove_args = kwargs.pop("ga4py_args_remove", None)
+            keep_args = kwargs.get("ga4py_args", None)
+
+            if (remove_args or keep_args) and plan is not None:
+                # Only the call's own arguments are applied to the
+                # compiled plan (see plan.with_overrides)
+                plan = _compile_plan(
+                    func_name, static_args, remove_args, keep_args, base_plan=plan
+                    )
+
+        return plan
+
+    # One sampler per set of sampling settings, so the counts and rate
+    # limit carry over between calls
+    samplers: Dict = {}
+
+    def sample_call(plan) -> Tuple:
+        """
+        Decide whether this call is tracked.
+
+        Returns:
+        - tracked (bool)
+        - call_parameters (dictionary): parameters to add to this call's hits
+        """
+
+        if plan.sampling is None:
+            return True, {}
+
+        sampler = samplers.get(plan.sampling)
+        if sampler is None:
+            sampler = samplers.setdefault(plan.sampling, CallSampler(plan.sampling))
+
+        tracked, call_parameters = sampler.decide()
+        if not tracked:
+            metrics.increment("calls_sampled_out")
+
+        return tracked, call_parameters
+
+    # Calls recorded in summary mode
+    summary = CallSummary(func_name)
+
+    if inspect.isgeneratorfunction(func):
+
+        @wraps(func) # Make sure docstring comes through properly
+        def generator_wrapper(*args, **kwargs):
+            plan = call_plan(kwargs)
+            if plan is None:
+                return func(*args, **kwargs)
+
+            # Nothing is tracked until the first item is asked for
+            return _track_generator(plan, sample_call, summary, func, args, kwargs)
+
+        return _tracked(generator_wrapper, summary)
+
+    if inspect.isasyncgenfunction(func):
+
+        @wraps(func) # Make sure docstring comes through properly
+        def async_generator_wrapper(*args, **kwargs):
+            plan = call_plan(kwargs)
+            if plan is None:
+                return func(*args, **kwargs)
+
+            return _track_async_generator(plan, sample_call, summary, func, args, kwargs)
+
+        return _tracked(async_generator_wrapper, summary)
+
+    if inspect.iscoroutinefunction(func):
+
+        @wraps(func) # Make sure docstring comes through properly
+        async def async_wrapper(*args, **kwargs):
+
+            entered = time.perf_counter()
+            plan = call_plan(kwargs)
+
+            if plan is None:
+                return await func(*args, **kwargs)
+
+            if plan.summary_mode:
+                started = time.perf_counter()
+                error = None
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    summary_parameters = summary.record(
+                        plan, time.perf_counter() - started, error
+                        )
+                    if summary_parameters is not None:
+                        await _run_off_loop(
+                            _send_stage, plan, "summary", None, summary_parameters
+                            )
+
+            tracked, call_parameters = sample_call(plan)
+            if not tracked:
+                return await func(*args, **kwargs)
+
+            # The context variable belongs to this coroutine's task, and
+            # _run_off_loop passes it on to the worker thread
+            context_token, call_parameters = _start_invocation(plan, call_parameters)
+            function_seconds = 0.0
+            call_profile = None
+            span_token = None
+
+            try:
+                # Tracking runs on a worker thread so we never block the event
+                # loop, the coroutine itself is awaited as normal
+                gtag_tracker, tracking_success = await _run_off_loop(
+                    _send_start_hit, plan, call_parameters
+                    )
+
+                timer = _start_timer()
+                span_token = spans.start_invocation()
+                call_profile = profiling.start(plan)
+
+                called = time.perf_counter()
+
+                try:
+                    returned_value = await func(*args, **kwargs)
+
+                except Exception as e:
+                    function_seconds = time.perf_counter() - called
+                    call_parameters = {
+                        **call_parameters, 
+                        **profiling.finish(plan, call_profile),
+                        **_stop_timer(timer), 
+                        **spans.finish_invocation(span_token)
+                        }
+                    await _run_off_loop(
+                        _send_error_hit, plan, e, gtag_tracker, tracking_success, call_parameters
+                        )
+
+                    # If there's an error we still raise it, we
+                    # just send an error message to our tracking first
+                    raise
+
+                function_seconds = time.perf_counter() - called
+
+                # Send success hit now that the coroutine has actually finished
+                call_parameters = {
+                    **call_parameters, 
+                    **profiling.finish(plan, call_profile),
+                    **_stop_timer(timer), 
+                    **spans.finish_invocation(span_token)
+                    }
+                await _run_off_loop(
+                    _send_end_hit, plan, gtag_tracker, tracking_success, call_parameters
+                    )
+
+            finally:
+                # A cancelled coroutine never reaches profiling.finish or
+                # spans.finish_invocation
+                profiling.release(call_profile)
+                spans.abandon_invocation(span_token)
+                context.restore(context_token)
+                metrics.observe(
+                    "tracking_overhead_seconds", time.perf_counter() - entered - function_seconds
+                    )
+
+            return returned_value
+
+        return _tracked(async_wrapper, summary)
+
+
     @wraps(func) # Make sure docstring comes through properly
     def wrapper(*args, **kwargs):
 
-        # Get the name of the function we're tracking (useful for error handling)
-        func_name = func.__name__
+        entered = time.perf_counter()
+        plan = call_plan(kwargs)
 
-        arg_params = {}
+        if plan is None:
+            # The tracking arguments couldn't be used (already reported)
+            return func(*args, **kwargs)
 
-        if kwargs != None:
-            # If user has included ga4py_args_remove then add to our arg
-            # dict while removing from the arguments passed
-            arg_params.update(kwargs.pop("ga4py_args_remove", {}))
+        if plan.summary_mode:
+            return _call_with_summary(plan, summary, func, args, kwargs)
 
-            # Add other parameters but don't remove them from what is
-            # being passed to the function
-            arg_params.update(kwargs.get("ga4py_args", {}))
+        tracked, call_parameters = sample_call(plan)
+        if not tracked:
+            # Sampled out - run the function without any tracking
+            return func(*args, **kwargs)
 
-        # Check if this is a testing hit
-        testing_flag = os.getenv("GA4_ANALYTICS_TEST", "FALSE")
-        if testing_flag == "TRUE":
-            arg_params["testing"] = testing_flag
+        # Hold this call's invocation in a context variable, so the hits,
+        # nested tracked calls and work handed to other threads with
+        # ga4py.context.wrap all know which call (and client) they belong to
+        context_token, call_parameters = _start_invocation(plan, call_parameters)
+        function_seconds = 0.0
+        call_profile = None
+        span_token = None
 
-        
-        # Pull out key information from the dictionary
-        page_title = arg_params.pop("page_title", "")
-        page_location = arg_params.pop("page_location", None)
-        event_name = arg_params.pop("event_name", "pageview")
-        testing_mode = arg_params.pop("testing_mode", False)
+        try:
+            # Send "starting function" hit
+            gtag_tracker, tracking_success = _send_start_hit(plan, call_parameters)
 
-        # Pull out skip_stage if it exists, if it doesn't just use
-        # an empty list
-        skip_stage = arg_params.pop("skip_stage", [])
+            timer = _start_timer()
 
-        # Pull out logging level to know if/what we should print
-        logging_level = arg_params.pop("logging_level", "")
+            # Collect any ga4py.span() timings from inside the function
+            span_token = spans.start_invocation()
 
-        # Allow user to set custom 'stage' to send (will skip start and end)
-        stage = arg_params.pop("stage", "start")
+            # Profile the call if profile_rate is set and this call is picked
+            call_profile = profiling.start(plan)
 
+            called = time.perf_counter()
 
-        try:
-            tracking_success = True
+            try:
+                # Run function as normal
+                returned_value = func(*args, **kwargs)
 
-            # Send "starting function" hit
-            if stage not in skip_stage:
-                if logging_level == "all":
-                    print(f"Sending {stage} hit")
-
-                response = send_hit(
-                    parameter_dictionary = arg_params,
-                    page_title = page_title,
-                    page_location = page_location,
-                    event_name = event_name,
-                    stage = stage,
-                    gtag_tracker = None, 
-                    # For the time being we don't do anything to
-                    # try to join users up from different script runs
-                    # simpler this way!
-                    testing_mode = testing_mode,
-                    logging_level=logging_level,
-                    func_name = func_name
-                )
+            except Exception as e:
+                function_seconds = time.perf_counter() - called
+                call_parameters = {
+                    **call_parameters, 
+                    **profiling.finish(plan, call_profile),
+                    **_stop_timer(timer), 
+                    **spans.finish_invocation(span_token)
+                    }
+                _send_error_hit(plan, e, gtag_tracker, tracking_success, call_parameters)
 
-                if isinstance(response, tuple) and len(response)==2:
-                    gtag_tracker, tracking_success = response[0], response[1]
-            
-            elif logging_level == "all":
-                print(f"Skipping sending {stage} tracking hit. skip_stage: {skip_stage}")
+                # If there's an error we still raise it, we
+                # just send an error message to our tracking first
+                raise
 
-            
-            # Run function as normal
-            returned_value = func(*args, **kwargs)
+            function_seconds = time.perf_counter() - called
 
             # Send success hit now that function is done
-            if "end" not in skip_stage \
-                and stage!="start"\
-                and tracking_success:
-                
-                if logging_level == "all":
-                    print("Sending end hit")
-
-                response = send_hit(
-                    parameter_dictionary = arg_params,
-                    page_title = page_title,
-                    page_location = page_location,
-                    event_name = event_name,
-                    stage = "end",
-                    gtag_tracker = gtag_tracker,
-                    testing_mode = testing_mode,
-                    logging_level=logging_level,
-                    func_name = func_name
+            call_parameters = {
+                **call_parameters, 
+                **profiling.finish(plan, call_profile),
+                **_stop_timer(timer), 
+                **spans.finish_invocation(span_token)
+                }
+            _send_end_hit(plan, gtag_tracker, tracking_success, call_parameters)
+
+        finally:
+            # KeyboardInterrupt/SystemExit never reach profiling.finish or
+            # spans.finish_invocation
+            profiling.release(call_profile)
+            spans.abandon_invocation(span_token)
+            context.restore(context_token)
+
+            # Time the decorator added to the call (see ga4py/metrics.py)
+            metrics.observe(
+                "tracking_overhead_seconds", time.perf_counter() - entered - function_seconds
                 )
-                    
-                if isinstance(response, tuple) and len(response)==2:
-                    gtag_tracker, tracking_success = response[0], response[1]
-                    
-            elif logging_level == "all":
-                print(f"Skipping sending 'end' tracking hit. skip_stage: {skip_stage} custom_stage: {stage}")
 
-            return returned_value
-        
-        except error_handling.AnalyticsException as e:
-            # If function hits an error and user has defined a specific message
-            # to send to analytics, use that
-
-            if "error" not in skip_stage \
-                and tracking_success:
-
-                arg_params["error_message"] = e.analytics_message
-                response = send_hit(
-                    parameter_dictionary = arg_params,
-                    page_title = page_title,
-                    page_location = page_location,
-                    event_name = event_name,
-                    stage = "error",
-                    gtag_tracker = gtag_tracker,
-                    testing_mode = testing_mode,
-                    logging_level=logging_level,
-                    func_name = func_name
-                )
-                if isinstance(response, tuple) and len(response)==2:
-                    gtag_tracker, tracking_success = response[0], response[1]
-                    
-            elif logging_level == "all":
-                print(f"Skipping sending 'error' tracking hit. skip_stage: {skip_stage}")        
-            
-            # Still raise the error
-            raise e
+        return returned_value
+    
 
-        
-        except Exception as e:
-            # Send standard error hit with no specialised message to include
-            if "error" not in skip_stage:
-                response = send_hit(
-                    parameter_dictionary = arg_params,
-                    page_title = page_title,
-                    page_location = page_location,
-                    event_name = event_name,
-                    stage = "error",
-                    gtag_tracker = gtag_tracker,
-                    testing_mode = testing_mode,
-                    logging_level=logging_level,
-                    func_name = func_name
+    return _tracked(wrapper, summary)
+
+
+def _compile_plan(func_name, *argument_dicts, base_plan=None) -> Optional[TrackingPlan]:
+    """
+    Build a tracking plan without ever raising - if the tracking arguments
+    can't be turned into a plan the error is reported and None is returned,
+    so the call runs untracked rather than failing.
+
+    With base_plan (the plan compiled from the first argument dictionary)
+    only the later dictionaries - a call's overrides - are applied to it.
+    """
+
+    try:
+        if base_plan is not None:
+            return plan_module.with_overrides(base_plan, *argument_dicts)
+        return plan_module.compile_plan(func_name, *argument_dicts)
+
+    except Exception as e:
+        try:
+            error_handling.send_tracking_error_alert(
+                error=e,
+                function=func_name,
+                parameters=list(argument_dicts),
+                logging_level=""
                 )
-                
-                if isinstance(response, tuple) and len(response)==2:
-                    gtag_tracker, tracking_success = response[0], response[1]
+        except Exception:
+            pass
 
-            elif logging_level == "all":
-                print(f"Skipping sending 'error' tracking hit. skip_stage: {skip_stage}")        
+        return None
 
-            # If there's an error we still raise it, we
-            # just send an error message to our tracking first
-            raise e
-    
 
+def _tracked(wrapper, summary):
+    """
+    Mark a wrapper as made by analytics_hit_decorator, keeping its summary so
+    ga4py.instrument can send what's left of it when the wrapper is removed.
+    """
+    wrapper._ga4py_summary = summary
     return wrapper
 
 
+def send_pending_summary(wrapper):
+    """
+    Send the summary hit for calls to a summary_mode wrapper since its last
+    summary hit (rather than waiting for the interval or for Python to exit).
+    """
+
+    summary = getattr(wrapper, "_ga4py_summary", None)
+    if summary is None:
+        return
+
+    summary_parameters = summary.take()
+    if summary_parameters is not None and summary.last_plan is not None:
+        _send_stage(summary.last_plan, "summary", None, summary_parameters)
+
+
+def _start_invocation(plan, call_parameters) -> Tuple:
+    """
+    Make a new invocation context current for a tracked call (see
+    ga4py/context.py).
+
+    Returns:
+    - token: pass to context.restore when the call has finished
+    - call_parameters (dictionary): the call's parameters plus the context's
+                                    (ga4py.tracking_context parameters and,
+                                    if plan.invocation_ids, the ids)
+    """
+
+    invocation = context.new_invocation()
+    context_parameters = invocation.parameters(plan.invocation_ids)
+    if context_parameters:
+        call_parameters = {**context_parameters, **call_parameters}
+
+    return context.activate(invocation), call_parameters
+
+
+def _send_stage(plan, stage, gtag_tracker, extra_parameters=None) -> Tuple:
+    """
+    Send a single hit using the plan for this call.
+
+    Parameters:
+    - plan (TrackingPlan)
+    - stage (string): the stage to record
+    - gtag_tracker (tracker object): tracker from an earlier hit, or None
+    - extra_parameters (dictionary - optional): [default None] parameters to
+                                                add to the plan's parameters
+
+    Returns:
+    - gtag_tracker (tracker object - or None if we couldn't create one)
+    - tracking_success (bool)
+    """
+
+    parameter_dictionary = plan.parameter_dictionary
+    if extra_parameters:
+        parameter_dictionary = {**parameter_dictionary, **extra_parameters}
+
+    response = _send_unless_duplicate(
+        plan, stage, gtag_tracker, parameter_dictionary, 
+        library_keys=_library_keys(extra_parameters), logging_level=plan.logging_level
+        )
+
+    if isinstance(response, tuple) and len(response)==2:
+        return response[0], response[1]
+
+    return gtag_tracker, True
+
+
+def _library_keys(extra_parameters) -> frozenset:
+    """
+    The parameters on a hit which the library set itself - these are kept
+    first if the hit has too many (see ga4py/encoding.py).
+
+    That's the environment's testing flag and this call's own parameters
+    (timings, spans, sampling, summaries...), apart from the ones set with
+    ga4py.tracking_context which are passed along with them. Parameters from
+    the decorator or ga4py_args are the caller's whatever they're called.
+    """
+
+    library_keys = set()
+
+    if config.get_config().testing_flag == "TRUE":
+        library_keys.add("testing")
+
+    if extra_parameters:
+        caller_keys = context.current().params
+        library_keys.update(key for key in extra_parameters if key not in caller_keys)
+
+    return frozenset(library_keys)
+
+
+@error_handling.handle_analytics_errors
+def _send_unless_duplicate(plan, stage, gtag_tracker, parameter_dictionary, 
+                           library_keys=frozenset(), logging_level=""):
+    """
+    Send a hit with send_hit, unless dedup_window is set and an identical
+    hit was sent recently (see ga4py/dedup.py). Guarded like send_hit, so
+    a broken dedup cache can't raise into the tracked code.
+
+    Returns:
+    - whatever send_hit returned, (gtag_tracker, True) if the hit was skipped
+    """
+
+    if plan.dedup_window and stage != "summary":
+        # Skip hits identical to one sent recently
+        suppressed = dedup.check(plan, stage)
+        if suppressed is None:
+            metrics.increment("hits_deduplicated")
+            if logging_level == "all":
+                print(f"Skipping duplicate {stage} hit")
+            return gtag_tracker, True
+
+        if suppressed:
+            parameter_dictionary = {**parameter_dictionary, "dedup_suppressed": suppressed}
+            library_keys = library_keys | {"dedup_suppressed"}
+
+    return send_hit(
+        parameter_dictionary = parameter_dictionary,
+        library_keys = library_keys,
+        page_title = plan.page_title,
+        page_location = plan.page_location,
+        event_name = plan.event_name,
+        stage = stage,
+        gtag_tracker = gtag_tracker, 
+        testing_mode = plan.testing_mode,
+        dispatch_mode = plan.dispatch_mode,
+        latency_budget_ms = plan.latency_budget_ms,
+        transport = plan.transport,
+        logging_level = plan.logging_level,
+        func_name = plan.func_name
+    )
+
+
+def _send_start_hit(plan, call_parameters=None) -> Tuple:
+    """
+    Send the hit for the start of the call (or the user's custom stage).
+
+    call_parameters are extra parameters for this call only (e.g. sampling
+    counts), the same applies to the end and error hits.
+
+    Returns:
+    - gtag_tracker (tracker object - or None if nothing was sent)
+    - tracking_success (bool)
+    """
+
+    if not plan.send_start:
+        if plan.logging_level == "all":
+            print(f"Skipping sending {plan.stage} tracking hit. skip_stage: {sorted(plan.skip_stage)}")
+        return None, True
+
+    if plan.logging_level == "all":
+        print(f"Sending {plan.stage} hit")
+
+    # For the time being we don't do anything to
+    # try to join users up from different script runs
+    # simpler this way! (Calls within one run share the
+    # process-wide tracker and its client id)
+    return _send_stage(plan, plan.stage, None, call_parameters)
+
+
+def _send_end_hit(plan, gtag_tracker, tracking_success, call_parameters=None) -> Tuple:
+    """
+    Send the hit for a call which completed successfully.
+
+    Skipped if "end" is in skip_stage, if the user set a custom stage
+    (which replaces start and end) or if tracking has already failed.
+
+    If slow_threshold_ms is set and the call took longer than that, a
+    "slow" hit is sent as well (unless "slow" is in skip_stage).
+    """
+
+    call_parameters = call_parameters or {}
+
+    if plan.send_slow \
+        and tracking_success \
+        and call_parameters.get("duration_ms", 0) > plan.slow_threshold_ms:
+
+        if plan.logging_level == "all":
+            print(f"Sending slow hit - call took {call_parameters['duration_ms']}ms")
+
+        gtag_tracker, tracking_success = _send_stage(plan, "slow", gtag_tracker, call_parameters)
+
+    if plan.send_end and tracking_success:
+        if plan.logging_level == "all":
+            print("Sending end hit")
+
+        return _send_stage(plan, "end", gtag_tracker, call_parameters)
+
+    if plan.logging_level == "all":
+        print(f"Skipping sending 'end' tracking hit. skip_stage: {sorted(plan.skip_stage)} custom_stage: {plan.stage}")
+
+    return gtag_tracker, tracking_success
+
+
+def _send_error_hit(plan, error, gtag_tracker, tracking_success, call_parameters=None) -> Tuple:
+    """
+    Send the hit for a call which raised an error.
+
+    If the function raised an AnalyticsException the user's analytics message
+    is included as the "error_message" parameter.
+    """
+
+    if isinstance(error, error_handling.AnalyticsException):
+        # If function hits an error and user has defined a specific message
+        # to send to analytics, use that
+        if plan.send_error and tracking_success:
+            return _send_stage(
+                plan, "error", gtag_tracker, 
+                extra_parameters={
+                    **(call_parameters or {}), 
+                    "error_message": error.analytics_message
+                    }
+                )
+
+    elif plan.send_error:
+        # Send standard error hit with no specialised message to include
+        return _send_stage(plan, "error", gtag_tracker, call_parameters)
+
+    if plan.logging_level == "all":
+        print(f"Skipping sending 'error' tracking hit. skip_stage: {sorted(plan.skip_stage)}")
+
+    return gtag_tracker, tracking_success
+
+
+def _start_timer() -> Tuple[float, float]:
+    """
+    Start timing a call - wall clock and process CPU time, both monotonic.
+    """
+    return time.perf_counter(), time.process_time()
+
+
+def _stop_timer(timer) -> Dict:
+    """
+    Finish timing a call started with _start_timer.
+
+    Returns:
+    - timing (dictionary): "duration_ms" (wall clock) and "cpu_ms" (CPU time
+                            used by the whole process during the call)
+    """
+
+    wall_started, cpu_started = timer
+    return {
+        "duration_ms": round((time.perf_counter() - wall_started) * 1000, 3),
+        "cpu_ms": round((time.process_time() - cpu_started) * 1000, 3),
+    }
+
+
+class _StreamTimer:
+    """
+    Timing for a generator - from the first item being asked for until the
+    stream finishes, plus the number of items, the time between the first
+    and last item and the spans recorded while the generator ran. Items
+    themselves are never stored.
+    """
+
+    __slots__ = ("timer", "items", "first_item", "last_item", "spans")
+
+    def __init__(self):
+        self.timer = _start_timer()
+        self.items = 0
+        self.first_item = None
+        self.last_item = None
+        self.spans = spans.Invocation()
+
+    def item(self):
+        now = time.perf_counter()
+        if self.first_item is None:
+            self.first_item = now
+        self.last_item = now
+        self.items += 1
+
+    def parameters(self) -> Dict:
+        parameters = _stop_timer(self.timer)
+        parameters["items_yielded"] = self.items
+        parameters["stream_ms"] = (
+            round((self.last_item - self.first_item) * 1000, 3) 
+            if self.first_item is not None else 0.0
+        )
+        parameters.update(self.spans.parameters())
+        return parameters
+
+
+def _start_stream(plan, sample_call) -> Tuple:
+    """
+    Called on the first next() of a tracked generator - decide whether the
+    stream is tracked and send the start hit.
+
+    Returns:
+    - tracked (bool)
+    - call_parameters (dictionary)
+    - gtag_tracker (tracker object - or None)
+    - tracking_success (bool)
+    """
+
+    if plan.summary_mode:
+        # Summary mode records the stream when it finishes instead
+        return False, {}, None, True
+
+    tracked, call_parameters = sample_call(plan)
+    if not tracked:
+        return False, call_parameters, None, True
+
+    # A generator can be resumed from different contexts, so its invocation
+    # isn't made current - its hits just share the invocation's parameters
+    context_parameters = context.new_invocation().parameters(plan.invocation_ids)
+    if context_parameters:
+        call_parameters = {**context_parameters, **call_parameters}
+
+    gtag_tracker, tracking_success = _send_start_hit(plan, call_parameters)
+    return True, call_parameters, gtag_tracker, tracking_success
+
+
+def _finish_stream(plan, summary, stream, started, error=None):
+    """
+    Send the end (or error) hit once a generator is exhausted, closed or
+    has raised. started is what _start_stream returned.
+    """
+
+    tracked, call_parameters, gtag_tracker, tracking_success = started
+
+    if plan.summary_mode:
+        summary_parameters = summary.record(plan, time.perf_counter() - stream.timer[0], error)
+        if summary_parameters is not None:
+            _send_stage(plan, "summary", None, summary_parameters)
+        return
+
+    if not tracked:
+        return
+
+    call_parameters = {**call_parameters, **stream.parameters()}
+
+    if error is not None:
+        _send_error_hit(plan, error, gtag_tracker, tracking_success, call_parameters)
+    else:
+        _send_end_hit(plan, gtag_tracker, tracking_success, call_parameters)
+
+
+def _track_generator(plan, sample_call, summary, func, args, kwargs):
+    """
+    Generator which passes through everything from the decorated generator
+    function (including send(), throw() and close()) while tracking it.
+
+    The start hit is sent on the first next(), the end hit when the
+    generator is exhausted or closed, and the error hit if it raises.
+    Spans are collected while the generator runs (not while the caller
+    handles each item) and sent with the end/error hit.
+    """
+
+    started = _start_stream(plan, sample_call)
+    stream = _StreamTimer()
+    generator = func(*args, **kwargs)
+
+    try:
+        sent_value = None
+        pending_error = None
+
+        while True:
+            # Each step can be run from a different context, so the span
+            # invocation is only current for the step itself
+            span_token = spans.start_invocation(stream.spans)
+            try:
+                if pending_error is not None:
+                    error, pending_error = pending_error, None
+                    item = generator.throw(error)
+                else:
+                    item = generator.send(sent_value)
+
+            except StopIteration as stop:
+                returned_value = stop.value
+                break
+
+            finally:
+                spans.abandon_invocation(span_token)
+
+            stream.item()
+
+            try:
+                sent_value = yield item
+            except GeneratorExit:
+                generator.close()
+                raise
+            except BaseException as e:
+                # Pass errors thrown into us on to the real generator
+                pending_error = e
+                sent_value = None
+
+    except GeneratorExit:
+        # Closed before the end - still a normal finish
+        _finish_stream(plan, summary, stream, started)
+        raise
+
+    except Exception as e:
+        _finish_stream(plan, summary, stream, started, e)
+        raise
+
+    _finish_stream(plan, summary, stream, started)
+    return returned_value
+
+
+async def _track_async_generator(plan, sample_call, summary, func, args, kwargs):
+    """
+    Async version of _track_generator, passing through asend(), athrow()
+    and aclose(). Hits are sent from a worker thread.
+    """
+
+    started = await _run_off_loop(_start_stream, plan, sample_call)
+    stream = _StreamTimer()
+    generator = func(*args, **kwargs)
+
+    try:
+        sent_value = None
+        pending_error = None
+
+        while True:
+            span_token = spans.start_invocation(stream.spans)
+            try:
+                if pending_error is not None:
+                    error, pending_error = pending_error, None
+                    item = await generator.athrow(error)
+                else:
+                    item = await generator.asend(sent_value)
+
+            except StopAsyncIteration:
+                break
+
+            finally:
+                spans.abandon_invocation(span_token)
+
+            stream.item()
+
+            try:
+                sent_value = yield item
+            except GeneratorExit:
+                await generator.aclose()
+                raise
+            except BaseException as e:
+                pending_error = e
+                sent_value = None
+
+    except GeneratorExit:
+        await _run_off_loop(_finish_stream, plan, summary, stream, started)
+        raise
+
+    except Exception as e:
+        await _run_off_loop(_finish_stream, plan, summary, stream, started, e)
+        raise
 
+    await _run_off_loop(_finish_stream, plan, summary, stream, started)
 
 
+def _call_with_summary(plan, summary, func, args, kwargs):
+    """
+    Run the function in summary mode - record how long it took and whether
+    it failed, and send the summary hit if the interval is up.
+    """
+
+    started = time.perf_counter()
+    error = None
+
+    try:
+        return func(*args, **kwargs)
+
+    except Exception as e:
+        error = e
+        raise
+
+    finally:
+        summary_parameters = summary.record(plan, time.perf_counter() - started, error)
+        if summary_parameters is not None:
+            _send_stage(plan, "summary", None, summary_parameters)
+
+
+def _send_remaining_summaries():
+    """
+    atexit hook - send the summary for calls since the last summary hit.
+
+    This is registered after the dispatcher's own atexit hook, and atexit
+    hooks run last-in-first-out, so background summary hits are queued
+    before the dispatcher flushes.
+    """
+
+    for summary in summary_module.all_summaries():
+        summary_parameters = summary.take()
+        if summary_parameters is not None and summary.last_plan is not None:
+            _send_stage(summary.last_plan, "summary", None, summary_parameters)
+
+
+atexit.register(_send_remaining_summaries)
+
 
-def initialise_tracking(logging_level) -> GtagMP:
+# Threads which send the hits of async tracked functions (see _run_off_loop)
+ASYNC_TRACKING_THREADS = 4
+
+_async_executor = None # ThreadPoolExecutor, created when an async function is first tracked
+_async_lock = threading.Lock()
+
+
+async def _run_off_loop(function, *args):
+    """
+    Run a (blocking) tracking function on ga4py's own small thread pool so
+    async callers don't stall the loop while hits are built and sent.
+
+    We don't use the event loop's default executor - asyncio also runs
+    getaddrinfo there, so slow hits would hold up the application's own DNS
+    lookups and connections.
+
+    run_in_executor doesn't pass context variables on to the executor's
+    thread, so the function runs in a copy of the caller's context (for the
+    client id and parameters set with ga4py.tracking_context).
     """
-    Function to create the tracker we'll continuously use to record activity
 
-    This is called by send_hit()
+    import asyncio
+    import contextvars
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_async_executor(),
+        functools.partial(contextvars.copy_context().run, function, *args)
+        )
+
+
+def _get_async_executor():
+    global _async_executor
+
+    executor = _async_executor
+    if executor is not None:
+        return executor
+
+    with _async_lock:
+        if _async_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _async_executor = ThreadPoolExecutor(
+                max_workers=ASYNC_TRACKING_THREADS, thread_name_prefix="ga4py-async"
+            )
+        return _async_executor
+
+
+def _after_fork_in_child():
+    # The executor's threads and the lock don't survive a fork
+    global _async_executor, _async_lock
 
-    Parameters: None
+    _async_executor = None
+    _async_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+
+
+
+
+def initialise_tracking(logging_level, require_credentials=True) -> Tuple:
+    """
+    Function to get the tracker we'll continuously use to record activity
+
+    This is called by send_hit(). The tracker is shared by every call in the
+    process (see ga4py/tracker_registry.py) so it is only built once.
+
+    Parameters:
+    - logging_level (string)
+    - require_credentials (bool - optional): [default True] transports which
+                                            don't talk to GA4 (memory, file,
+                                            null) can track without
+                                            GA4_CLI_SEC/GA4_MID set
 
     Returns:
     - gtag_tracker (tracker object)
@@ -230,10 +1006,12 @@ def initialise_tracking(logging_level) -> GtagMP:
     storage_dict: Dict = {}
 
     # Get client secret and measurement id from environment variables
-    api_secret: AnyStr = os.getenv("GA4_CLI_SEC", "None")
-    measurement_id: AnyStr = os.getenv("GA4_MID", "None")
+    # (read once and cached, see ga4py/config.py)
+    env_config = config.get_config()
+    api_secret: AnyStr = env_config.api_secret
+    measurement_id: AnyStr = env_config.measurement_id
 
-    if api_secret == "None" or measurement_id=="None":
+    if require_credentials and (api_secret == "None" or measurement_id=="None"):
         if logging_level in ["error", "all"]:
             print(f"""
     GA4_CLI_SEC: {api_secret}            
@@ -247,22 +1025,17 @@ def initialise_tracking(logging_level) -> GtagMP:
                 """)
         
         # Return showing we can't send hits
-        return GtagMP, False
+        return None, False
 
-    # Create an instance of GA4 object using gtag
-    gtag_tracker: GtagMP = GtagMP(
+    # Use the process-wide tracker for this measurement id (created, with
+    # a random client id, the first time it's needed) - or the tracker for
+    # the client id set with ga4py.tracking_context
+    gtag_tracker = tracker_registry.get_tracker(
         api_secret = api_secret,
-        client_id = "initial",
         measurement_id = measurement_id,
+        client_id = context.current().client_id,
     )
 
-    # Create a random client id
-    # (for now - may come up with a better use for users in future)
-    client_id: AnyStr = gtag_tracker.random_client_id()
-
-    # Overwrite initialising client ID
-    gtag_tracker.client_id = client_id
-
     return gtag_tracker, True
 
 @error_handling.handle_analytics_errors
@@ -275,7 +1048,11 @@ def send_hit(
     gtag_tracker=None,
     testing_mode=False,
     logging_level="all",
-    func_name = "unknown"
+    func_name = "unknown",
+    dispatch_mode = "inline",
+    latency_budget_ms = None,
+    transport = None,
+    library_keys = frozenset()
 ):
     """
     Function to handle sending an analytics hit to GA4
@@ -304,50 +1081,61 @@ def send_hit(
                                         "all" for everything
                                         "" for nothing
 
+    - dispatch_mode (string - optional): [default = inline]
+                                        "inline" sends the hit before returning
+                                        "background" builds the hit and queues it for the
+                                        dispatcher's worker thread to send
+                                        "spool" writes the hit to the spool folder to be sent
+                                        later with "python -m ga4py replay"
+
+    - latency_budget_ms (float - optional): [default = None]
+                                        the longest an inline send can hold up the caller,
+                                        None waits for the send to finish
+
+    - transport (string or Transport - optional): [default = GA4_TRANSPORT]
+                                        where to send the hit - "http", "memory", "file",
+                                        "null" (see ga4py/transports.py)
+
+    - library_keys (set - optional): [default = empty]
+                                        the keys in parameter_dictionary the library added itself,
+                                        kept first if there are too many parameters
+
     """
 
     # Importing needed libraries should be handled by handle_errors 
     # decorator 
 
+    transport = transports.get_transport(transport)
+
     # If the tracker hasn't been created before - create it
     success = True
     if gtag_tracker == None:
-        gtag_tracker, success = initialise_tracking(logging_level)
+        gtag_tracker, success = initialise_tracking(
+            logging_level, 
+            require_credentials=transport.needs_credentials
+            )
 
     if not success:
         return gtag_tracker, success
 
-    dict_to_send = {}
+    # Turn the parameters into GA4 parameter names and values in one pass
+    # (see ga4py/encoding.py for the limits)
+    params, dropped = encoding.encode_parameters(
+        parameter_dictionary, library_keys=library_keys, logging_level=logging_level
+        )
 
     # Check if we've added a silly number of parameters to the tracking hit
-    if len(parameter_dictionary.keys()) > 10:
-        # If we have - send an error
+    # (or ones whose names clash once cleaned up)
+    if dropped:
+        # If we have - send an error (the first parameters are still sent)
         error_handling.send_tracking_error_alert(
-            error="Too many parameters", 
+            error=f"Too many parameters, or names which clash ({dropped} not sent)", 
             function=func_name, 
             parameters=parameter_dictionary
         )
 
-        # And then just take a selection of parameters
-        for key in parameter_dictionary.keys()[:10]:
-            dict_to_send[key] = repr(parameter_dictionary[key])
-            # Make sure is string so doesn't cause errors later
-
-    else:
-        dict_to_send = parameter_dictionary
-
     # Create a new event
-    pageview_event = gtag_tracker.create_new_event(name=event_name)
-
-    # Loop through all of our passed parameters and add them to our
-    # pageview as analytics parameters (as long as they aren't really long)
-    for key, value in parameter_dictionary.items():
-        if len(repr(value)) > 30:
-            value = repr(value)[:30]  # If it's more than 50 char then slice it down
-
-        value = repr(value)
-
-        pageview_event.set_event_param(name=key, value=value)
+    pageview_event = gtag_tracker.create_new_event(name=encoding.encode_name(event_name))
 
     # =======================
     # Handle page location and title
@@ -365,9 +1153,12 @@ def send_hit(
         page_title = page_location.replace("_", " ").replace("-", " ")
 
     # Add default information which we know we want to include
-    pageview_event.set_event_param(name="page_location", value=page_location)
-    pageview_event.set_event_param(name="page_title", value=page_title)
-    pageview_event.set_event_param(name="stage", value=stage)
+    params["page_location"] = encoding.encode_value(page_location, "page_location")
+    params["page_title"] = encoding.encode_value(page_title, "page_title")
+    params["stage"] = encoding.encode_value(stage)
+
+    pageview_event["params"] = params
+    metrics.increment("hits_built", label=stage)
 
     # End of handle page location and title
     # ^^^^^^^^^^^^^^^^^^^^^^^^
@@ -375,7 +1166,48 @@ def send_hit(
     if not testing_mode:
         # Then send the pageview event
         event_list = [pageview_event]  # It expects a list
-        gtag_tracker.send(events=event_list)
+
+        if multiprocess.forward_queue() is not None:
+            # We're a child process of a collector - let the parent send it
+            multiprocess.forward_events(gtag_tracker, event_list, transport)
+        elif dispatch_mode == "background":
+            # Hand off to the worker thread - no network I/O on this thread
+            dispatcher.enqueue_events(
+                gtag_tracker, 
+                event_list, 
+                logging_level=logging_level,
+                transport=transport
+                )
+        elif dispatch_mode == "spool":
+            # Offline - keep the hit on disk to be sent with 
+            # "python -m ga4py replay"
+            spool.spool_events(gtag_tracker, event_list)
+        else:
+            try:
+                delivery.deliver(
+                    gtag_tracker, 
+                    event_list, 
+                    latency_budget_ms=latency_budget_ms,
+                    transport=transport
+                    )
+
+            except error_handling.CircuitOpenError:
+                # GA4 has been failing - don't wait on it, just keep the
+                # hit for replay (if the spool is turned on)
+                spool.keep_unsent(gtag_tracker, event_list, "circuit_open")
+                if logging_level == "all":
+                    print("GA4 circuit breaker open - hit not sent")
+
+            except error_handling.LatencyBudgetExceeded:
+                # The send is still running and may well arrive, so don't
+                # spool it, just report it
+                raise
+
+            except Exception:
+                # Keep the hit so it can be replayed (if the spool is
+                # turned on) then let the error handling report it
+                spool.keep_unsent(gtag_tracker, event_list, "send_failed")
+                raise
     else:
         # If not testing mode then skip sending the hit but still
         # respond with what we were GOING to send so we can check
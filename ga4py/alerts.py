@@ -0,0 +1,295 @@
+"""
+Background channel for tracking error alerts.
+
+send_tracking_error_alert used to POST to GA4_ERROR_API_ENDPOINT straight
+away on the caller's thread, so a slow alert endpoint could hang the main
+code, and one call could trigger several alerts. Now alerts are put on a
+bounded queue and a worker thread sends them as periodic digests:
+
+- alerts which arrive within GA4_ERROR_DIGEST_INTERVAL seconds (default 30)
+  of each other are coalesced into one POST, identical problems are counted
+  rather than repeated
+- each POST has a timeout of GA4_ERROR_TIMEOUT seconds (default 5) and is
+  retried with exponential backoff
+- a circuit breaker stops contacting the endpoint while it keeps failing
+- at most GA4_ERROR_QUEUE_SIZE alerts (default 100) are held, anything more is
+  counted and dropped
+"""
+
+
+import os
+import json
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import ga4py.config as config
+import ga4py.sessions as sessions
+from ga4py.circuit_breaker import CircuitBreaker
+
+
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5 # seconds, doubled after each failed attempt
+
+
+class AlertChannel:
+    """
+    Bounded queue of alerts plus the worker thread which sends them.
+
+    Parameters:
+    - endpoint (string): url to POST digests to
+    - digest_interval (float): seconds to collect alerts before sending
+    - timeout (float): seconds to wait for each POST
+    - max_alerts (int): distinct alerts held before new ones are dropped
+    - breaker (CircuitBreaker - optional)
+    - post (function - optional): [default = the shared session's post]
+    """
+
+    def __init__(
+            self,
+            endpoint: str,
+            digest_interval: float = 30.0,
+            timeout: float = 5.0,
+            max_alerts: int = 100,
+            breaker: Optional[CircuitBreaker] = None,
+            post=None
+            ):
+
+        self.endpoint = endpoint
+        self.digest_interval = digest_interval
+        self.timeout = timeout
+        self.max_alerts = max_alerts
+        self.breaker = breaker or CircuitBreaker(failure_threshold=3, reset_timeout=60.0)
+        self._post = post
+
+        # (error, function) -> {"count", "parameters", "first_seen"}
+        self._alerts: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._first_alert_at: Optional[float] = None
+        self._condition = threading.Condition()
+        self._flush_requested = False
+        self._sending = False
+        self._worker: Optional[threading.Thread] = None
+
+        self.sent_digests = 0
+        self.dropped_alerts = 0
+        self.failed_digests = 0
+
+    def submit(self, error: str, function: str, parameters: str):
+        """
+        Add an alert to the next digest. Never blocks on the network.
+        """
+
+        key = (error, function)
+
+        with self._condition:
+            alert = self._alerts.get(key)
+            if alert is not None:
+                alert["count"] += 1
+                return
+
+            if len(self._alerts) >= self.max_alerts:
+                self.dropped_alerts += 1
+                return
+
+            self._alerts[key] = {
+                "count": 1,
+                "parameters": parameters,
+                "first_seen": time.time(),
+            }
+
+            if self._first_alert_at is None:
+                self._first_alert_at = time.monotonic()
+
+            self._ensure_worker()
+            self._condition.notify()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Send whatever is waiting now rather than at the end of the interval.
+
+        Returns:
+        - done (bool): False if we ran out of time
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._condition:
+            if not self._alerts and not self._sending:
+                return True
+
+            self._flush_requested = True
+            self._ensure_worker()
+            self._condition.notify_all()
+
+            while self._alerts or self._sending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+
+        return True
+
+    def _ensure_worker(self):
+        # Called with the condition held
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._run, name="ga4py-alerts", daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # Wait for the first alert, then for the digest interval
+                # (or a flush) before sending
+                while True:
+                    if self._alerts and (
+                        self._flush_requested
+                        or time.monotonic() - self._first_alert_at >= self.digest_interval
+                    ):
+                        break
+
+                    if self._alerts:
+                        self._condition.wait(
+                            self.digest_interval - (time.monotonic() - self._first_alert_at)
+                        )
+                    else:
+                        self._condition.wait()
+
+                alerts = self._alerts
+                self._alerts = OrderedDict()
+                self._first_alert_at = None
+                self._flush_requested = False
+                self._sending = True
+
+            try:
+                self._deliver(alerts)
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
+
+    def _deliver(self, alerts):
+        """
+        Send one digest, retrying with backoff, unless the breaker is open.
+        """
+
+        if not self.breaker.allow():
+            self.dropped_alerts += sum(alert["count"] for alert in alerts.values())
+            return
+
+        data_json = json.dumps(build_digest(alerts))
+        post = self._post or sessions.get_session().post
+
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                response = post(self.endpoint, data=data_json, timeout=self.timeout)
+                response.raise_for_status()
+
+                self.breaker.record_success()
+                self.sent_digests += 1
+                return
+
+            except Exception:
+                if attempt + 1 < MAX_ATTEMPTS:
+                    time.sleep(BACKOFF_BASE * (2 ** attempt))
+
+        self.breaker.record_failure()
+        self.failed_digests += 1
+
+
+def build_digest(alerts) -> Dict:
+    """
+    Build the subject and (html) body for a digest of alerts.
+
+    Parameters:
+    - alerts (dictionary): (error, function) -> alert details
+
+    Returns:
+    - data (dictionary): {"subject": ..., "body": ...}
+    """
+
+    total = sum(alert["count"] for alert in alerts.values())
+    functions = sorted({function for _, function in alerts})
+
+    if len(alerts) == 1:
+        (error, function), = alerts.keys()
+        subject = f"Error in tracking function: {function!r} "
+        if total > 1:
+            subject += f"({total} times)"
+    else:
+        subject = f"{total} tracking errors in: {', '.join(functions)}"
+
+    sections = []
+    for (error, function), alert in alerts.items():
+        sections.append(f"""
+  Function: {function!r}
+  <br>
+  Error: {error}
+  <br>
+  Count: {alert["count"]}
+  <br>
+  Function parameters: {alert["parameters"]}
+  """)
+
+    body = "<br><br><hr> <br><br>".join(sections)
+
+    return {"subject": subject, "body": body}
+
+
+_channel: Optional[AlertChannel] = None
+_channel_lock = threading.Lock()
+
+
+def get_channel(endpoint: str) -> AlertChannel:
+    """
+    Return the process-wide alert channel for an endpoint, creating it the
+    first time (settings come from the GA4_ERROR_* environment variables,
+    see ga4py/config.py).
+    """
+    global _channel
+
+    channel = _channel
+    if channel is not None and channel.endpoint == endpoint:
+        return channel
+
+    with _channel_lock:
+        if _channel is None or _channel.endpoint != endpoint:
+            env_config = config.get_config()
+            _channel = AlertChannel(
+                endpoint=endpoint,
+                digest_interval=env_config.error_digest_interval,
+                timeout=env_config.error_timeout,
+                max_alerts=env_config.error_queue_size,
+            )
+        return _channel
+
+
+def flush(timeout: Optional[float] = None) -> bool:
+    """
+    Send any waiting alerts now.
+    """
+    channel = _channel
+    if channel is None:
+        return True
+    return channel.flush(timeout)
+
+
+def _flush_at_exit():
+    flush(config.get_config().flush_timeout)
+
+
+def _after_fork_in_child():
+    # The parent's alerts and worker thread stay with the parent
+    global _channel, _channel_lock
+
+    _channel = None
+    _channel_lock = threading.Lock()
+
+
+atexit.register(_flush_at_exit)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
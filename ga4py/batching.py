@@ -0,0 +1,187 @@
+"""
+Batching layer used by the background dispatcher.
+
+The GA4 Measurement Protocol accepts up to 25 events per request, so rather
+than making one POST per hit we collect events per tracker (and transport)
+and send them together when a batch fills up, gets too old, or would go over
+the payload size limit.
+
+Each event is stamped with its own timestamp_micros when it is queued, so
+batching doesn't change when GA4 thinks the event happened.
+"""
+
+
+import json
+import time
+from typing import Callable, Dict, List, Optional
+
+
+# Limits from the GA4 Measurement Protocol documentation
+MAX_EVENTS_PER_REQUEST = 25
+MAX_PAYLOAD_BYTES = 130000
+
+# How long a partially filled batch is held before it is sent anyway
+DEFAULT_MAX_AGE = 1.0
+
+
+class Batch:
+    """
+    A group of events which will be sent in a single request.
+
+    Attributes:
+    - gtag_tracker (tracker object): the tracker the events will be sent with
+    - transport (Transport - or None for the default): where they will be sent
+    - events (list): the events in the batch
+    - size (int): approximate payload size of the events in bytes
+    - created (float): monotonic time the first event was added
+    - items (int): number of queued work items whose events are in this batch
+    - logging_level (string): logging level of the most recent work item
+    """
+
+    __slots__ = ("gtag_tracker", "transport", "events", "size", "created", "items", "logging_level")
+
+    def __init__(self, gtag_tracker, created: float, transport=None):
+        self.gtag_tracker = gtag_tracker
+        self.transport = transport
+        self.events: List[Dict] = []
+        self.size = 0
+        self.created = created
+        self.items = 0
+        self.logging_level = ""
+
+
+class EventBatcher:
+    """
+    Collects events into per-tracker (and per-transport) batches.
+
+    The batcher doesn't send anything itself - add(), due() and drain() hand
+    back the batches which are ready and the caller sends them.
+
+    Parameters:
+    - max_events (int - optional): [default = 25] events per request
+    - max_age (float - optional): [default = 1.0] seconds a batch can wait
+    - max_bytes (int - optional): [default = 130000] approximate payload limit
+    - clock (function - optional): [default = time.monotonic] used for ages
+    """
+
+    def __init__(
+            self,
+            max_events: int = MAX_EVENTS_PER_REQUEST,
+            max_age: float = DEFAULT_MAX_AGE,
+            max_bytes: int = MAX_PAYLOAD_BYTES,
+            clock: Callable[[], float] = time.monotonic
+            ):
+
+        # Never go over what GA4 will accept, even if asked to
+        self.max_events = max(1, min(max_events, MAX_EVENTS_PER_REQUEST))
+        self.max_bytes = max(1, min(max_bytes, MAX_PAYLOAD_BYTES))
+        self.max_age = max_age
+        self._clock = clock
+        self._batches: Dict[tuple, Batch] = {}
+
+    def add(self, gtag_tracker, events: List[Dict], logging_level: str = "", transport=None,
+            size: Optional[int] = None) -> List[Batch]:
+        """
+        Add one work item's events to the batch for its tracker.
+
+        Parameters:
+        - gtag_tracker (tracker object): the tracker the events belong to
+        - events (list): the events to add
+        - logging_level (string - optional): [default = ""]
+        - transport (Transport - optional): [default = None] the default transport
+        - size (int - optional): [default = None] the events' size if it has
+                                    already been measured
+
+        Returns:
+        - ready (list of Batch): batches which are full and should be sent now
+        """
+
+        ready = []
+        key = (id(gtag_tracker), id(transport))
+        if size is None:
+            size = sum(event_size(event) for event in events)
+
+        batch = self._batches.get(key)
+
+        # If these events would push the batch over a limit, send what we
+        # have first and start a new batch
+        if batch is not None and batch.events and (
+            len(batch.events) + len(events) > self.max_events
+            or batch.size + size > self.max_bytes
+        ):
+            ready.append(self._batches.pop(key))
+            batch = None
+
+        if batch is None:
+            batch = Batch(gtag_tracker, self._clock(), transport)
+            self._batches[key] = batch
+
+        batch.events.extend(events)
+        batch.size += size
+        batch.items += 1
+        batch.logging_level = logging_level
+
+        if len(batch.events) >= self.max_events or batch.size >= self.max_bytes:
+            ready.append(self._batches.pop(key))
+
+        return ready
+
+    def due(self) -> List[Batch]:
+        """
+        Remove and return batches which have been waiting longer than max_age.
+        """
+
+        now = self._clock()
+        expired = [
+            key for key, batch in self._batches.items()
+            if now - batch.created >= self.max_age
+        ]
+
+        return [self._batches.pop(key) for key in expired]
+
+    def drain(self) -> List[Batch]:
+        """
+        Remove and return every batch, however full it is.
+        """
+
+        batches = list(self._batches.values())
+        self._batches.clear()
+        return batches
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        Monotonic time at which the oldest batch becomes due, None if empty.
+        """
+
+        if not self._batches:
+            return None
+
+        return min(batch.created for batch in self._batches.values()) + self.max_age
+
+    def __len__(self):
+        return sum(len(batch.events) for batch in self._batches.values())
+
+
+def event_size(event: Dict) -> int:
+    """
+    Approximate number of bytes an event adds to a request payload.
+    """
+
+    try:
+        return len(json.dumps(event, separators=(",", ":"), default=str))
+    except Exception:
+        return len(repr(event))
+
+
+def stamp_events(events: List[Dict]) -> List[Dict]:
+    """
+    Add timestamp_micros to any event which doesn't already have one so the
+    event keeps the time it happened, not the time its batch was sent.
+    """
+
+    now = int(time.time() * 1e6)
+    for event in events:
+        if "timestamp_micros" not in event:
+            event["timestamp_micros"] = now
+
+    return events
@@ -0,0 +1,100 @@
+"""
+A simple circuit breaker, used to stop contacting an endpoint which is
+failing rather than paying for a timeout on every request.
+
+- closed: requests go through as normal
+- open: after failure_threshold consecutive failures, requests are refused
+  until reset_timeout seconds have passed
+- half-open: once reset_timeout has passed a single probe request is allowed,
+  if it succeeds the breaker closes, if it fails the breaker opens again
+"""
+
+
+import threading
+import time
+from typing import Callable
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Parameters:
+    - failure_threshold (int - optional): [default = 3] consecutive failures
+                                            before the breaker opens
+    - reset_timeout (float - optional): [default = 30] seconds to stay open
+                                            before allowing a probe
+    - clock (function - optional): [default = time.monotonic]
+    """
+
+    def __init__(
+            self,
+            failure_threshold: int = 3,
+            reset_timeout: float = 30.0,
+            clock: Callable[[], float] = time.monotonic
+            ):
+
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._check_reset()
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Should a request be attempted now?
+
+        In the half-open state only one caller is allowed through until its
+        result is recorded.
+        """
+
+        with self._lock:
+            self._check_reset()
+
+            if self._state == CLOSED:
+                return True
+
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = self._clock()
+
+    def reset(self):
+        """
+        Close the breaker and forget any failures.
+        """
+        self.record_success()
+
+    def _check_reset(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
@@ -0,0 +1,246 @@
+"""
+Environment configuration for the tracking library.
+
+The environment variables are read once and cached, rather than on every
+tracked call. If you change them while your program is running, call
+reload_config() so the new values are picked up (this also makes every
+decorated function rebuild its tracking plan on its next call).
+"""
+
+
+import os
+import math
+import threading
+from typing import Callable, NamedTuple, Optional, Tuple
+
+
+class TrackingConfig(NamedTuple):
+    """
+    Snapshot of the environment variables the library uses.
+
+    - api_secret (GA4_CLI_SEC): "None" if not set
+    - measurement_id (GA4_MID): "None" if not set
+    - testing_flag (GA4_ANALYTICS_TEST): "TRUE" marks hits as testing hits
+    - dispatch_mode (GA4_DISPATCH_MODE): default dispatch mode for hits
+    - spool_dir (GA4_SPOOL_DIR): folder to spool undeliverable hits to, "" for off
+    - spool_max_bytes (GA4_SPOOL_MAX_BYTES): size at which a spool file is rotated
+    - latency_budget_ms (GA4_LATENCY_BUDGET_MS): default latency budget for
+      inline sends, None for no budget
+    - transport (GA4_TRANSPORT): where hits are sent - "http", "memory",
+      "file" or "null" (see ga4py/transports.py)
+    - transport_file (GA4_TRANSPORT_FILE): file the "file" transport writes to
+    - profile_dir (GA4_PROFILE_DIR): folder to write profiles of profiled
+      calls to, "" to not write them
+    - invocation_ids (GA4_INVOCATION_IDS): "TRUE" adds invocation ids to
+      every hit (see ga4py/context.py)
+    - dedup_window (GA4_DEDUP_WINDOW): default seconds to skip identical
+      hits for, 0 for off (see ga4py/dedup.py)
+    - dedup_max_entries (GA4_DEDUP_MAX_ENTRIES): hit keys the dedup cache keeps
+    - dedup_file (GA4_DEDUP_FILE): file to keep the dedup cache in between
+      runs, "" to only keep it in memory
+    - queue_max_events (GA4_QUEUE_MAX_EVENTS): most events waiting in the
+      background queue, 0 for no limit
+    - queue_max_bytes (GA4_QUEUE_MAX_BYTES): most bytes waiting in the
+      background queue, 0 for no limit
+    - queue_overflow (GA4_QUEUE_OVERFLOW): what to do when the queue is full -
+      "drop_newest", "drop_oldest", "block" or "spill"
+    - queue_block_timeout (GA4_QUEUE_BLOCK_TIMEOUT): seconds the "block"
+      policy waits for room
+    - metrics_file (GA4_METRICS_FILE): file to write the library's metrics
+      to in the Prometheus text format when Python exits, "" for off (see
+      ga4py/metrics.py)
+    - breaker_failures (GA4_BREAKER_FAILURES): consecutive failed sends
+      before a transport's circuit breaker opens (see ga4py/delivery.py)
+    - breaker_reset (GA4_BREAKER_RESET): seconds an open breaker waits
+      before letting a probe send through
+    - error_api_endpoint (GA4_ERROR_API_ENDPOINT): url error alerts are
+      POSTed to, "" for no alerts
+    - error_digest_interval (GA4_ERROR_DIGEST_INTERVAL): seconds of error
+      alerts coalesced into one digest (see ga4py/alerts.py)
+    - error_timeout (GA4_ERROR_TIMEOUT): timeout for each alert POST
+    - error_queue_size (GA4_ERROR_QUEUE_SIZE): most alerts held at once
+    - flush_timeout (GA4_FLUSH_TIMEOUT): seconds queued hits and alerts are
+      given to go out when Python exits
+    - batch_size (GA4_BATCH_SIZE): most events in one background request
+    - batch_max_age (GA4_BATCH_MAX_AGE): seconds a background batch waits
+      before it is sent
+    - batch_max_bytes (GA4_BATCH_MAX_BYTES): approximate payload limit of
+      a background request (see ga4py/batching.py)
+    """
+
+    api_secret: str
+    measurement_id: str
+    testing_flag: str
+    dispatch_mode: str
+    spool_dir: str
+    spool_max_bytes: int
+    latency_budget_ms: Optional[float]
+    transport: str
+    transport_file: str
+    profile_dir: str
+    invocation_ids: bool
+    dedup_window: float
+    dedup_max_entries: int
+    dedup_file: str
+    queue_max_events: int
+    queue_max_bytes: int
+    queue_overflow: str
+    queue_block_timeout: float
+    metrics_file: str
+    breaker_failures: int
+    breaker_reset: float
+    error_api_endpoint: str
+    error_digest_interval: float
+    error_timeout: float
+    error_queue_size: int
+    flush_timeout: float
+    batch_size: int
+    batch_max_age: float
+    batch_max_bytes: int
+
+
+_config: Optional[TrackingConfig] = None
+_generation = 0
+_lock = threading.Lock()
+
+
+def get_config() -> TrackingConfig:
+    """
+    Return the cached configuration, reading the environment the first time.
+    """
+
+    config = _config
+    if config is None:
+        config = reload_config()
+
+    return config
+
+
+def reload_config() -> TrackingConfig:
+    """
+    Re-read the environment variables.
+
+    Any tracking plans compiled from the previous configuration are
+    recompiled the next time their function is called.
+
+    Returns:
+    - config (TrackingConfig): the new configuration
+    """
+    global _config, _generation
+
+    with _lock:
+        _config = TrackingConfig(
+            api_secret=os.getenv("GA4_CLI_SEC", "None"),
+            measurement_id=os.getenv("GA4_MID", "None"),
+            testing_flag=os.getenv("GA4_ANALYTICS_TEST", "FALSE"),
+            dispatch_mode=os.getenv("GA4_DISPATCH_MODE", "inline"),
+            spool_dir=os.getenv("GA4_SPOOL_DIR", ""),
+            spool_max_bytes=_int_from_env("GA4_SPOOL_MAX_BYTES", 10_000_000),
+            latency_budget_ms=_float_from_env("GA4_LATENCY_BUDGET_MS", None),
+            transport=os.getenv("GA4_TRANSPORT", "") or "http",
+            transport_file=os.getenv("GA4_TRANSPORT_FILE", "") or "ga4py-events.ndjson",
+            profile_dir=os.getenv("GA4_PROFILE_DIR", ""),
+            invocation_ids=os.getenv("GA4_INVOCATION_IDS", "FALSE").upper() == "TRUE",
+            dedup_window=_float_from_env("GA4_DEDUP_WINDOW", 0.0),
+            dedup_max_entries=_int_from_env("GA4_DEDUP_MAX_ENTRIES", 10000),
+            dedup_file=os.getenv("GA4_DEDUP_FILE", ""),
+            queue_max_events=_int_from_env("GA4_QUEUE_MAX_EVENTS", 10000),
+            queue_max_bytes=_int_from_env("GA4_QUEUE_MAX_BYTES", 0),
+            queue_overflow=os.getenv("GA4_QUEUE_OVERFLOW", "") or "drop_newest",
+            queue_block_timeout=_float_from_env("GA4_QUEUE_BLOCK_TIMEOUT", 0.1),
+            metrics_file=os.getenv("GA4_METRICS_FILE", ""),
+            breaker_failures=_int_from_env("GA4_BREAKER_FAILURES", 5),
+            breaker_reset=_float_from_env("GA4_BREAKER_RESET", 30.0),
+            error_api_endpoint=os.getenv("GA4_ERROR_API_ENDPOINT", ""),
+            error_digest_interval=_float_from_env("GA4_ERROR_DIGEST_INTERVAL", 30.0),
+            error_timeout=_float_from_env("GA4_ERROR_TIMEOUT", 5.0),
+            error_queue_size=_int_from_env("GA4_ERROR_QUEUE_SIZE", 100),
+            flush_timeout=_float_from_env("GA4_FLUSH_TIMEOUT", 5.0),
+            batch_size=_int_from_env("GA4_BATCH_SIZE", 25),
+            batch_max_age=_float_from_env("GA4_BATCH_MAX_AGE", 1.0),
+            batch_max_bytes=_int_from_env("GA4_BATCH_MAX_BYTES", 130000),
+        )
+        _generation += 1
+
+        return _config
+
+
+def generation() -> int:
+    """
+    Counter which goes up every time the configuration is reloaded, used by
+    tracking plans to know when they are out of date.
+    """
+    return _generation
+
+
+def _int_from_env(name: str, default: int) -> int:
+    """
+    Read an integer environment variable, falling back to the default if it
+    isn't set or isn't a number.
+    """
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _float_from_env(name: str, default: Optional[float]) -> Optional[float]:
+    """
+    Read a number from an environment variable, falling back to the default
+    if it isn't set or isn't a number.
+    """
+    value = os.getenv(name, "")
+    try:
+        return float(value) if value != "" else default
+    except ValueError:
+        return default
+
+
+def checked_number(
+        value,
+        default,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None,
+        convert: Callable = float
+        ) -> Tuple:
+    """
+    Turn a tracking argument into a number, so a bad value given to the
+    decorator (or in ga4py_args) never raises into the tracked code.
+
+    Parameters:
+    - value: the value given, None if it wasn't given
+    - default: what to use if the value is None or can't be used
+    - minimum / maximum (optional): [default None] values outside the range
+                                    are moved to the nearest end of it
+    - convert (function - optional): [default float] float or int
+
+    Returns:
+    - number: the converted (and clamped) value, or the default
+    - valid (bool): False if a value was given but couldn't be used
+    """
+
+    if value is None:
+        return default, True
+
+    try:
+        number = convert(value)
+        if not math.isfinite(number):
+            return default, False
+    except (TypeError, ValueError, OverflowError):
+        return default, False
+
+    if minimum is not None and number < minimum:
+        number = convert(minimum)
+    if maximum is not None and number > maximum:
+        number = convert(maximum)
+
+    return number, True
+
+
+def _after_fork_in_child():
+    global _lock
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,206 @@
+"""
+Invocation context - which user, request and call a hit belongs to.
+
+The context is held in a context variable, so each thread and each asyncio
+task has its own and many threads can track at once without sharing any
+state. It holds:
+
+- client_id: the GA4 client id to send hits with (None for the process-wide
+  random one)
+- invocation_id: the id of the tracked call we're in
+- parent_invocation_id: the id of the tracked call that one was called from
+- parent_span: the ga4py.span() the tracked call was started inside
+- params: extra parameters added to every hit sent inside the context
+
+A web app can set the client id and parameters once per request:
+
+    with ga4py.tracking_context(client_id=request.cookies["ga_client"], route="/report"):
+        handle_request()
+
+Every tracked call starts a new invocation inside the current context, so
+nested tracked calls know which call they were made from. asyncio tasks
+copy the context when they're created. Threads and thread pools don't, so
+use ga4py.context.wrap(function) (or ga4py.context.submit(executor, ...))
+to run work in another thread with the caller's context.
+
+The ids are only sent as hit parameters ("invocation_id",
+"parent_invocation_id" and "parent_span") if {invocation_ids: True} is in the
+decorator arguments or GA4_INVOCATION_IDS is "TRUE" - each one uses up one
+of the event's 25 parameters.
+"""
+
+
+import os
+import functools
+import itertools
+import contextvars
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, NamedTuple, Optional
+
+import ga4py.spans as spans
+
+
+class TrackingContext(NamedTuple):
+    """
+    Immutable snapshot of the invocation context - a new one is set for each
+    tracked call or tracking_context block, nothing is ever changed in place.
+    """
+
+    client_id: Optional[str] = None
+    invocation_id: Optional[str] = None
+    parent_invocation_id: Optional[str] = None
+    parent_span: Optional[str] = None
+    params: Mapping = MappingProxyType({})
+
+    def parameters(self, invocation_ids: bool = False) -> Dict:
+        """
+        The parameters to add to hits sent in this context.
+
+        Parameters:
+        - invocation_ids (bool - optional): [default False] include the
+                                            invocation ids and parent span
+        """
+
+        parameters = dict(self.params)
+
+        if invocation_ids:
+            if self.invocation_id is not None:
+                parameters["invocation_id"] = self.invocation_id
+            if self.parent_invocation_id is not None:
+                parameters["parent_invocation_id"] = self.parent_invocation_id
+            if self.parent_span is not None:
+                parameters["parent_span"] = self.parent_span
+
+        return parameters
+
+
+EMPTY_CONTEXT = TrackingContext()
+
+_context: contextvars.ContextVar = contextvars.ContextVar("ga4py_context", default=EMPTY_CONTEXT)
+
+# Invocation ids are a random per-process prefix and a counter - next() on an
+# itertools.count is atomic, so threads never wait on each other for an id
+_prefix = os.urandom(4).hex()
+_counter = itertools.count(1)
+
+
+def current() -> TrackingContext:
+    """
+    The context for the code that is running now.
+    """
+    return _context.get()
+
+
+def new_invocation() -> TrackingContext:
+    """
+    Context for a tracked call starting now (used by the decorator). It
+    keeps the current client id and parameters, gets a new invocation id,
+    and records the current invocation and span as its parents.
+    """
+
+    parent = _context.get()
+    span = spans.current_span()
+
+    return parent._replace(
+        invocation_id=f"{_prefix}-{next(_counter):x}",
+        parent_invocation_id=parent.invocation_id,
+        parent_span=span.path if span is not None else None,
+    )
+
+
+def activate(tracking_context: TrackingContext):
+    """
+    Make a context current.
+
+    Returns:
+    - token: pass to restore
+    """
+    return _context.set(tracking_context)
+
+
+def restore(token):
+    """
+    Go back to the context that was current before activate.
+    """
+    _context.reset(token)
+
+
+class tracking_context:
+    """
+    Set the client id and/or extra hit parameters for tracked calls inside a
+    with (or async with) block. Blocks can be nested - inner parameters are
+    added to (and override) outer ones.
+
+    Parameters:
+    - client_id (string - optional): GA4 client id for hits in the block
+    - **params: parameters to add to every hit in the block
+    """
+
+    __slots__ = ("client_id", "params", "_token")
+
+    def __init__(self, client_id: Optional[str] = None, **params):
+        self.client_id = client_id
+        self.params = params
+        self._token = None
+
+    def __enter__(self) -> TrackingContext:
+        parent = _context.get()
+        entered = parent._replace(
+            client_id=self.client_id if self.client_id is not None else parent.client_id,
+            params=MappingProxyType({**parent.params, **self.params}) if self.params else parent.params,
+        )
+        self._token = _context.set(entered)
+        return entered
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _context.reset(self._token)
+        self._token = None
+        return False
+
+    async def __aenter__(self) -> TrackingContext:
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return self.__exit__(exc_type, exc_value, traceback)
+
+
+def wrap(function: Callable) -> Callable:
+    """
+    Bind a function to the current context, so it sees the same client id,
+    parameters and parent invocation when it runs in another thread.
+
+        threading.Thread(target=ga4py.context.wrap(work)).start()
+
+    Each call runs in its own copy of the context, so the wrapped function
+    can be called from several threads at once.
+    """
+
+    captured = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def run_in_context(*args, **kwargs):
+        return captured.copy().run(function, *args, **kwargs)
+
+    return run_in_context
+
+
+def submit(executor, function: Callable, *args, **kwargs):
+    """
+    executor.submit(function, *args, **kwargs), running the function with
+    the caller's context.
+
+    Returns:
+    - future
+    """
+    return executor.submit(wrap(function), *args, **kwargs)
+
+
+def _after_fork_in_child():
+    # A forked child gets its own invocation ids
+    global _prefix, _counter
+    _prefix = os.urandom(4).hex()
+    _counter = itertools.count(1)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
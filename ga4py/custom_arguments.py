@@ -16,6 +16,22 @@ class MeasurementArguments(TypedDict, total=False):
     page_title: Optional[str]
     event_name: Optional[str]
     testing_mode: Optional[bool]
+    dispatch_mode: Optional[str]
+    latency_budget_ms: Optional[float]
+    transport: Optional[str] # or a ga4py.transports.Transport
+    sample_rate: Optional[float]
+    rate_limit: Optional[float]
+    rate_limit_burst: Optional[float]
+    adaptive_sample_target: Optional[float]
+    slow_threshold_ms: Optional[float]
+    summary_mode: Optional[bool]
+    summary_interval: Optional[float]
+    profile_rate: Optional[float]
+    profile_top: Optional[int]
+    profile_dir: Optional[str]
+    invocation_ids: Optional[bool]
+    dedup_window: Optional[float]
+    dedup_params: Optional[list]
 
 # Example usage
 my_dict: MeasurementArguments = {
@@ -0,0 +1,300 @@
+"""
+Deduplication of repeated hits.
+
+Apps like Streamlit rerun the tracked function every time the user touches
+the page, so the same "start" hit is sent over and over. With
+{dedup_window: 300} in the decorator arguments (or GA4_DEDUP_WINDOW) a hit
+is only sent if an identical hit hasn't been sent in the last 300 seconds.
+
+Hits are identical if they have the same:
+
+- function name, stage and page_location
+- client id (so each user session set with ga4py.tracking_context is
+  deduplicated separately)
+- tracking parameters - all of the decorator/ga4py_args parameters, or only
+  the ones named in {dedup_params: ["tool", "report"]}. Per-call values such
+  as durations are never part of the key.
+
+The next hit with that key which *is* sent carries "dedup_suppressed", the
+number of identical hits which were skipped since the last one, so the real
+number of calls can still be worked out.
+
+The cache keeps at most GA4_DEDUP_MAX_ENTRIES keys (default 10000), oldest
+first out, and drops keys whose window is over - the skipped count of a
+dropped key is kept (for up to as many keys again) and added to the next hit
+with that key. A count which is pushed out of that too is lost from the hits,
+though the skipped hits are still counted in hits_deduplicated. If
+GA4_DEDUP_FILE is
+set the cache is loaded from that file on first use and saved when Python
+exits, so short runs of the same script (e.g. a CLI tool run from cron) are
+deduplicated across runs too.
+
+Summary hits are never deduplicated.
+"""
+
+
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, Mapping, Optional
+
+import ga4py.config as config
+import ga4py.context as context
+
+
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def dedup_key(func_name: str, page_location, parameter_dictionary: Mapping,
+              dedup_params: Optional[Iterable[str]] = None) -> str:
+    """
+    The part of a hit's dedup key which is the same for every call with the
+    same plan (worked out when the plan is compiled).
+
+    Parameters:
+    - func_name (string)
+    - page_location (string or None)
+    - parameter_dictionary (dictionary): the plan's tracking parameters
+    - dedup_params (list of strings - optional): [default None] only use
+                                                these parameters, None uses all
+
+    Returns:
+    - key (string): a short hash
+    """
+
+    if dedup_params is not None:
+        parameters = sorted(
+            (name, _key_text(parameter_dictionary.get(name))) for name in dedup_params
+        )
+    else:
+        parameters = sorted(
+            (str(name), _key_text(value)) for name, value in parameter_dictionary.items()
+        )
+
+    text = repr((func_name, _key_text(page_location), parameters))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _key_text(value) -> str:
+    try:
+        return repr(value)
+    except Exception:
+        # Values whose repr raises still give a stable key
+        return f"<{type(value).__qualname__}>"
+
+
+class DedupCache:
+    """
+    Keys of recently sent hits, with how many duplicates have been skipped.
+
+    Parameters:
+    - max_entries (int - optional): [default 10000] keys to remember
+    - path (string - optional): [default None] file to load from and save to
+    - clock (function - optional): [default = time.time] wall clock, so
+                                    saved expiry times mean the same thing
+                                    in the next process
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, path: Optional[str] = None,
+                 clock: Callable[[], float] = time.time):
+        self.max_entries = max(1, max_entries)
+        self.path = path
+        self._clock = clock
+        # key -> [expires_at, suppressed], oldest first
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        # key -> skipped hits, for keys pushed out before they were sent
+        # again, oldest first
+        self._evicted: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        if path:
+            self.load()
+
+    def check(self, key: str, window: float) -> Optional[int]:
+        """
+        Decide whether a hit should be sent.
+
+        Returns:
+        - suppressed (int or None): None if the hit is a duplicate and should
+                                    be skipped, otherwise the number of
+                                    duplicates skipped since the last one sent
+        """
+
+        now = self._clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] > now:
+                entry[1] += 1
+                return None
+
+            suppressed = entry[1] if entry is not None else 0
+            if self._evicted:
+                suppressed += self._evicted.pop(key, 0)
+
+            self._entries[key] = [now + window, 0]
+            self._entries.move_to_end(key)
+            self._evict(now)
+
+            return suppressed
+
+    def _evict(self, now: float):
+        entries = self._entries
+
+        # Expired keys at the front can go (keys with long windows can keep
+        # shorter ones behind them for a while, the size limit still holds)
+        while entries:
+            key, (expires_at, suppressed) = next(iter(entries.items()))
+            if expires_at > now and len(entries) <= self.max_entries:
+                break
+            del entries[key]
+            if suppressed:
+                self._keep_evicted(key, suppressed)
+
+    def _keep_evicted(self, key: str, suppressed: int):
+        evicted = self._evicted
+
+        evicted[key] = evicted.get(key, 0) + suppressed
+        evicted.move_to_end(key)
+        while len(evicted) > self.max_entries:
+            evicted.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """
+        Add the unexpired keys saved in the cache file. A missing, unreadable
+        or malformed file is treated as an empty cache.
+        """
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                saved = json.load(file)
+
+            entries = {
+                str(key): [float(expires_at), int(suppressed)]
+                for key, (expires_at, suppressed) in saved.get("entries", {}).items()
+            }
+            evicted = {
+                str(key): int(suppressed)
+                for key, suppressed in saved.get("evicted", {}).items()
+            }
+
+        except Exception:
+            return
+
+        now = self._clock()
+
+        with self._lock:
+            for key, entry in entries.items():
+                if entry[0] > now and key not in self._entries:
+                    self._entries[key] = entry
+            for key, suppressed in evicted.items():
+                if suppressed > 0:
+                    self._keep_evicted(key, suppressed)
+            self._evict(now)
+
+    def save(self):
+        """
+        Write the unexpired keys to the cache file (replacing it in one step
+        so a crash can't leave half a file).
+        """
+
+        if not self.path:
+            return
+
+        now = self._clock()
+
+        with self._lock:
+            saved = {
+                "entries": {
+                    key: entry for key, entry in self._entries.items() if entry[0] > now
+                },
+                "evicted": dict(self._evicted),
+            }
+
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(saved, file, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+
+
+_cache: Optional[DedupCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> DedupCache:
+    """
+    The process-wide cache, created (and loaded from GA4_DEDUP_FILE) the
+    first time it is needed.
+    """
+    global _cache
+
+    cache = _cache
+    if cache is not None:
+        return cache
+
+    with _cache_lock:
+        if _cache is None:
+            env_config = config.get_config()
+            _cache = DedupCache(
+                max_entries=env_config.dedup_max_entries,
+                path=env_config.dedup_file or None,
+            )
+        return _cache
+
+
+def check(plan, stage: str) -> Optional[int]:
+    """
+    Decide whether this stage's hit for a call with this plan should be sent.
+
+    Returns:
+    - suppressed (int or None): None to skip the hit, otherwise the number of
+                                duplicates skipped since the last one sent
+    """
+
+    key = f"{plan.dedup_key}:{stage}:{context.current().client_id}"
+    return get_cache().check(key, plan.dedup_window)
+
+
+def reset_cache():
+    """
+    Forget the process-wide cache (a new one is created on next use).
+    """
+    global _cache
+
+    with _cache_lock:
+        _cache = None
+
+
+def _save_at_exit():
+    cache = _cache
+    if cache is not None:
+        try:
+            cache.save()
+        except Exception:
+            pass
+
+
+def _after_fork_in_child():
+    global _cache_lock
+    _cache_lock = threading.Lock()
+
+    if _cache is not None:
+        _cache._lock = threading.Lock()
+
+
+atexit.register(_save_at_exit)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,203 @@
+"""
+Guarded delivery of events to GA4.
+
+Every send to GA4 (inline or from the background dispatcher) goes through
+deliver(), which hands the events to a transport (see ga4py/transports.py)
+and adds:
+
+- a circuit breaker for each transport: after GA4_BREAKER_FAILURES
+  consecutive failures or timeouts (default 5) sends through that
+  transport are refused straight away for GA4_BREAKER_RESET seconds
+  (default 30), then a single probe request is let through to see whether
+  it has recovered. A failing GA4 endpoint doesn't stop hits going to a
+  "file" or "memory" transport, and the other way round
+- an optional latency budget: with latency_budget_ms set, an inline send is
+  run on a small thread pool and the caller waits at most that long for it,
+  so the time tracking can add to a call has a known upper bound
+"""
+
+
+import os
+import weakref
+import threading
+from typing import Dict, List, Optional
+
+import ga4py.config as config
+import ga4py.error_handling as error_handling
+import ga4py.transports as transports
+from ga4py.circuit_breaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+
+
+SEND_THREADS = 4
+
+# Breaker states, least to most severe
+_SEVERITY = (CLOSED, HALF_OPEN, OPEN)
+
+# Transport -> its circuit breaker
+_breakers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_executor = None # ThreadPoolExecutor, created when a latency budget is first used
+_lock = threading.Lock()
+
+
+def get_breaker(transport=None) -> CircuitBreaker:
+    """
+    Return the circuit breaker around sends through a transport, creating
+    it the first time.
+
+    Parameters:
+    - transport (string or Transport - optional): [default GA4_TRANSPORT]
+    """
+
+    transport = transports.get_transport(transport)
+
+    breaker = _breakers.get(transport)
+    if breaker is not None:
+        return breaker
+
+    with _lock:
+        breaker = _breakers.get(transport)
+        if breaker is None:
+            env_config = config.get_config()
+            breaker = _breakers[transport] = CircuitBreaker(
+                failure_threshold=env_config.breaker_failures,
+                reset_timeout=env_config.breaker_reset,
+            )
+        return breaker
+
+
+def breaker_states() -> Dict[str, str]:
+    """
+    The state of each transport's circuit breaker, by transport name (the
+    worst state if several transports share a name).
+
+    Returns:
+    - states (dictionary): transport name -> "closed", "open" or "half_open"
+    """
+
+    with _lock:
+        breakers = [(transport.name, breaker) for transport, breaker in _breakers.items()]
+
+    states: Dict[str, str] = {}
+    for name, breaker in breakers:
+        states[name] = max(breaker.state, states.get(name, CLOSED), key=_SEVERITY.index)
+
+    return states
+
+
+def deliver(
+        gtag_tracker,
+        events: List[Dict],
+        latency_budget_ms: Optional[float] = None,
+        transport=None
+        ):
+    """
+    Send events to GA4 through the circuit breaker.
+
+    Parameters:
+    - gtag_tracker (tracker object): tracker to send the events with
+    - events (list): the events to send
+    - latency_budget_ms (float - optional): [default None] the longest the
+                                            caller will wait for the send
+    - transport (string or Transport - optional): [default GA4_TRANSPORT]
+
+    Raises:
+    - error_handling.CircuitOpenError if GA4 has been failing and this send
+        wasn't attempted
+    - error_handling.LatencyBudgetExceeded if the send didn't finish within
+        the budget (it carries on in the background)
+    - whatever the send itself raised
+    """
+
+    transport = transports.get_transport(transport)
+    breaker = get_breaker(transport)
+
+    if not breaker.allow():
+        raise error_handling.CircuitOpenError(
+            f"{transport.name} circuit breaker is open - hit not sent"
+        )
+
+    outcome = _Outcome(breaker)
+
+    if latency_budget_ms is None:
+        _send(outcome, transport, gtag_tracker, events)
+        return
+
+    from concurrent.futures import TimeoutError as FutureTimeoutError
+
+    future = _get_executor().submit(_send, outcome, transport, gtag_tracker, events)
+
+    try:
+        future.result(timeout=latency_budget_ms / 1000)
+
+    except FutureTimeoutError:
+        # Count the timeout straight away - the send carries on in the
+        # background but its own result is no longer recorded
+        outcome.record(success=False)
+        raise error_handling.LatencyBudgetExceeded(
+            f"GA4 send took longer than {latency_budget_ms}ms"
+        )
+
+
+class _Outcome:
+    """
+    Records exactly one result per send on the breaker - whichever comes
+    first of the send finishing and its latency budget running out.
+    """
+
+    __slots__ = ("_breaker", "_lock", "_recorded")
+
+    def __init__(self, breaker: CircuitBreaker):
+        self._breaker = breaker
+        self._lock = threading.Lock()
+        self._recorded = False
+
+    def record(self, success: bool):
+        with self._lock:
+            if self._recorded:
+                return
+            self._recorded = True
+
+        if success:
+            self._breaker.record_success()
+        else:
+            self._breaker.record_failure()
+
+
+def _send(outcome: _Outcome, transport, gtag_tracker, events: List[Dict]):
+    try:
+        transport.send(gtag_tracker, events)
+    except Exception:
+        outcome.record(success=False)
+        raise
+
+    outcome.record(success=True)
+
+
+def _get_executor():
+    global _executor
+
+    executor = _executor
+    if executor is not None:
+        return executor
+
+    with _lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _executor = ThreadPoolExecutor(
+                max_workers=SEND_THREADS, thread_name_prefix="ga4py-send"
+            )
+        return _executor
+
+
+def _after_fork_in_child():
+    # The executor's threads and the lock don't survive a fork
+    global _breakers, _executor, _lock
+
+    _breakers = weakref.WeakKeyDictionary()
+    _executor = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
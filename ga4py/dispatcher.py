@@ -0,0 +1,544 @@
+"""
+Background dispatcher for analytics hits.
+
+When the "background" dispatch mode is used, send_hit only builds the event
+and hands it to this module. A single daemon worker thread then does the
+network I/O so the tracked function never has to wait on GA4.
+
+The worker groups events into multi-event requests using the batching layer
+(see ga4py/batching.py). Batch limits can be set with GA4_BATCH_SIZE (events,
+default and maximum 25), GA4_BATCH_MAX_AGE (seconds, default 1) and
+GA4_BATCH_MAX_BYTES (default and maximum 130000).
+
+Anything still queued when the interpreter exits is flushed by an atexit
+handler, which waits at most GA4_FLUSH_TIMEOUT seconds (default 5) so short
+CLI runs don't lose their "end" hits but also can't hang on a slow endpoint.
+
+Many threads can queue hits at once without waiting on each other, and the
+queue is bounded so a GA4 outage can't use up the process's memory: it holds
+at most GA4_QUEUE_MAX_EVENTS events (default 10000, 0 for no limit) and
+GA4_QUEUE_MAX_BYTES bytes (default 0 - no limit). GA4_QUEUE_OVERFLOW picks
+what happens to hits which don't fit - "drop_newest" (the default),
+"drop_oldest", "block" (wait up to GA4_QUEUE_BLOCK_TIMEOUT seconds, default
+0.1) or "spill" (write them to the spool). Dropped events are counted by
+reason, see dropped_events(). See Handoff below for the details.
+"""
+
+
+import os
+import atexit
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import ga4py.config as config
+import ga4py.error_handling as error_handling
+import ga4py.spool as spool
+import ga4py.delivery as delivery
+import ga4py.transports as transports
+from ga4py.batching import EventBatcher, Batch, event_size, stamp_events
+
+
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest", "block", "spill")
+
+DEFAULT_MAX_EVENTS = 10000
+DEFAULT_BLOCK_TIMEOUT = 0.1
+
+
+class Handoff:
+    """
+    Bounded queue from any number of tracking threads to the one worker
+    thread.
+
+    queue.Queue takes a lock and wakes the worker on every put, so busy
+    threads all queue up on that lock. Here a put is a deque append plus a
+    very short lock to keep count of the queued events and bytes, and the
+    worker is only woken if it's asleep. Only the worker takes items off.
+
+    When an item would take the queue over max_events (or max_bytes) the
+    overflow policy decides what happens:
+
+    - "drop_newest": the new item isn't queued
+    - "drop_oldest": the oldest queued items are thrown away to make room
+    - "block": the caller waits up to block_timeout seconds for room, then
+      the new item is dropped
+    - "spill": put() tells the caller to write the item somewhere else
+      (the dispatcher writes it to the spool)
+
+    0 for max_events or max_bytes means no limit.
+    """
+
+    def __init__(self, max_events: int = 0, max_bytes: int = 0,
+                 overflow: str = "drop_newest", block_timeout: float = DEFAULT_BLOCK_TIMEOUT):
+        # (item, events, bytes) for each queued item
+        self._items = deque()
+        self._wakeup = threading.Event()
+        self._idle = False
+        # Items the worker has taken but not finished with - only the
+        # worker changes this
+        self._in_progress = 0
+        self._all_done = threading.Condition(threading.Lock())
+
+        self.configure(max_events, max_bytes, overflow, block_timeout)
+
+        # Queued events and bytes, and callers waiting for room
+        self._size_lock = threading.Lock()
+        self._space = threading.Condition(self._size_lock)
+        self._space_waiters = 0
+        self.events = 0
+        self.bytes = 0
+
+        # Events dropped, by reason, and events spilled to disk
+        self.dropped: Dict[str, int] = {}
+        self.spilled = 0
+
+    def configure(self, max_events: int, max_bytes: int, overflow: str, block_timeout: float):
+        self.max_events = max(0, max_events)
+        self.max_bytes = max(0, max_bytes)
+        self.overflow = overflow if overflow in OVERFLOW_POLICIES else "drop_newest"
+        self.block_timeout = max(0.0, block_timeout)
+
+    def put(self, item, events: int = 0, size: int = 0) -> Optional[str]:
+        """
+        Queue an item (markers with no events are never refused).
+
+        Parameters:
+        - item: the work item
+        - events (int - optional): number of events in the item
+        - size (int - optional): approximate bytes in the item (only needed
+                                    if max_bytes is set)
+
+        Returns:
+        - overflow (string or None): None if the item was queued, "spill" if
+                                    it should be written to disk instead,
+                                    otherwise the reason it was dropped
+        """
+
+        if events:
+            with self._size_lock:
+                if self._full(events, size):
+                    overflow = self._make_room(events, size)
+                    if overflow is not None:
+                        if overflow != "spill":
+                            self._record_drop(overflow, events)
+                        return overflow
+
+                self.events += events
+                self.bytes += size
+
+        self._items.append((item, events, size))
+        if self._idle:
+            self._wakeup.set()
+
+        return None
+
+    def _full(self, events: int, size: int) -> bool:
+        # An item is always let into an empty queue, however big it is
+        return self.events > 0 and (
+            (self.max_events and self.events + events > self.max_events)
+            or (self.max_bytes and self.bytes + size > self.max_bytes)
+        )
+
+    def _make_room(self, events: int, size: int) -> Optional[str]:
+        """
+        Apply the overflow policy (called with _size_lock held).
+
+        Returns:
+        - overflow (string or None): None if there's room now
+        """
+
+        if self.overflow == "drop_oldest":
+            while self._full(events, size):
+                try:
+                    oldest = self._items.popleft()
+                except IndexError:
+                    # The worker took everything in the meantime
+                    return None
+
+                if not oldest[1]:
+                    # Never throw away a flush marker - drop the new item instead
+                    self._items.appendleft(oldest)
+                    return "drop_newest"
+
+                self.events -= oldest[1]
+                self.bytes -= oldest[2]
+                self._record_drop("drop_oldest", oldest[1])
+
+            return None
+
+        if self.overflow == "block":
+            deadline = time.monotonic() + self.block_timeout
+            self._space_waiters += 1
+            try:
+                while self._full(events, size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return "block_timeout"
+                    self._space.wait(remaining)
+            finally:
+                self._space_waiters -= 1
+
+            return None
+
+        if self.overflow == "spill":
+            return "spill"
+
+        return "drop_newest"
+
+    def _record_drop(self, reason: str, events: int):
+        # Called with _size_lock held
+        self.dropped[reason] = self.dropped.get(reason, 0) + events
+
+    def count_dropped(self, reason: str, events: int):
+        """
+        Count events dropped for a reason outside the queue (e.g. a spill
+        which couldn't be written).
+        """
+        with self._size_lock:
+            self._record_drop(reason, events)
+
+    def count_spilled(self, events: int):
+        with self._size_lock:
+            self.spilled += events
+
+    def get(self, timeout: Optional[float] = None):
+        """
+        Take the oldest item (worker thread only).
+
+        Raises:
+        - IndexError: nothing arrived within the timeout
+        """
+
+        while True:
+            self._in_progress += 1
+            try:
+                item, events, size = self._items.popleft()
+            except IndexError:
+                self._in_progress -= 1
+            else:
+                if events:
+                    with self._size_lock:
+                        self.events -= events
+                        self.bytes -= size
+                        if self._space_waiters:
+                            self._space.notify_all()
+                return item
+
+            # Say we're going to sleep before checking one last time, so a
+            # put either lands before the check or sees _idle and wakes us
+            self._wakeup.clear()
+            self._idle = True
+            try:
+                if not self._items and not self._wakeup.wait(timeout):
+                    raise IndexError("nothing queued")
+            finally:
+                self._idle = False
+
+    def task_done(self, count: int = 1):
+        """
+        Mark items taken with get() as finished (worker thread only).
+        """
+
+        self._in_progress -= count
+        if not self.unfinished():
+            with self._all_done:
+                self._all_done.notify_all()
+
+    def unfinished(self) -> int:
+        """
+        Items queued or being sent.
+        """
+        return len(self._items) + self._in_progress
+
+    def wait(self, deadline: Optional[float]) -> bool:
+        """
+        Wait until nothing is queued or being sent.
+
+        Returns:
+        - done (bool): False if the deadline (time.monotonic) passed first
+        """
+
+        with self._all_done:
+            while self.unfinished():
+                if deadline is None:
+                    self._all_done.wait()
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._all_done.wait(remaining)
+
+        return True
+
+
+# Work items are (gtag_tracker, events, logging_level, transport, size) tuples,
+# or the _FLUSH marker which tells the worker to send every partial batch now
+_queue = Handoff()
+_FLUSH = object()
+
+# Config generation the queue limits were last read from
+_limits_generation = -1
+
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def enqueue_events(gtag_tracker, events, logging_level="", transport=None):
+    """
+    Put events on the background queue to be sent by the worker thread.
+
+    This never blocks on the network - it just makes sure the worker is
+    running and queues the work. If the queue is full (GA4_QUEUE_MAX_EVENTS
+    or GA4_QUEUE_MAX_BYTES) the GA4_QUEUE_OVERFLOW policy is applied - see
+    Handoff - and the events may be dropped, waited for or spooled.
+
+    Parameters:
+    - gtag_tracker (tracker object): the tracker to send the events with
+    - events (list): the events to send (as they would be passed to GtagMP.send)
+    - logging_level (string - optional): [default = ""] how much we should print
+    - transport (string or Transport - optional): [default = GA4_TRANSPORT]
+
+    Returns:
+    - None
+    """
+
+    _ensure_worker()
+    _apply_limits()
+
+    # Stamp events now so they keep their real time while waiting in a batch
+    events = stamp_events(events)
+
+    # Only measured when there's a byte limit (the batcher measures it
+    # otherwise)
+    size = sum(event_size(event) for event in events) if _queue.max_bytes else None
+
+    overflow = _queue.put(
+        (gtag_tracker, events, logging_level, transports.get_transport(transport), size),
+        events=len(events),
+        size=size or 0,
+        )
+
+    if overflow is None:
+        return
+
+    if overflow == "spill":
+        # Keep the events on disk to be sent with "python -m ga4py replay"
+        if spool.spool_events(gtag_tracker, events):
+            _queue.count_spilled(len(events))
+            return
+
+        _queue.count_dropped("spill_failed", len(events))
+        overflow = "spill_failed"
+
+    if logging_level in ["error", "all"]:
+        print(f"Tracking queue full - {len(events)} event(s) dropped ({overflow})")
+
+
+def dropped_events() -> Dict[str, int]:
+    """
+    Events dropped because the background queue was full, by reason:
+    "drop_newest", "drop_oldest", "block_timeout" or "spill_failed".
+    """
+
+    with _queue._size_lock:
+        return dict(_queue.dropped)
+
+
+def spilled_events() -> int:
+    """
+    Events written to the spool because the background queue was full.
+    """
+    return _queue.spilled
+
+
+def queued() -> Dict[str, int]:
+    """
+    Events and (approximate) bytes waiting in the background queue - bytes
+    are only counted when GA4_QUEUE_MAX_BYTES is set.
+    """
+    return {"events": _queue.events, "bytes": _queue.bytes}
+
+
+def _apply_limits():
+    """
+    Give the queue the limits from the environment config (again, if it has
+    been reloaded).
+    """
+    global _limits_generation
+
+    generation = config.generation()
+    if generation == _limits_generation:
+        return
+
+    env_config = config.get_config()
+    _queue.configure(
+        max_events=env_config.queue_max_events,
+        max_bytes=env_config.queue_max_bytes,
+        overflow=env_config.queue_overflow,
+        block_timeout=env_config.queue_block_timeout,
+    )
+    _limits_generation = generation
+
+
+def flush(timeout: Optional[float] = None) -> bool:
+    """
+    Wait for everything currently queued to be sent.
+
+    Parameters:
+    - timeout (float - optional): [default = None] maximum number of seconds
+                                    to wait, None waits until the queue is empty
+
+    Returns:
+    - done (bool): True if the queue was drained, False if we ran out of time
+    """
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    # Ask the worker to send partial batches rather than waiting for them
+    # to fill up or age out
+    if _queue.unfinished():
+        _ensure_worker()
+        _queue.put(_FLUSH)
+
+    return _queue.wait(deadline)
+
+
+def pending() -> int:
+    """
+    Number of queued work items which haven't been sent yet.
+    """
+    return _queue.unfinished()
+
+
+def _ensure_worker():
+    """
+    Start the worker thread if it isn't already running.
+    """
+    global _worker
+
+    if _worker is not None and _worker.is_alive():
+        return
+
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_worker_loop,
+                name="ga4py-dispatcher",
+                daemon=True, # Never keep the interpreter alive just for tracking
+            )
+            _worker.start()
+
+
+def _worker_loop():
+    """
+    Drain the queue forever, batching events and sending each batch when it
+    is full, too old, or a flush is requested.
+    """
+
+    batcher = _create_batcher()
+
+    while True:
+        deadline = batcher.next_deadline()
+
+        try:
+            if deadline is None:
+                item = _queue.get()
+            else:
+                item = _queue.get(timeout=max(0.0, deadline - time.monotonic()))
+
+        except IndexError:
+            # Nothing new arrived before the oldest batch became due
+            _send_batches(batcher.due())
+            continue
+
+        if item is _FLUSH:
+            _send_batches(batcher.drain())
+            _queue.task_done()
+            continue
+
+        gtag_tracker, events, logging_level, transport, size = item
+        _send_batches(batcher.add(gtag_tracker, events, logging_level, transport, size))
+        _send_batches(batcher.due())
+
+
+def _send_batches(batches: List[Batch]):
+    """
+    Send each batch, marking its work items as done whatever happens.
+
+    Failures are handled the same way as inline sends (spooled if the
+    spool is turned on, then reported) - we don't want
+    anything here to break the main code, so we print (depending on logging
+    level) and send an error alert.
+    """
+
+    for batch in batches:
+        try:
+            delivery.deliver(batch.gtag_tracker, batch.events, transport=batch.transport)
+
+        except error_handling.CircuitOpenError:
+            # GA4 has been failing - keep the events for replay but don't
+            # send an alert for every batch
+            spool.keep_unsent(batch.gtag_tracker, batch.events, "circuit_open")
+
+        except Exception as e:
+            # Keep the events for replay if the spool is turned on
+            spool.keep_unsent(batch.gtag_tracker, batch.events, "send_failed")
+
+            if batch.logging_level in ["error", "all"]:
+                error_handling.print_error_function(e)
+
+            try:
+                error_handling.send_tracking_error_alert(
+                    error=e,
+                    function="dispatcher",
+                    parameters=batch.events,
+                    logging_level=batch.logging_level)
+            except Exception:
+                pass
+
+        finally:
+            _queue.task_done(batch.items)
+
+
+def _create_batcher() -> EventBatcher:
+    """
+    Build the worker's batcher from the GA4_BATCH_* environment variables
+    (see ga4py/config.py).
+    """
+
+    env_config = config.get_config()
+
+    return EventBatcher(
+        max_events=env_config.batch_size,
+        max_age=env_config.batch_max_age,
+        max_bytes=env_config.batch_max_bytes,
+    )
+
+
+def _flush_at_exit():
+    """
+    atexit hook - give queued hits a bounded amount of time to go out.
+    """
+    flush(config.get_config().flush_timeout)
+
+
+def _after_fork_in_child():
+    """
+    The worker thread doesn't exist in a forked child and the lock/queue
+    could have been in use, so start again with fresh ones. Anything the
+    parent had queued is the parent's to send.
+    """
+    global _queue, _worker, _worker_lock, _limits_generation
+
+    _queue = Handoff()
+    _limits_generation = -1
+    _worker = None
+    _worker_lock = threading.Lock()
+
+
+atexit.register(_flush_at_exit)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
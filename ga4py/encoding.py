@@ -0,0 +1,220 @@
+"""
+Encoding tracking parameters into GA4 event parameters.
+
+GA4 only accepts event parameters which follow its collection limits
+(https://support.google.com/analytics/answer/9267744):
+
+- parameter and event names: up to 40 characters, letters, numbers and
+  underscores only, starting with a letter, and not starting with one of the
+  reserved prefixes (google_, ga_, firebase_)
+- parameter values: up to 100 characters (300 for page_location,
+  page_referrer and page_title)
+- up to 25 parameters per event
+
+Rather than calling repr() on each value several times, every value is
+encoded once by an encoder chosen for its type (and cached per type):
+strings are sent as they are, numbers stay numbers (so they can be used as
+metrics in GA4), anything else is sent as its (shortened) repr. Names are
+cleaned once per distinct name and cached. If two names are the same once
+cleaned (e.g. "a-b" and "a_b") only the first is sent.
+
+When a hit has more parameters than fit, the ones the library added to that
+hit itself (timings, spans, sampling, profiling, invocation ids,
+summaries...) are kept first and your own parameters are cut to make room -
+otherwise the measurements every hit relies on would be the first to go.
+"""
+
+
+import math
+import functools
+from typing import AbstractSet, Any, Callable, Dict, Mapping, Tuple
+
+
+MAX_NAME_LENGTH = 40
+MAX_VALUE_LENGTH = 100
+MAX_PAGE_VALUE_LENGTH = 300
+MAX_PARAMETERS_PER_EVENT = 25
+
+PAGE_PARAMETERS = frozenset(["page_location", "page_referrer", "page_title"])
+
+# Added to every hit by send_hit (page_location, page_title, stage) and by
+# ga4mp when sending (session_id, engagement_time_msec)
+RESERVED_PARAMETER_COUNT = 5
+MAX_CUSTOM_PARAMETERS = MAX_PARAMETERS_PER_EVENT - RESERVED_PARAMETER_COUNT
+
+RESERVED_PREFIXES = ("google_", "ga_", "firebase_")
+
+
+@functools.lru_cache(maxsize=1024)
+def encode_name(name) -> str:
+    """
+    Turn a parameter (or event) name into one GA4 will accept.
+
+    Anything other than letters, numbers and underscores is replaced with an
+    underscore, names which don't start with a letter or which use a
+    reserved prefix get "p_" in front, and the result is cut to 40
+    characters.
+    """
+
+    name = str(name)
+    cleaned = "".join(
+        character if (character.isascii() and character.isalnum()) or character == "_" else "_"
+        for character in name
+    )
+
+    if not cleaned or not cleaned[0].isalpha() or cleaned.lower().startswith(RESERVED_PREFIXES):
+        cleaned = "p_" + cleaned
+
+    return cleaned[:MAX_NAME_LENGTH]
+
+
+def _encode_string(value: str, limit: int) -> str:
+    return value if len(value) <= limit else value[:limit]
+
+
+def _encode_number(value, limit: int):
+    return value
+
+
+def _encode_float(value: float, limit: int):
+    # NaN and infinity aren't valid JSON
+    if math.isfinite(value):
+        return value
+    return str(value)
+
+
+def _encode_text(value, limit: int) -> str:
+    # bool and None - GA4 has no boolean type
+    return str(value)
+
+
+def _encode_repr(value, limit: int) -> str:
+    try:
+        text = repr(value)
+    except Exception:
+        text = f"<{type(value).__name__}>"
+
+    return text if len(text) <= limit else text[:limit]
+
+
+_ENCODERS: Dict[type, Callable[[Any, int], Any]] = {
+    str: _encode_string,
+    int: _encode_number,
+    float: _encode_float,
+    bool: _encode_text,
+    type(None): _encode_text,
+}
+
+
+def _encoder_for(value_type: type) -> Callable[[Any, int], Any]:
+    """
+    Find (and cache) the encoder for a type, using its closest base class
+    with an encoder - so str and int subclasses (e.g. enums) are treated as
+    strings and numbers.
+    """
+
+    for base in value_type.__mro__:
+        if base in _ENCODERS and base is not object:
+            encoder = _ENCODERS[base]
+            break
+    else:
+        encoder = _encode_repr
+
+    _ENCODERS[value_type] = encoder
+    return encoder
+
+
+def encode_value(value, name: str = ""):
+    """
+    Encode one parameter value within GA4's length limit.
+
+    Parameters:
+    - value (anything): the value to send
+    - name (string - optional): the parameter name (page parameters can be longer)
+
+    Returns:
+    - value (string or number)
+    """
+
+    limit = MAX_PAGE_VALUE_LENGTH if name in PAGE_PARAMETERS else MAX_VALUE_LENGTH
+
+    encoder = _ENCODERS.get(type(value))
+    if encoder is None:
+        encoder = _encoder_for(type(value))
+
+    return encoder(value, limit)
+
+
+def encode_parameters(
+        parameter_dictionary: Mapping,
+        max_parameters: int = MAX_CUSTOM_PARAMETERS,
+        library_keys: AbstractSet = frozenset(),
+        logging_level: str = ""
+        ) -> Tuple[Dict, int]:
+    """
+    Encode a dictionary of tracking parameters in one pass.
+
+    Parameters:
+    - parameter_dictionary (dictionary): names and values to send
+    - max_parameters (int - optional): [default 20] the most parameters to
+                                        keep (the rest of an event's 25 are
+                                        used by the library). If there are
+                                        more, the library's own parameters
+                                        are kept first, then the caller's in
+                                        order
+    - library_keys (set - optional): [default empty] the keys in
+                                    parameter_dictionary which the library
+                                    added to this hit itself
+    - logging_level (string - optional): [default ""] "error" or "all" print
+                                        the parameters left out because
+                                        their names clash once cleaned up
+
+    Returns:
+    - params (dictionary): GA4-ready names and values, in the original order
+    - dropped (int): how many parameters were left out because of the limit
+                    or a name clash
+    """
+
+    params: Dict = {}
+    encoders = _ENCODERS
+    kept = 0
+
+    # Room left for the caller's parameters (None when everything fits,
+    # which is nearly always - then nothing needs to be sorted out)
+    room = None
+    if len(parameter_dictionary) > max_parameters:
+        library = sum(1 for key in parameter_dictionary if key in library_keys)
+        room = max_parameters - min(library, max_parameters)
+        library_room = max_parameters - room
+
+    for key, value in parameter_dictionary.items():
+        name = encode_name(key)
+
+        if name in params:
+            # Another parameter is already sent under this name - keep the
+            # first rather than silently replacing its value
+            if logging_level in ["error", "all"]:
+                print(f"Parameter {key!r} not sent - another parameter is also sent as {name!r}")
+            continue
+
+        if room is not None:
+            if key in library_keys:
+                if library_room <= 0:
+                    continue
+                library_room -= 1
+            else:
+                if room <= 0:
+                    continue
+                room -= 1
+
+        kept += 1
+
+        encoder = encoders.get(type(value))
+        if encoder is None:
+            encoder = _encoder_for(type(value))
+
+        params[name] = encoder(
+            value, MAX_PAGE_VALUE_LENGTH if name in PAGE_PARAMETERS else MAX_VALUE_LENGTH
+        )
+
+    return params, len(parameter_dictionary) - kept
@@ -5,10 +5,13 @@ users can use to pass a custom analytics message to GA4.
 """
 
 
-import os
-import requests #type: ignore
-from typing import AnyStr, List, Tuple, Dict
-import json
+import sys
+import functools
+import importlib.util
+from typing import AnyStr, List, Dict, Optional
+
+import ga4py.alerts as alerts
+import ga4py.config as config
 
 class AnalyticsException(Exception):
     def __init__(self, message, analytics_message):
@@ -16,6 +19,19 @@ class AnalyticsException(Exception):
         self.analytics_message = analytics_message
 
 
+class CircuitOpenError(Exception):
+    """
+    Raised when a hit isn't sent because GA4 has been failing and the
+    circuit breaker is open.
+    """
+
+
+class LatencyBudgetExceeded(Exception):
+    """
+    Raised when sending a hit takes longer than its latency budget.
+    """
+
+
 def handle_analytics_errors(func):
     """
     Decorator to make sure that our analytics hits don't break the script.
@@ -48,59 +64,94 @@ def handle_analytics_errors(func):
         # Get logging level
         logging_level = kwargs.get("logging_level", "any")
 
-        # First see if we can extract the calling function
+        # Keep a reference to the calling frame - working out its name is 
+        # only done if we actually need to report an error
+        try:
+            calling_frame = sys._getframe(1)
+        except Exception:
+            calling_frame = None
+
         try:
-            import inspect # Build in, should be present
+            # First check that modules are installed (only actually checked
+            # once per process)
+            modules_error = _missing_modules_error()
+
+            if modules_error is not None:
+                # If we get an error then the modules aren't installed
+                send_tracking_error_alert(
+                    error=modules_error, 
+                    function=_frame_function_name(calling_frame), 
+                    parameters=[args, kwargs],
+                    logging_level=logging_level)
+
+                # If the modules aren't installed then running the function
+                # will throw an error (which will error more crucial code)
+                # so instead we just run an error print function
+                # that can handle whatever and return
+
+                if logging_level in ["error", "any"]:
+                    error = "Modules not installed"
+                    print_error_function(error)
+                return
+
+            # If the modules ARE installed - try running our passed function
+            try:
+                returned_value = func(*args, **kwargs)
+                return returned_value
+
+            except Exception as e:
+                # If we hit an error we don't want it to derail our core code
+
+                if logging_level in ["error", "any"]:
+                    print_error_function(e)
+
+                send_tracking_error_alert(
+                    error=e, 
+                    function=_frame_function_name(calling_frame), 
+                    parameters=[args, kwargs],
+                    logging_level=logging_level)
+
+        finally:
+            # Don't keep the frame (and everything it references) alive
+            del calling_frame
+
+    return ret_fun
+
+
+@functools.lru_cache(maxsize=None)
+def _missing_modules_error() -> Optional[Exception]:
+    """
+    Check the tracking dependencies are installed. The result is cached so
+    this is only checked once per process.
+
+    The modules are found without importing them - they're only imported
+    when a hit is actually sent (see ga4py/tracker_registry.py).
 
-            # Get the name of the function that called this one
-            calling_function = inspect.stack()[1].function
-        except:
-            # If that fails then just say we couldn't extract
-            calling_function = (
-                "[error occurred in a calling function we couldn't get the name of]"
-            )
+    Returns:
+    - error (Exception - or None if everything is installed)
+    """
 
-        # First check that modules are installed
+    for module_name in ("ga4mp", "requests"):
         try:
-            from ga4mp import GtagMP # type: ignore
-            from ga4mp.store import DictStore # type: ignore
+            if importlib.util.find_spec(module_name) is None:
+                return ModuleNotFoundError(f"No module named {module_name!r}")
 
         except Exception as E:
-            # If we get an error then the modules aren't installed
-            send_tracking_error_alert(
-                error=E, 
-                function=calling_function, 
-                parameters=[args, kwargs],
-                logging_level=logging_level)
-
-            # If the modules aren't installed then running the function
-            # will throw an error (which will error more crucial code)
-            # so instead we just run an error print function
-            # that can handle whatever and return
-
-            if logging_level in ["error", "any"]:
-                error = "Modules not installed"
-                print_error_function(error)
-            return
-
-        # If the modules ARE installed - try running our passed function
-        try:
-            returned_value = func(*args, **kwargs)
-            return returned_value
+            return E
 
-        except Exception as e:
-            # If we hit an error we don't want it to derail our core code
+    return None
 
-            if logging_level in ["error", "any"]:
-                print_error_function(e)
 
-            send_tracking_error_alert(
-                error=e, 
-                function=calling_function, 
-                parameters=[args, kwargs],
-                logging_level=logging_level)
+def _frame_function_name(frame) -> str:
+    """
+    Name of the function a frame belongs to, used when reporting errors.
+    """
 
-    return ret_fun
+    try:
+        return frame.f_code.co_name
+    except Exception:
+        # If that fails then just say we couldn't extract
+        return "[error occurred in a calling function we couldn't get the name of]"
 
 
 
@@ -111,13 +162,18 @@ def send_tracking_error_alert(
         function: AnyStr, 
         parameters: List[Dict],
         logging_level: str = "any"
-        )->requests.Response: 
+        )->None: 
     """
     
     A function to send errors to our tool monitoring API when our tracking
     fails. (Importantly, this does not hit the error API when the main code
     fails, it's just a way to know if the measurement tracking is hitting issues).
 
+    The alert isn't sent straight away - it's added to a background channel
+    (see ga4py/alerts.py) which sends alerts in periodic digests, with
+    timeouts, retries and a circuit breaker, so a slow or broken alert
+    endpoint can't hold up the main code.
+
     Parameters:
 
     - error (string): What has caused the problem
@@ -126,12 +182,12 @@ def send_tracking_error_alert(
     - logging_level (str - optional): [default = "any"] how much we should print
 
     Returns:
-    - response (requests.Response object)
+    - None
 
     """
 
     # Retrieve the API endpoint to send the error message to
-    api_endpoint = os.getenv("GA4_ERROR_API_ENDPOINT", "")
+    api_endpoint = config.get_config().error_api_endpoint
 
     if api_endpoint == "":
         # If the endpoint url isn't set, just return
@@ -140,29 +196,17 @@ def send_tracking_error_alert(
         return
 
 
-    # Construct subject line and body (body can use html markup)
-    subject = f"Error in tracking function: {function!r} "
-
     param="<br>" + "<br>".join([str(param) for param in parameters])
 
-    body = f"""
-  
-  Error: {error!r}
-  <br><br><hr> <br><br>
-  Function parameters: {param!r}
-  
-  """
-    
-
-    # Construct json to send
-    data = {"subject": subject, "body": body}
-
-    data_json = json.dumps(data)
-
-    # Send json to endpoint
-    r = requests.post(api_endpoint, data=data_json)
+    # Queue the alert - the alert channel's worker thread sends alerts as
+    # periodic digests, so this never waits on the endpoint
+    alerts.get_channel(api_endpoint).submit(
+        error=repr(error),
+        function=str(function),
+        parameters=repr(param)
+        )
 
-    return r
+    return
 
 
 def print_error_function(
@@ -0,0 +1,251 @@
+"""
+Tracking every function in a module or class without editing its source.
+
+    import my_library
+    ga4py.instrument_module(my_library, exclude=["debug_*"])
+
+wraps each public function defined in my_library (and the public methods of
+the classes defined there) with analytics_hit_decorator, and
+
+    @ga4py.instrument_class
+    class Report:
+        ...
+
+does the same for one class. include and exclude are lists of glob patterns
+matched against the name ("load_*") or the class-qualified name
+("Report.*"), a name must match an include pattern (default every name) and
+no exclude pattern. Names starting with "_", functions imported from other
+modules, properties and functions which are already decorated by hand are
+left alone.
+
+Because this can track a lot of functions, some of them called in tight
+loops, the wrappers default to {summary_mode: True} - calls are aggregated
+locally and each function sends one summary hit per summary_interval (see
+ga4py/summary.py). Passing sample_rate, rate_limit or adaptive_sample_target
+switches to sampled per-call hits instead. Each function's hits use its
+qualified name ("my_library.Report.load") as page_location unless you pass
+one. Any other decorator arguments can be passed as keyword arguments and
+apply to every wrapped function.
+
+uninstrument(target) puts the original functions back (and sends any
+summary still waiting). Code which did "from my_library import load" before
+instrument_module was called keeps the original function, so instrument
+early.
+"""
+
+
+import inspect
+import weakref
+import functools
+from fnmatch import fnmatchcase
+from typing import Dict, Iterable, List, Optional
+
+from ga4py.add_tracker import analytics_hit_decorator, send_pending_summary
+
+
+# Arguments which choose per-call sampling instead of summary mode
+SAMPLING_ARGS = ("sample_rate", "rate_limit", "adaptive_sample_target")
+
+# module or class -> {attribute name: (original, replacement, wrapper)}
+_instrumented: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def instrument_module(
+        module,
+        include: Optional[Iterable[str]] = None,
+        exclude: Optional[Iterable[str]] = None,
+        classes: bool = True,
+        **static_args
+        ) -> List[str]:
+    """
+    Track the public functions (and class methods) defined in a module.
+
+    Parameters:
+    - module (module): the module to instrument
+    - include (list of strings - optional): [default every name] glob
+                                            patterns of names to track
+    - exclude (list of strings - optional): [default None] glob patterns of
+                                            names not to track
+    - classes (bool - optional): [default True] also track the public
+                                methods of classes defined in the module
+    - **static_args (optional): decorator arguments for every wrapped function
+
+    Returns:
+    - instrumented (list of strings): qualified names of the functions wrapped
+    """
+
+    instrumented = []
+
+    for name, value in list(vars(module).items()):
+        if name.startswith("_") or getattr(value, "__module__", None) != module.__name__:
+            continue
+
+        if inspect.isclass(value):
+            if classes:
+                instrumented += _instrument_class(value, include, exclude, static_args)
+            continue
+
+        if not _wanted(value, name, name, include, exclude):
+            continue
+
+        wrapper = _wrap(value, f"{module.__name__}.{name}", static_args)
+        if _replace(module, name, value, wrapper, wrapper):
+            instrumented.append(f"{module.__name__}.{name}")
+
+    return instrumented
+
+
+def instrument_class(
+        cls=None,
+        include: Optional[Iterable[str]] = None,
+        exclude: Optional[Iterable[str]] = None,
+        **static_args
+        ):
+    """
+    Track the public methods a class defines (including static and class
+    methods, but not inherited methods or properties). Works as a class
+    decorator, with or without arguments:
+
+        @ga4py.instrument_class(exclude=["render_*"], summary_interval=300)
+        class Report:
+            ...
+
+    Parameters:
+    - cls (class): the class to instrument (passed automatically when used
+                    as a decorator without brackets)
+    - include (list of strings - optional): [default every name] glob
+                                            patterns of names to track
+    - exclude (list of strings - optional): [default None] glob patterns of
+                                            names not to track
+    - **static_args (optional): decorator arguments for every wrapped method
+
+    Returns:
+    - cls (class): the same class, with its methods wrapped
+    """
+
+    if cls is None:
+        # Called with arguments - @instrument_class(exclude=[...])
+        return functools.partial(instrument_class, include=include, exclude=exclude, **static_args)
+
+    _instrument_class(cls, include, exclude, static_args)
+    return cls
+
+
+def _instrument_class(cls, include, exclude, static_args: Dict) -> List[str]:
+    """
+    Wrap a class's methods (see instrument_class).
+
+    Returns:
+    - instrumented (list of strings): qualified names of the methods wrapped
+    """
+
+    instrumented = []
+
+    for name, value in list(vars(cls).items()):
+        if name.startswith("_"):
+            continue
+
+        # Static and class methods are wrapped inside their descriptor
+        descriptor = type(value) if isinstance(value, (staticmethod, classmethod)) else None
+        function = value.__func__ if descriptor is not None else value
+
+        qualname = f"{cls.__qualname__}.{name}"
+        if not _wanted(function, name, qualname, include, exclude):
+            continue
+
+        wrapper = _wrap(function, f"{cls.__module__}.{qualname}", static_args)
+        replacement = descriptor(wrapper) if descriptor is not None else wrapper
+
+        if _replace(cls, name, value, replacement, wrapper):
+            instrumented.append(f"{cls.__module__}.{qualname}")
+
+    return instrumented
+
+
+def uninstrument(target) -> List[str]:
+    """
+    Put back the original functions in a module or class instrumented with
+    instrument_module or instrument_class (for a module, the classes defined
+    in it too) and send any summary hits still waiting.
+
+    Functions which have been replaced again since they were instrumented
+    are left alone.
+
+    Parameters:
+    - target (module or class)
+
+    Returns:
+    - restored (list of strings): names of the functions put back
+    """
+
+    restored = []
+    prefix = target.__name__ if inspect.ismodule(target) else f"{target.__module__}.{target.__qualname__}"
+
+    if inspect.ismodule(target):
+        for value in list(vars(target).values()):
+            if inspect.isclass(value) and value in _instrumented:
+                restored += uninstrument(value)
+
+    replaced: Dict = _instrumented.pop(target, None) or {}
+
+    for name, (original, replacement, wrapper) in replaced.items():
+        if vars(target).get(name) is replacement:
+            setattr(target, name, original)
+            restored.append(f"{prefix}.{name}")
+
+        send_pending_summary(wrapper)
+
+    return restored
+
+
+def _wanted(function, name: str, qualname: str, include, exclude) -> bool:
+    """
+    Whether a module or class attribute should be wrapped.
+    """
+
+    if not inspect.isfunction(function):
+        return False
+
+    # Already tracked (decorated by hand or instrumented)
+    if hasattr(function, "_ga4py_summary"):
+        return False
+
+    if include is not None and not _matches(name, qualname, include):
+        return False
+
+    return not (exclude is not None and _matches(name, qualname, exclude))
+
+
+def _matches(name: str, qualname: str, patterns: Iterable[str]) -> bool:
+    return any(
+        fnmatchcase(name, pattern) or fnmatchcase(qualname, pattern)
+        for pattern in patterns
+    )
+
+
+def _wrap(function, qualified_name: str, static_args: Dict):
+    """
+    Wrap a function with analytics_hit_decorator using the low overhead
+    defaults.
+    """
+
+    arguments = {"page_location": qualified_name}
+    if not any(name in static_args for name in SAMPLING_ARGS):
+        arguments["summary_mode"] = True
+    arguments.update(static_args)
+
+    return analytics_hit_decorator(function, **arguments)
+
+
+def _replace(owner, name: str, original, replacement, wrapper) -> bool:
+    """
+    Swap in the wrapped function and remember the original.
+    """
+
+    replaced = _instrumented.setdefault(owner, {})
+    if name in replaced:
+        return False
+
+    setattr(owner, name, replacement)
+    replaced[name] = (original, replacement, wrapper)
+    return True
@@ -0,0 +1,410 @@
+"""
+The library's own metrics - what tracking costs and how reliably hits go out.
+
+Counters and histograms are kept per thread (each thread only ever adds to
+its own, so recording never takes a lock) and added up when they're read:
+
+- hits_built (by stage): hits built by send_hit
+- calls_sampled_out: calls which weren't tracked because of sampling
+- hits_deduplicated: hits skipped by dedup_window
+- requests_sent / events_sent (by transport): successful sends
+- requests_failed (by transport): sends which raised
+- events_spooled: events written to the spool
+- events_dropped (by reason): events which were never sent or kept -
+  background queue overflow (drop_newest, drop_oldest, block_timeout,
+  spill_failed), failed or circuit-broken sends with no spool
+  (send_failed, circuit_open) and process pool hits the parent has no
+  GA4 credentials for (no_credentials)
+- tracking_overhead_seconds (histogram): time each tracked call spent in
+  the decorator rather than in the function
+- send_seconds (histogram, by transport): how long each send took
+- alerts_sent / alerts_failed / alerts_dropped: error alert digests
+- queue_events / queue_bytes: what's waiting in the background queue now
+- circuit_open (by transport): 1 while the transport's circuit breaker is open
+
+ga4py.stats() returns a snapshot as a dictionary. prometheus_text() gives
+the Prometheus text format, which can be served with start_http_server(port)
+or written to a file with write_prometheus(path) - if GA4_METRICS_FILE is
+set the file is written when Python exits (e.g. for node_exporter's textfile
+collector). Metric names are prefixed with "ga4py_" for Prometheus.
+"""
+
+
+import os
+import atexit
+import bisect
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Metric(NamedTuple):
+    kind: str # "counter", "histogram" or "gauge"
+    help: str
+    label: Optional[str] = None
+
+
+METRICS: Dict[str, Metric] = {
+    "hits_built": Metric("counter", "Hits built by send_hit", "stage"),
+    "calls_sampled_out": Metric("counter", "Calls not tracked because of sampling"),
+    "hits_deduplicated": Metric("counter", "Hits skipped as duplicates"),
+    "requests_sent": Metric("counter", "Requests sent successfully", "transport"),
+    "events_sent": Metric("counter", "Events sent successfully", "transport"),
+    "requests_failed": Metric("counter", "Requests which failed to send", "transport"),
+    "events_spooled": Metric("counter", "Events written to the spool"),
+    "events_dropped": Metric("counter", "Events which were neither sent nor kept", "reason"),
+    "tracking_overhead_seconds": Metric("histogram", "Time tracked calls spent in the decorator"),
+    "send_seconds": Metric("histogram", "Time taken by each send", "transport"),
+    "alerts_sent": Metric("counter", "Error alert digests sent"),
+    "alerts_failed": Metric("counter", "Error alert digests which failed to send"),
+    "alerts_dropped": Metric("counter", "Error alerts dropped"),
+    "queue_events": Metric("gauge", "Events waiting in the background queue"),
+    "queue_bytes": Metric("gauge", "Bytes waiting in the background queue"),
+    "circuit_open": Metric("gauge", "1 while the transport's circuit breaker is open", "transport"),
+}
+
+
+class _ThreadMetrics:
+    """
+    One thread's counters and histograms - only that thread writes to them.
+    """
+
+    __slots__ = ("thread", "counters", "histograms")
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        # (name, label) -> value
+        self.counters: Dict[Tuple[str, Optional[str]], float] = {}
+        # (name, label) -> [sum, count, bucket counts..., +Inf count]
+        self.histograms: Dict[Tuple[str, Optional[str]], List[float]] = {}
+
+
+_local = threading.local()
+_all_threads: List[_ThreadMetrics] = []
+# Totals from threads which have finished
+_finished = _ThreadMetrics()
+_lock = threading.Lock()
+
+
+def _mine() -> _ThreadMetrics:
+    try:
+        return _local.metrics
+    except AttributeError:
+        metrics = _local.metrics = _ThreadMetrics()
+        with _lock:
+            # Fold in threads which have finished as new ones start, so
+            # programs which start many short-lived threads and never read
+            # the metrics don't keep every thread around
+            _fold_finished()
+            _all_threads.append(metrics)
+        return metrics
+
+
+def _fold_finished():
+    """
+    Add finished threads' metrics to _finished and forget the threads. The
+    caller holds _lock.
+    """
+
+    for metrics in [metrics for metrics in _all_threads if not metrics.thread.is_alive()]:
+        _all_threads.remove(metrics)
+        _merge(_finished, metrics)
+
+
+def increment(name: str, amount: float = 1, label: Optional[str] = None):
+    """
+    Add to a counter.
+    """
+
+    counters = _mine().counters
+    key = (name, label)
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name: str, value: float, label: Optional[str] = None):
+    """
+    Record a value (in seconds) in a histogram.
+    """
+
+    histograms = _mine().histograms
+    key = (name, label)
+
+    cell = histograms.get(key)
+    if cell is None:
+        cell = histograms[key] = [0.0, 0] + [0] * (len(BUCKETS) + 1)
+
+    cell[0] += value
+    cell[1] += 1
+    cell[2 + bisect.bisect_left(BUCKETS, value)] += 1
+
+
+def _merge(into: _ThreadMetrics, source: _ThreadMetrics):
+    # dict.copy() and list() are single steps, so the owning thread can keep
+    # recording while we read
+    for key, value in source.counters.copy().items():
+        into.counters[key] = into.counters.get(key, 0) + value
+
+    for key, cell in source.histograms.copy().items():
+        cell = list(cell)
+        total = into.histograms.get(key)
+        if total is None:
+            into.histograms[key] = cell
+        else:
+            for i, value in enumerate(cell):
+                total[i] += value
+
+
+def _totals() -> _ThreadMetrics:
+    """
+    Add up every thread's metrics, folding finished threads into _finished.
+    """
+
+    totals = _ThreadMetrics()
+
+    with _lock:
+        _fold_finished()
+        for metrics in _all_threads:
+            _merge(totals, metrics)
+
+        _merge(totals, _finished)
+
+    return totals
+
+
+def _gauges() -> Dict[Tuple[str, Optional[str]], float]:
+    """
+    Values read from the rest of the library when a snapshot is taken.
+    """
+
+    import ga4py.alerts as alerts
+    import ga4py.delivery as delivery
+    import ga4py.dispatcher as dispatcher
+    from ga4py.circuit_breaker import OPEN
+
+    values: Dict[Tuple[str, Optional[str]], float] = {}
+
+    queued = dispatcher.queued()
+    values[("queue_events", None)] = queued["events"]
+    values[("queue_bytes", None)] = queued["bytes"]
+
+    for reason, events in dispatcher.dropped_events().items():
+        values[("events_dropped", reason)] = events
+
+    for transport_name, state in delivery.breaker_states().items():
+        values[("circuit_open", transport_name)] = 1 if state == OPEN else 0
+
+    channel = alerts._channel
+    if channel is not None:
+        values[("alerts_sent", None)] = channel.sent_digests
+        values[("alerts_failed", None)] = channel.failed_digests
+        values[("alerts_dropped", None)] = channel.dropped_alerts
+
+    return values
+
+
+def stats() -> Dict:
+    """
+    Snapshot of the library's metrics.
+
+    Returns:
+    - stats (dictionary): metric name -> value. Metrics with a label (e.g.
+                            events_dropped by reason) are dictionaries of
+                            label -> value, histograms are dictionaries with
+                            "count", "sum" and "buckets" (upper bound ->
+                            number of values up to that bound)
+    """
+
+    totals = _totals()
+
+    counters = dict(totals.counters)
+    for key, value in _gauges().items():
+        counters[key] = counters.get(key, 0) + value
+
+    snapshot: Dict = {}
+
+    for (name, label), value in sorted(counters.items(), key=_sort_key):
+        if label is None:
+            snapshot[name] = value
+        else:
+            snapshot.setdefault(name, {})[label] = value
+
+    for (name, label), cell in sorted(totals.histograms.items(), key=_sort_key):
+        histogram = {
+            "count": cell[1],
+            "sum": cell[0],
+            "buckets": _cumulative_buckets(cell),
+        }
+        if label is None:
+            snapshot[name] = histogram
+        else:
+            snapshot.setdefault(name, {})[label] = histogram
+
+    return snapshot
+
+
+def _sort_key(item):
+    (name, label), _ = item
+    return name, label or ""
+
+
+def _cumulative_buckets(cell) -> Dict[float, int]:
+    buckets = {}
+    running = 0
+    for bound, count in zip(BUCKETS, cell[2:]):
+        running += count
+        buckets[bound] = running
+    buckets[float("inf")] = cell[1]
+    return buckets
+
+
+def prometheus_text() -> str:
+    """
+    The metrics in the Prometheus text exposition format.
+    """
+
+    snapshot = stats()
+    lines = []
+
+    for name, metric in METRICS.items():
+        if name not in snapshot:
+            continue
+
+        full_name = f"ga4py_{name}" + ("_total" if metric.kind == "counter" else "")
+        lines.append(f"# HELP {full_name} {metric.help}")
+        lines.append(f"# TYPE {full_name} {metric.kind}")
+
+        value = snapshot[name]
+        labelled = value.items() if metric.label else [(None, value)]
+
+        for label, labelled_value in labelled:
+            label_text = f'{metric.label}="{_escape(label)}"' if label is not None else ""
+
+            if metric.kind != "histogram":
+                lines.append(f"{full_name}{_braces(label_text)} {_number(labelled_value)}")
+                continue
+
+            for bound, count in labelled_value["buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = ",".join(filter(None, [label_text, f'le="{le}"']))
+                lines.append(f"{full_name}_bucket{{{bucket_labels}}} {count}")
+            lines.append(f"{full_name}_sum{_braces(label_text)} {_number(labelled_value['sum'])}")
+            lines.append(f"{full_name}_count{_braces(label_text)} {labelled_value['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _braces(label_text: str) -> str:
+    return f"{{{label_text}}}" if label_text else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def write_prometheus(path: str):
+    """
+    Write the metrics to a file in the Prometheus text format (replacing it
+    in one step, so a collector never reads half a file).
+    """
+
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(prometheus_text())
+    os.replace(temp_path, path)
+
+
+def start_http_server(port: int, address: str = "127.0.0.1"):
+    """
+    Serve the metrics in the Prometheus text format at /metrics from a
+    daemon thread.
+
+    Parameters:
+    - port (int): port to listen on (0 picks a free one)
+    - address (string - optional): [default "127.0.0.1"] address to listen on
+
+    Returns:
+    - server (ThreadingHTTPServer): server.server_port is the port used,
+                                    call server.shutdown() to stop it
+    """
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="ga4py-metrics", daemon=True).start()
+    return server
+
+
+def reset():
+    """
+    Set every counter and histogram back to zero.
+
+    Other threads' dictionaries are swapped for new ones rather than cleared
+    (they write to them without a lock), so a value recorded by another
+    thread at the same moment may land in the old dictionary and be lost.
+    """
+    global _finished
+
+    with _lock:
+        for metrics in _all_threads:
+            metrics.counters = {}
+            metrics.histograms = {}
+        _finished = _ThreadMetrics()
+
+
+def _write_at_exit():
+    import ga4py.config as config
+
+    path = config.get_config().metrics_file
+    if path:
+        try:
+            write_prometheus(path)
+        except Exception:
+            pass
+
+
+def _after_fork_in_child():
+    # Start again in the child so the parent's counts aren't reported twice
+    global _local, _all_threads, _finished, _lock
+
+    _local = threading.local()
+    _all_threads = []
+    _finished = _ThreadMetrics()
+    _lock = threading.Lock()
+
+
+atexit.register(_write_at_exit)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,208 @@
+"""
+Process-pool support - send every child process's hits through one
+collector in the parent.
+
+Without this, each worker process in a multiprocessing pool builds its own
+GA4 tracker and sends its own hits. With a collector running, decorated
+functions in child processes put compact (measurement id, client id, events,
+transport name) records on a multiprocessing queue instead, and a thread in
+the parent hands them to the background dispatcher, which batches and sends
+them through the transport each function chose. A Transport object passed
+to the decorator is sent by its name, so the parent uses its own transport
+of that name.
+
+    collector = ga4py.multiprocess.start_collector()
+
+    # Children created with fork pick the collector up automatically, for
+    # other start methods pass the initializer
+    with ProcessPoolExecutor(
+            initializer=ga4py.multiprocess.init_worker,
+            initargs=(collector.queue,)) as pool:
+        ...
+
+    collector.stop()
+
+Each module with per-process state (worker threads, locks, HTTP sessions,
+shared trackers) resets that state in the child after a fork, so nothing
+the parent was doing at the time can leave the child stuck.
+"""
+
+
+import os
+import threading
+from typing import Dict, List, Optional
+
+import ga4py.config as config
+import ga4py.dispatcher as dispatcher
+import ga4py.metrics as metrics
+import ga4py.transports as transports
+from ga4py.batching import stamp_events
+
+
+class Collector:
+    """
+    Parent-side end of the queue which child processes forward hits to.
+
+    Attributes:
+    - queue (multiprocessing queue): pass to init_worker in the children
+    - received (int): event records received so far
+    """
+
+    def __init__(self, context=None):
+        import multiprocessing
+
+        context = context or multiprocessing.get_context()
+        self.queue = context.Queue()
+        self.received = 0
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="ga4py-collector", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+
+            try:
+                measurement_id, client_id, events, transport = record
+                self.received += 1
+                _send_from_parent(measurement_id, client_id, events, transport)
+            except Exception:
+                # Never let a bad record kill the collector
+                pass
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stop collecting and send everything which has been received.
+
+        Parameters:
+        - timeout (float - optional): [default None] seconds to wait for
+                                        hits to be sent, None waits until done
+
+        Returns:
+        - done (bool): False if we ran out of time
+        """
+
+        global _collector
+
+        if os.getpid() != self._pid:
+            return True
+
+        self.queue.put(None)
+        self._thread.join(timeout)
+
+        if _collector is self:
+            _collector = None
+
+        return dispatcher.flush(timeout)
+
+
+_collector: Optional[Collector] = None
+
+# Set in child processes which should forward their hits to a collector
+_forward_queue = None
+
+
+def start_collector(context=None) -> Collector:
+    """
+    Start collecting hits from child processes (in the parent process).
+
+    Parameters:
+    - context (multiprocessing context - optional): [default the default
+                context] use the same context as your pool
+
+    Returns:
+    - collector (Collector)
+    """
+    global _collector
+
+    if _collector is None:
+        _collector = Collector(context)
+
+    return _collector
+
+
+def init_worker(queue):
+    """
+    Pool initializer which makes a child process forward its hits to the
+    collector's queue. Only needed for start methods other than fork.
+    """
+    global _forward_queue
+
+    _forward_queue = queue
+
+
+def forward_queue():
+    """
+    The queue this process should forward hits to, or None if this isn't a
+    child process of a collector.
+    """
+    return _forward_queue
+
+
+def forward_events(gtag_tracker, events: List[Dict], transport=None):
+    """
+    Send events to the parent's collector rather than to GA4.
+
+    Events are stamped with their timestamp here so they keep the time they
+    happened in the child. The client id is only passed on if it was set with
+    ga4py.tracking_context - otherwise the parent sends with its own.
+
+    Parameters:
+    - gtag_tracker (tracker object): the child's tracker
+    - events (list): the events to send
+    - transport (string or Transport - optional): [default GA4_TRANSPORT]
+                                                    the function's transport
+    """
+
+    client_id = gtag_tracker.client_id if getattr(gtag_tracker, "assigned_client_id", False) else None
+    transport_name = transports.get_transport(transport).name
+
+    _forward_queue.put(
+        (gtag_tracker.measurement_id, client_id, stamp_events(list(events)), transport_name)
+    )
+
+
+def _send_from_parent(
+        measurement_id: str,
+        client_id: Optional[str],
+        events: List[Dict],
+        transport: Optional[str] = None
+        ):
+    """
+    Queue events received from a child process with the parent's tracker,
+    to be sent through the transport the child's function chose.
+
+    Only the "http" transport needs GA4_CLI_SEC - without it the events
+    can't be sent, so they're counted in the events_dropped metric.
+    """
+
+    from ga4py.tracker_registry import get_tracker
+
+    env_config = config.get_config()
+    if transports.get_transport(transport).needs_credentials and env_config.api_secret == "None":
+        metrics.increment("events_dropped", len(events), "no_credentials")
+        return
+
+    dispatcher.enqueue_events(
+        get_tracker(env_config.api_secret, measurement_id, client_id=client_id),
+        events,
+        transport=transport
+    )
+
+
+def _after_fork_in_child():
+    global _collector, _forward_queue
+
+    # A child of a process running a collector forwards to it, and the
+    # collector thread itself doesn't exist in the child
+    if _collector is not None:
+        _forward_queue = _collector.queue
+    _collector = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,328 @@
+"""
+Tracking plans - everything the decorator needs to know to track a function,
+worked out once rather than on every call.
+
+A plan is built when a function is decorated from the static arguments given
+to analytics_hit_decorator and the cached environment configuration, and
+rebuilt if ga4py.config.reload_config() has been called since. A call which
+passes ga4py_args/ga4py_args_remove gets the compiled plan with its
+overrides applied by with_overrides - custom parameters and the simple
+arguments (page_location, transport...) are swapped in directly, only
+arguments which change how calls are tracked (sampling, skip_stage,
+dedup_window...) need the full compile_plan.
+
+Tracking arguments which can't be used (e.g. {sample_rate: "half"}) never
+raise into the tracked code - the default is used instead and the bad
+values are reported with an error alert.
+"""
+
+
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Mapping, NamedTuple, Optional, Tuple
+
+import ga4py.config as config
+import ga4py.dedup as dedup
+import ga4py.error_handling as error_handling
+from ga4py.sampling import SamplingSettings, sampling_settings
+from ga4py.summary import DEFAULT_INTERVAL as DEFAULT_SUMMARY_INTERVAL
+from ga4py.profiling import DEFAULT_TOP as DEFAULT_PROFILE_TOP
+
+
+class TrackingPlan(NamedTuple):
+    """
+    Immutable description of how to track one function.
+
+    parameter_dictionary is a read-only view of the custom parameters to
+    include in every hit. send_start/send_end/send_error are the skip_stage
+    checks worked out in advance. sampling is None when every call is tracked.
+    summary_mode replaces per-call hits with periodic summary hits. send_slow
+    is True when a "slow" hit should be sent for calls over slow_threshold_ms.
+    transport is a transport name or Transport (see ga4py/transports.py).
+    profile_rate is the fraction of calls to profile (see ga4py/profiling.py).
+    invocation_ids adds the call's invocation ids to its hits (see
+    ga4py/context.py). Identical hits are skipped for dedup_window seconds
+    (0 for off), dedup_key identifies the plan's hits (see ga4py/dedup.py)
+    using the dedup_params parameters (None for all of them).
+    """
+
+    func_name: str
+    parameter_dictionary: Mapping
+    page_title: str
+    page_location: Optional[str]
+    event_name: str
+    testing_mode: bool
+    dispatch_mode: str
+    latency_budget_ms: Optional[float]
+    transport: Any
+    skip_stage: FrozenSet[str]
+    logging_level: str
+    stage: str
+    send_start: bool
+    send_end: bool
+    send_error: bool
+    send_slow: bool
+    slow_threshold_ms: Optional[float]
+    sampling: Optional[SamplingSettings]
+    summary_mode: bool
+    summary_interval: float
+    profile_rate: float
+    profile_top: int
+    profile_dir: str
+    invocation_ids: bool
+    dedup_window: float
+    dedup_key: Optional[str]
+    dedup_params: Optional[Tuple[str, ...]]
+    generation: int
+
+
+# Every tracking argument compile_plan takes out of the argument
+# dictionaries - anything else is a custom parameter sent with the hits
+TRACKING_ARGUMENTS = frozenset([
+    "page_title", "page_location", "event_name", "testing_mode", "dispatch_mode",
+    "latency_budget_ms", "transport", "skip_stage", "logging_level", "stage",
+    "slow_threshold_ms", "sample_rate", "rate_limit", "rate_limit_burst",
+    "adaptive_sample_target", "summary_mode", "summary_interval", "profile_rate",
+    "profile_top", "profile_dir", "invocation_ids", "dedup_window", "dedup_params",
+])
+
+# Tracking arguments with_overrides can swap straight into a plan
+SIMPLE_OVERRIDES = frozenset([
+    "page_title", "page_location", "event_name", "testing_mode", "dispatch_mode",
+    "transport", "logging_level",
+])
+
+
+def compile_plan(func_name: str, *argument_dicts: Optional[Dict]) -> TrackingPlan:
+    """
+    Build a tracking plan from one or more argument dictionaries.
+
+    Later dictionaries override earlier ones, so the decorator passes its
+    static arguments first, then ga4py_args_remove, then ga4py_args.
+
+    Parameters:
+    - func_name (string): name of the function being tracked
+    - *argument_dicts (dictionaries): tracking arguments, None is ignored
+
+    Returns:
+    - plan (TrackingPlan)
+    """
+
+    arg_params: Dict = {}
+    for argument_dict in argument_dicts:
+        if argument_dict:
+            arg_params.update(argument_dict)
+
+    env_config = config.get_config()
+
+    # Arguments which couldn't be used, name -> value given
+    invalid: Dict = {}
+
+    # Check if this is a testing hit
+    if env_config.testing_flag == "TRUE":
+        arg_params["testing"] = env_config.testing_flag
+
+    # Pull out key information from the dictionary
+    page_title = arg_params.pop("page_title", "")
+    page_location = arg_params.pop("page_location", None)
+    event_name = arg_params.pop("event_name", "pageview")
+    testing_mode = arg_params.pop("testing_mode", False)
+
+    # Decide whether hits are sent inline or handed to the background
+    # dispatcher (so GA4 latency doesn't add to the function's runtime)
+    dispatch_mode = arg_params.pop("dispatch_mode", env_config.dispatch_mode)
+
+    # The longest an inline send can hold up the call
+    latency_budget_ms = _number(
+        invalid, "latency_budget_ms",
+        arg_params.pop("latency_budget_ms", env_config.latency_budget_ms), None, minimum=0.0
+        )
+
+    # Where the hits go (GA4 over http, memory, a file, nowhere)
+    transport = arg_params.pop("transport", None) or env_config.transport
+
+    # Pull out skip_stage if it exists, if it doesn't just use
+    # an empty list
+    skip_stage = arg_params.pop("skip_stage", None) or []
+    if isinstance(skip_stage, str):
+        skip_stage = [skip_stage]
+    try:
+        skip_stage = frozenset(skip_stage)
+    except TypeError:
+        invalid["skip_stage"] = skip_stage
+        skip_stage = frozenset()
+
+    # Pull out logging level to know if/what we should print
+    logging_level = arg_params.pop("logging_level", "")
+
+    # Allow user to set custom 'stage' to send (will skip start and end)
+    stage = arg_params.pop("stage", "start")
+
+    # Latency budget - calls slower than this also send a "slow" hit
+    # (anything which isn't a number means no threshold)
+    slow_threshold_ms = _number(
+        invalid, "slow_threshold_ms", arg_params.pop("slow_threshold_ms", None), None, minimum=0.0
+        )
+
+    # Sampling and rate limiting (None if every call is tracked)
+    sampling = sampling_settings(
+        sample_rate=arg_params.pop("sample_rate", None),
+        rate_limit=arg_params.pop("rate_limit", None),
+        rate_limit_burst=arg_params.pop("rate_limit_burst", None),
+        adaptive_sample_target=arg_params.pop("adaptive_sample_target", None),
+        invalid=invalid,
+    )
+
+    # Aggregate calls locally and send one summary hit per interval
+    summary_mode = bool(arg_params.pop("summary_mode", False))
+    summary_interval = _number(
+        invalid, "summary_interval",
+        arg_params.pop("summary_interval", None), DEFAULT_SUMMARY_INTERVAL, minimum=0.0
+        )
+
+    # Profile a sample of calls (0 - the default - turns profiling off)
+    profile_rate = _number(
+        invalid, "profile_rate", arg_params.pop("profile_rate", None), 0.0, minimum=0.0, maximum=1.0
+        )
+    profile_top = _number(
+        invalid, "profile_top",
+        arg_params.pop("profile_top", None), DEFAULT_PROFILE_TOP, minimum=1, convert=int
+        )
+    profile_dir = arg_params.pop("profile_dir", env_config.profile_dir)
+
+    # Send which call (and parent call) each hit came from
+    invocation_ids = bool(arg_params.pop("invocation_ids", env_config.invocation_ids))
+
+    # Skip hits identical to one sent in the last dedup_window seconds
+    dedup_window = _number(
+        invalid, "dedup_window",
+        arg_params.pop("dedup_window", env_config.dedup_window), 0.0, minimum=0.0
+        )
+
+    # Only compare these parameters (None compares them all)
+    dedup_params = arg_params.pop("dedup_params", None)
+    if isinstance(dedup_params, str):
+        dedup_params = [dedup_params]
+    if dedup_params is not None:
+        try:
+            dedup_params = tuple(str(name) for name in dedup_params)
+        except TypeError:
+            invalid["dedup_params"] = dedup_params
+            dedup_params = None
+
+    if invalid:
+        error_handling.send_tracking_error_alert(
+            error=f"Invalid tracking arguments ({', '.join(invalid)}) - defaults used",
+            function=func_name,
+            parameters=[invalid],
+            logging_level=logging_level
+            )
+
+    return TrackingPlan(
+        func_name=func_name,
+        parameter_dictionary=MappingProxyType(arg_params),
+        page_title=page_title,
+        page_location=page_location,
+        event_name=event_name,
+        testing_mode=testing_mode,
+        dispatch_mode=dispatch_mode,
+        latency_budget_ms=latency_budget_ms,
+        transport=transport,
+        skip_stage=skip_stage,
+        logging_level=logging_level,
+        stage=stage,
+        send_start=stage not in skip_stage,
+        send_end="end" not in skip_stage and stage == "start",
+        send_error="error" not in skip_stage,
+        send_slow=slow_threshold_ms is not None and "slow" not in skip_stage,
+        slow_threshold_ms=slow_threshold_ms,
+        sampling=sampling,
+        summary_mode=summary_mode,
+        summary_interval=summary_interval,
+        profile_rate=profile_rate,
+        profile_top=profile_top,
+        profile_dir=profile_dir,
+        invocation_ids=invocation_ids,
+        dedup_window=dedup_window,
+        dedup_key=(
+            dedup.dedup_key(func_name, page_location, arg_params, dedup_params)
+            if dedup_window else None
+        ),
+        dedup_params=dedup_params,
+        generation=config.generation(),
+    )
+
+
+def with_overrides(plan: TrackingPlan, static_args: Optional[Dict], *override_dicts: Optional[Dict]) -> TrackingPlan:
+    """
+    Apply a call's ga4py_args/ga4py_args_remove to the function's compiled
+    plan.
+
+    Custom parameters and SIMPLE_OVERRIDES are applied to the plan directly,
+    so a call which only adds parameters or changes page_location doesn't
+    go through compile_plan again. Any other tracking argument changes how
+    the call is tracked, and the plan is compiled from scratch.
+
+    Parameters:
+    - plan (TrackingPlan): the plan compiled from static_args
+    - static_args (dictionary): the decorator's static arguments
+    - *override_dicts (dictionaries): the call's tracking arguments, None is
+                                        ignored
+
+    Returns:
+    - plan (TrackingPlan)
+    """
+
+    overrides: Dict = {}
+    for override_dict in override_dicts:
+        if override_dict:
+            overrides.update(override_dict)
+
+    if not overrides:
+        return plan
+
+    changes: Dict = {}
+    custom: Dict = {}
+
+    for name, value in overrides.items():
+        if name in SIMPLE_OVERRIDES:
+            changes[name] = value
+        elif name in TRACKING_ARGUMENTS:
+            return compile_plan(plan.func_name, static_args, *override_dicts)
+        else:
+            custom[name] = value
+
+    if "transport" in changes:
+        changes["transport"] = changes["transport"] or config.get_config().transport
+
+    if custom:
+        parameter_dictionary = {**plan.parameter_dictionary, **custom}
+
+        # As in compile_plan, the environment's testing flag wins
+        testing_flag = config.get_config().testing_flag
+        if testing_flag == "TRUE":
+            parameter_dictionary["testing"] = testing_flag
+
+        changes["parameter_dictionary"] = MappingProxyType(parameter_dictionary)
+
+    if plan.dedup_window and ("page_location" in changes or custom):
+        changes["dedup_key"] = dedup.dedup_key(
+            plan.func_name,
+            changes.get("page_location", plan.page_location),
+            changes.get("parameter_dictionary", plan.parameter_dictionary),
+            plan.dedup_params,
+        )
+
+    return plan._replace(**changes)
+
+
+def _number(invalid: Dict, name: str, value, default, minimum=None, maximum=None, convert=float):
+    """
+    Convert a numeric tracking argument (see config.checked_number), noting
+    it in invalid if it can't be used.
+    """
+
+    number, valid = config.checked_number(value, default, minimum, maximum, convert)
+    if not valid:
+        invalid[name] = value
+
+    return number
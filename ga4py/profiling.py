@@ -0,0 +1,189 @@
+"""
+Opt-in profiling of tracked calls.
+
+With {profile_rate: 0.01} in the decorator arguments about 1 in 100 calls is
+run under cProfile and tracemalloc, and the end (or error) hit gets:
+
+- "profile_top": the profile_top (default 3) functions with the most
+  cumulative time, e.g. "load_csv:812,parse_rows:640,clean:95" (milliseconds)
+- "profile_peak_kib": the most memory the call had allocated at once
+- "profile_file": the name of the full profile, if GA4_PROFILE_DIR (or
+  profile_dir) is set - the .prof file is written to that folder and can be
+  opened with pstats or snakeviz
+
+Only one call is profiled at a time in the whole process (other calls which
+are picked while it runs just aren't profiled), so profiles never overlap
+and tracemalloc is only running while a profiled call is. If something else
+is already using tracemalloc the memory peak is left out. For coroutine
+functions the profile includes whatever else the event loop runs while the
+call is waiting.
+"""
+
+
+import os
+import time
+import random
+import threading
+from typing import Dict, Optional
+
+from ga4py.encoding import MAX_VALUE_LENGTH
+
+
+DEFAULT_TOP = 3
+
+# Held while a call is being profiled
+_profiling_lock = threading.Lock()
+
+
+class CallProfile:
+    """
+    Profiler state for one profiled call.
+    """
+
+    __slots__ = ("profiler", "traced_memory", "memory_start", "active")
+
+    def __init__(self):
+        import cProfile
+
+        self.profiler = cProfile.Profile()
+        self.traced_memory = False
+        self.memory_start = 0
+        self.active = True
+
+
+def start(plan) -> Optional[CallProfile]:
+    """
+    Start profiling a call if the plan asks for it and this call is picked.
+
+    Returns:
+    - call_profile (CallProfile - or None if the call isn't profiled)
+    """
+
+    if not plan.profile_rate or random.random() >= plan.profile_rate:
+        return None
+
+    if not _profiling_lock.acquire(blocking=False):
+        # Another call is being profiled
+        return None
+
+    # Only imported once a call is actually profiled
+    import tracemalloc
+
+    call_profile = CallProfile()
+
+    try:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            call_profile.traced_memory = True
+            call_profile.memory_start = tracemalloc.get_traced_memory()[0]
+
+        call_profile.profiler.enable()
+
+    except Exception:
+        # e.g. another profiler is already active in this thread
+        if call_profile.traced_memory:
+            tracemalloc.stop()
+        _profiling_lock.release()
+        return None
+
+    return call_profile
+
+
+def finish(plan, call_profile: Optional[CallProfile]) -> Dict:
+    """
+    Stop profiling a call.
+
+    Returns:
+    - parameters (dictionary): profile parameters for the end/error hit
+                                (empty if the call wasn't profiled)
+    """
+
+    if call_profile is None or not call_profile.active:
+        return {}
+
+    import pstats
+    import tracemalloc
+
+    try:
+        call_profile.profiler.disable()
+
+        parameters = {}
+
+        if call_profile.traced_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            call_profile.traced_memory = False
+            parameters["profile_peak_kib"] = round((peak - call_profile.memory_start) / 1024, 1)
+
+        stats = pstats.Stats(call_profile.profiler)
+        parameters["profile_top"] = top_functions(stats, plan.profile_top)
+
+        if plan.profile_dir:
+            parameters["profile_file"] = _write_profile(plan, stats)
+
+        return parameters
+
+    except Exception:
+        return {}
+
+    finally:
+        if call_profile.traced_memory:
+            tracemalloc.stop()
+            call_profile.traced_memory = False
+        call_profile.active = False
+        _profiling_lock.release()
+
+
+def release(call_profile: Optional[CallProfile]):
+    """
+    Stop profiling a call which never reached finish - e.g. a coroutine
+    which was cancelled, or a KeyboardInterrupt - so the profiler, tracemalloc
+    and the lock aren't held for the rest of the process. Does nothing if
+    finish has already run.
+    """
+
+    if call_profile is None or not call_profile.active:
+        return
+
+    try:
+        call_profile.profiler.disable()
+    except Exception:
+        pass
+
+    if call_profile.traced_memory:
+        import tracemalloc
+
+        tracemalloc.stop()
+        call_profile.traced_memory = False
+
+    call_profile.active = False
+    _profiling_lock.release()
+
+
+def top_functions(stats, count: int) -> str:
+    """
+    The functions with the most cumulative time, as "name:ms,name:ms".
+
+    The profiler's own disable() call is left out, and the list is cut to
+    fit in a GA4 parameter value.
+    """
+
+    entries = []
+    for (file_name, line, function_name), (_, _, _, cumulative, _) in stats.stats.items():
+        if function_name.startswith("<method 'disable'"):
+            continue
+        entries.append((cumulative, function_name.strip("<>")))
+
+    entries.sort(reverse=True)
+
+    text = ",".join(f"{name}:{cumulative * 1000:.0f}" for cumulative, name in entries[:count])
+    return text[:MAX_VALUE_LENGTH]
+
+
+def _write_profile(plan, stats) -> str:
+    os.makedirs(plan.profile_dir, exist_ok=True)
+
+    file_name = f"{plan.func_name}-{os.getpid()}-{time.time_ns()}.prof"
+    stats.dump_stats(os.path.join(plan.profile_dir, file_name))
+
+    return file_name
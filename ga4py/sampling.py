@@ -0,0 +1,204 @@
+"""
+Client-side sampling and rate limiting for tracked functions.
+
+Each decorated function can be given:
+
+- sample_rate: the fraction of calls to track (0 to 1)
+- rate_limit / rate_limit_burst: a token bucket - at most rate_limit tracked
+  calls per second on average, with bursts of up to rate_limit_burst
+- adaptive_sample_target: the number of tracked calls per second to aim for,
+  the sample rate is lowered automatically when the function is called more
+  often than that
+
+The decision is made once per call, so a call is either tracked (start, end
+and error hits) or not tracked at all. Tracked hits carry "sample_dropped",
+the number of calls which weren't tracked since the previous tracked call,
+and "sample_rate", the sample rate used. Adding up (1 + sample_dropped) over
+the tracked hits gives the real number of calls.
+"""
+
+
+import os
+import random
+import weakref
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import ga4py.config as config
+
+
+# How often (seconds) the observed call rate is re-measured for adaptive sampling
+RATE_WINDOW = 1.0
+
+# Weight given to the newest window when smoothing the observed call rate
+RATE_SMOOTHING = 0.5
+
+
+_samplers: "weakref.WeakSet[CallSampler]" = weakref.WeakSet()
+
+
+class SamplingSettings(NamedTuple):
+    sample_rate: float
+    rate_limit: Optional[float]
+    rate_limit_burst: Optional[float]
+    adaptive_sample_target: Optional[float]
+
+
+def sampling_settings(
+        sample_rate=None,
+        rate_limit=None,
+        rate_limit_burst=None,
+        adaptive_sample_target=None,
+        invalid: Optional[Dict] = None
+        ) -> Optional[SamplingSettings]:
+    """
+    Validate the sampling arguments, returning None if every call should be
+    tracked (so the decorator can skip sampling entirely).
+
+    Values outside their range are clamped (sample_rate to 0-1, rate_limit
+    and adaptive_sample_target to at least 0, rate_limit_burst to at least
+    1). Values which aren't numbers are ignored, as if they weren't given.
+
+    Parameters:
+    - invalid (dictionary - optional): [default None] the names and values of
+                                        arguments which were ignored are added
+                                        to this
+    """
+
+    def number(name, value, default, minimum, maximum=None):
+        number, valid = config.checked_number(value, default, minimum, maximum)
+        if not valid and invalid is not None:
+            invalid[name] = value
+        return number
+
+    sample_rate = number("sample_rate", sample_rate, 1.0, 0.0, 1.0)
+    rate_limit = number("rate_limit", rate_limit, None, 0.0)
+    rate_limit_burst = number("rate_limit_burst", rate_limit_burst, None, 1.0)
+    adaptive_sample_target = number("adaptive_sample_target", adaptive_sample_target, None, 0.0)
+
+    if sample_rate >= 1.0 and rate_limit is None and adaptive_sample_target is None:
+        return None
+
+    return SamplingSettings(
+        sample_rate=sample_rate,
+        rate_limit=rate_limit,
+        rate_limit_burst=rate_limit_burst,
+        adaptive_sample_target=adaptive_sample_target,
+    )
+
+
+class CallSampler:
+    """
+    Decides which calls of one function are tracked.
+
+    Parameters:
+    - settings (SamplingSettings)
+    - clock (function - optional): [default = time.monotonic]
+    - rng (function - optional): [default = random.random]
+    """
+
+    def __init__(
+            self,
+            settings: SamplingSettings,
+            clock: Callable[[], float] = time.monotonic,
+            rng: Callable[[], float] = random.random
+            ):
+
+        self.settings = settings
+        self._clock = clock
+        self._rng = rng
+        self._lock = threading.Lock()
+        _samplers.add(self)
+
+        now = clock()
+
+        # Token bucket
+        self._capacity = settings.rate_limit_burst or max(settings.rate_limit or 1.0, 1.0)
+        self._tokens = self._capacity
+        self._last_refill = now
+
+        # Observed call rate (calls per second) for adaptive sampling
+        self._window_start = now
+        self._window_calls = 0
+        self._observed_rate: Optional[float] = None
+
+        # Calls not tracked since the last tracked call
+        self._dropped = 0
+
+    def decide(self) -> Tuple[bool, Dict]:
+        """
+        Decide whether to track this call.
+
+        Returns:
+        - keep (bool): True if the call should be tracked
+        - parameters (dictionary): sampling parameters to add to the hits
+                                    (empty if the call isn't tracked)
+        """
+
+        with self._lock:
+            now = self._clock()
+            rate = self._effective_rate(now)
+
+            keep = rate >= 1.0 or self._rng() < rate
+
+            if keep and self.settings.rate_limit is not None:
+                keep = self._take_token(now)
+
+            if not keep:
+                self._dropped += 1
+                return False, {}
+
+            dropped, self._dropped = self._dropped, 0
+
+        return True, {"sample_rate": round(rate, 4), "sample_dropped": dropped}
+
+    def _effective_rate(self, now: float) -> float:
+        """
+        The configured sample rate, lowered if adaptive sampling is on and
+        the function is being called faster than the target.
+        """
+
+        rate = self.settings.sample_rate
+        target = self.settings.adaptive_sample_target
+        if target is None:
+            return rate
+
+        self._window_calls += 1
+        elapsed = now - self._window_start
+
+        if elapsed >= RATE_WINDOW:
+            window_rate = self._window_calls / elapsed
+            if self._observed_rate is None:
+                self._observed_rate = window_rate
+            else:
+                self._observed_rate += RATE_SMOOTHING * (window_rate - self._observed_rate)
+
+            self._window_start = now
+            self._window_calls = 0
+
+        if self._observed_rate and self._observed_rate > target:
+            rate = min(rate, target / self._observed_rate)
+
+        return rate
+
+    def _take_token(self, now: float) -> bool:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self._capacity, self._tokens + elapsed * self.settings.rate_limit)
+
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+
+        return False
+
+
+def _after_fork_in_child():
+    # A sampler's lock could have been held by another thread at fork time
+    for sampler in list(_samplers):
+        sampler._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
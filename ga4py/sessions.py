@@ -0,0 +1,75 @@
+"""
+Shared HTTP session for everything the library sends.
+
+All GA4 hits and error alerts go through one requests.Session so the
+underlying keep-alive connections are pooled and reused, rather than setting
+up a new TCP/TLS connection for every hit.
+
+requests is only imported when the session is first needed, so programs
+which never send anything don't pay for importing it.
+"""
+
+
+import os
+import threading
+from typing import Optional
+
+
+# Seconds to wait for the GA4/error endpoints before giving up
+DEFAULT_TIMEOUT = 10
+
+# Keep-alive connections kept open per host
+POOL_SIZE = 10
+
+
+_session: Optional["requests.Session"] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> "requests.Session":
+    """
+    Return the process-wide session, creating it the first time.
+    """
+    global _session
+
+    session = _session
+    if session is not None:
+        return session
+
+    with _session_lock:
+        if _session is None:
+            import requests #type: ignore
+            from requests.adapters import HTTPAdapter #type: ignore
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+
+        return _session
+
+
+def reset_session():
+    """
+    Close the shared session (a new one is created on next use).
+    """
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def _after_fork_in_child():
+    # The pooled connections belong to the parent - never share sockets
+    # between processes, just start a new session
+    global _session, _session_lock
+
+    _session = None
+    _session_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,204 @@
+"""
+Spans - timing blocks of code inside a tracked function.
+
+    @analytics_hit_decorator(page_location="my_tool")
+    def run_tool():
+        with ga4py.span("load_data"):
+            ...
+        with ga4py.span("build_report"):
+            with ga4py.span("charts"):
+                ...
+
+Spans aren't sent as hits of their own. Each tracked call starts an
+invocation (held in a context variable, so it follows the call through
+nested functions and into asyncio tasks it starts) and every span inside it
+adds its duration to the invocation. The totals are added to the call's end
+(or error) hit as "span_<name>_ms" - nested spans are named after their
+parents, e.g. "span_build_report_charts_ms" - along with "span_count", the
+number of spans recorded. Repeated spans with the same name are added
+together. Only the MAX_SPAN_PARAMETERS slowest spans are sent so a loop full
+of spans can't flood GA4.
+
+Spans outside a tracked function still time their block (span.duration_ms)
+but aren't sent anywhere.
+"""
+
+
+import time
+import threading
+import contextvars
+from typing import Dict, Optional
+
+from ga4py.encoding import encode_name
+
+
+MAX_SPAN_PARAMETERS = 5
+
+
+class Invocation:
+    """
+    Span totals for one tracked call.
+    """
+
+    __slots__ = ("_totals", "_count", "_lock")
+
+    def __init__(self):
+        self._totals: Dict[str, float] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, path: str, duration: float):
+        with self._lock:
+            self._totals[path] = self._totals.get(path, 0.0) + duration
+            self._count += 1
+
+    def parameters(self) -> Dict:
+        """
+        The span parameters to add to the call's end hit (empty if no spans
+        were recorded).
+        """
+
+        with self._lock:
+            if not self._count:
+                return {}
+
+            slowest = sorted(self._totals.items(), key=lambda item: -item[1])
+            parameters = {
+                encode_name(f"span_{path}_ms"): round(total * 1000, 3)
+                for path, total in slowest[:MAX_SPAN_PARAMETERS]
+            }
+            parameters["span_count"] = self._count
+
+        return parameters
+
+
+# The innermost open span, or the invocation of the tracked call we're in
+_current: contextvars.ContextVar = contextvars.ContextVar("ga4py_span", default=None)
+
+
+def start_invocation(invocation: Optional[Invocation] = None):
+    """
+    Start collecting spans for a tracked call (used by the decorator).
+
+    Parameters:
+    - invocation (Invocation - optional): [default None] carry on collecting
+                                          into this one - a tracked generator
+                                          starts its invocation again for
+                                          each step, as the steps can run in
+                                          different contexts
+
+    Returns:
+    - token: pass to finish_invocation (or abandon_invocation)
+    """
+
+    return _current.set(invocation if invocation is not None else Invocation())
+
+
+def current_span() -> Optional["Span"]:
+    """
+    The innermost open span, or None if we're not inside one.
+    """
+
+    current = _current.get()
+    return current if isinstance(current, Span) else None
+
+
+def finish_invocation(token) -> Dict:
+    """
+    Stop collecting spans for a tracked call.
+
+    Returns:
+    - parameters (dictionary): span parameters for the end/error hit
+    """
+
+    invocation = _current.get()
+    _current.reset(token)
+
+    if isinstance(invocation, Invocation):
+        return invocation.parameters()
+    return {}
+
+
+def abandon_invocation(token):
+    """
+    Stop collecting spans for a tracked call which never reached
+    finish_invocation (e.g. a cancelled coroutine or a KeyboardInterrupt), so
+    later spans in this context don't attach to the dead call. Does nothing
+    if finish_invocation has already run.
+    """
+
+    if token is None:
+        return
+
+    try:
+        _current.reset(token)
+    except RuntimeError:
+        # Already reset by finish_invocation
+        pass
+
+
+class Span:
+    """
+    Times one block of code - use ga4py.span(name) to create one.
+
+    Attributes:
+    - name (string)
+    - path (string): the names of the enclosing spans and this one, joined with "_"
+    - duration_ms (float - or None until the block has finished)
+    """
+
+    __slots__ = ("name", "path", "duration_ms", "_invocation", "_token", "_started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = name
+        self.duration_ms: Optional[float] = None
+        self._invocation: Optional[Invocation] = None
+        self._token = None
+        self._started = 0.0
+
+    def __enter__(self) -> "Span":
+        parent = _current.get()
+
+        if isinstance(parent, Span):
+            self.path = f"{parent.path}_{self.name}"
+            self._invocation = parent._invocation
+        elif isinstance(parent, Invocation):
+            self._invocation = parent
+
+        self._token = _current.set(self)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._started
+        self.duration_ms = round(duration * 1000, 3)
+
+        _current.reset(self._token)
+        self._token = None
+
+        if self._invocation is not None:
+            self._invocation.record(self.path, duration)
+
+        # Never swallow the block's exception
+        return False
+
+    async def __aenter__(self) -> "Span":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return self.__exit__(exc_type, exc_value, traceback)
+
+
+def span(name: str) -> Span:
+    """
+    Time a block of code as part of the tracked function it runs in.
+
+    Parameters:
+    - name (string): name for the block, used in the "span_<name>_ms" parameter
+
+    Returns:
+    - span (Span): a context manager (with or async with)
+    """
+
+    return Span(name)
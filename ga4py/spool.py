@@ -0,0 +1,313 @@
+"""
+Durable on-disk spool for hits which couldn't be delivered.
+
+If GA4_SPOOL_DIR is set, events which fail to send (or which are sent with
+dispatch_mode "spool" on machines with no network) are appended to a local
+file instead of being lost. Each line is one compact JSON record (written
+with the "file" transport, see ga4py/transports.py):
+
+    {"m": measurement id, "c": client id, "e": [events]}
+
+The API secret is never written to disk - replay uses GA4_CLI_SEC.
+
+The current file is rotated once it goes over GA4_SPOOL_MAX_BYTES (default
+10MB). Spooled hits are sent later with:
+
+    python -m ga4py replay
+
+which drains the spool files concurrently in batches of up to 25 events and
+records its progress in a checkpoint file next to each spool file, so an
+interrupted replay picks up where it left off.
+"""
+
+
+import os
+import json
+import glob
+import threading
+import time
+from typing import Dict, List, Optional
+
+import ga4py.config as config
+import ga4py.metrics as metrics
+import ga4py.transports as transports
+from ga4py.batching import MAX_EVENTS_PER_REQUEST, MAX_PAYLOAD_BYTES
+
+
+SPOOL_FILE_NAME = "ga4py-spool.ndjson"
+ROTATED_PATTERN = "ga4py-spool-*.ndjson"
+CHECKPOINT_SUFFIX = ".offset"
+
+_write_lock = threading.Lock()
+
+
+def spool_events(gtag_tracker, events: List[Dict], spool_dir: Optional[str] = None) -> bool:
+    """
+    Append events to the spool so they can be replayed later.
+
+    This never raises - if the spool isn't configured or can't be written we
+    just report that nothing was spooled.
+
+    Parameters:
+    - gtag_tracker (tracker object): the tracker the events were sent with
+    - events (list): the events to keep
+    - spool_dir (string - optional): [default GA4_SPOOL_DIR] folder to write to
+
+    Returns:
+    - spooled (bool)
+    """
+
+    env_config = config.get_config()
+    spool_dir = spool_dir or env_config.spool_dir
+    if not spool_dir:
+        return False
+
+    try:
+        with _write_lock:
+            # Single O_APPEND write so records from different processes
+            # don't interleave
+            size = transports.FileTransport(
+                os.path.join(spool_dir, SPOOL_FILE_NAME)
+            ).write_record(gtag_tracker, events)
+
+            if size >= env_config.spool_max_bytes:
+                rotate(spool_dir)
+
+    except Exception:
+        return False
+
+    metrics.increment("events_spooled", len(events))
+    return True
+
+
+def keep_unsent(gtag_tracker, events: List[Dict], reason: str) -> bool:
+    """
+    Spool events which couldn't be sent, counting them as dropped (see
+    ga4py/metrics.py) if they couldn't be spooled either.
+
+    Parameters:
+    - gtag_tracker (tracker object): the tracker the events were sent with
+    - events (list): the events which weren't sent
+    - reason (string): why they weren't sent - "circuit_open" or "send_failed"
+
+    Returns:
+    - spooled (bool)
+    """
+
+    if spool_events(gtag_tracker, events):
+        return True
+
+    metrics.increment("events_dropped", len(events), reason)
+    return False
+
+
+def rotate(spool_dir: str) -> Optional[str]:
+    """
+    Move the current spool file aside so new records go to a fresh file.
+
+    Returns:
+    - path (string - or None if there was nothing to rotate)
+    """
+
+    current = os.path.join(spool_dir, SPOOL_FILE_NAME)
+    if not os.path.exists(current) or os.path.getsize(current) == 0:
+        return None
+
+    rotated = os.path.join(spool_dir, f"ga4py-spool-{time.time_ns()}.ndjson")
+    os.replace(current, rotated)
+    return rotated
+
+
+def spool_files(spool_dir: str) -> List[str]:
+    """
+    Rotated spool files waiting to be replayed, oldest first.
+    """
+    return sorted(glob.glob(os.path.join(spool_dir, ROTATED_PATTERN)))
+
+
+def replay(
+        spool_dir: Optional[str] = None,
+        api_secret: Optional[str] = None,
+        workers: int = 4,
+        batch_size: int = MAX_EVENTS_PER_REQUEST,
+        logging_level: str = "all",
+        transport="http"
+        ) -> Dict[str, int]:
+    """
+    Send everything in the spool to GA4.
+
+    The current spool file is rotated first so new hits aren't mixed in, then
+    each spool file is replayed on its own worker thread. Files which are
+    fully sent are deleted, files which hit an error are left (with their
+    checkpoint) for the next replay.
+
+    Parameters:
+    - spool_dir (string - optional): [default GA4_SPOOL_DIR]
+    - api_secret (string - optional): [default GA4_CLI_SEC]
+    - workers (int - optional): [default 4] files replayed at once
+    - batch_size (int - optional): [default 25] events per request
+    - logging_level (string - optional): [default "all"]
+    - transport (string or Transport - optional): [default "http"] where to
+                                                    send the spooled hits
+
+    Returns:
+    - totals (dictionary): counts of files, sent events, sent requests,
+                            skipped (unreadable) records and failed files
+    """
+
+    env_config = config.get_config()
+    spool_dir = spool_dir or env_config.spool_dir
+    api_secret = api_secret or env_config.api_secret
+
+    totals = {"files": 0, "events": 0, "requests": 0, "skipped": 0, "failed": 0}
+
+    if not spool_dir or not os.path.isdir(spool_dir):
+        if logging_level in ["error", "all"]:
+            print("No spool folder found - set GA4_SPOOL_DIR or pass a folder")
+        return totals
+
+    if api_secret == "None":
+        if logging_level in ["error", "all"]:
+            print("No GA4 API secret - set GA4_CLI_SEC to replay spooled hits")
+        return totals
+
+    with _write_lock:
+        rotate(spool_dir)
+
+    files = spool_files(spool_dir)
+    batch_size = max(1, min(batch_size, MAX_EVENTS_PER_REQUEST))
+    transport = transports.get_transport(transport)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = executor.map(
+            lambda path: _replay_file(path, api_secret, batch_size, logging_level, transport),
+            files
+        )
+
+        for result in results:
+            totals["files"] += 1
+            for key, value in result.items():
+                totals[key] += value
+
+    if logging_level == "all":
+        print(f"Replayed spool: {totals}")
+
+    return totals
+
+
+def _replay_file(
+        path: str,
+        api_secret: str,
+        batch_size: int,
+        logging_level: str,
+        transport
+        ) -> Dict[str, int]:
+    """
+    Replay one spool file from its checkpoint onwards.
+
+    Consecutive records for the same measurement id and client id are
+    grouped into requests of up to batch_size events. The checkpoint is only
+    moved on once a request has been accepted, so a record is never skipped
+    (a crash mid-request can mean it is sent twice).
+    """
+
+    from ga4py.tracker_registry import PooledGtagMP
+
+    counts = {"events": 0, "requests": 0, "skipped": 0, "failed": 0}
+    trackers: Dict = {}
+
+    pending_key = None
+    pending_events: List[Dict] = []
+    pending_size = 0
+
+    def send_pending(end_offset):
+        nonlocal pending_events, pending_size
+
+        if pending_events:
+            gtag_tracker = trackers.get(pending_key)
+            if gtag_tracker is None:
+                gtag_tracker = trackers[pending_key] = PooledGtagMP(
+                    api_secret=api_secret,
+                    measurement_id=pending_key[0],
+                    client_id=pending_key[1],
+                )
+
+            transport.send(gtag_tracker, pending_events)
+            counts["events"] += len(pending_events)
+            counts["requests"] += 1
+
+        _write_checkpoint(path, end_offset)
+        pending_events = []
+        pending_size = 0
+
+    try:
+        with open(path, "rb") as spool_file:
+            offset = _read_checkpoint(path)
+            spool_file.seek(offset)
+
+            for line in iter(spool_file.readline, b""):
+                line_start = offset
+                offset += len(line)
+
+                try:
+                    record = json.loads(line)
+                    key = (record["m"], record["c"])
+                    events = record["e"]
+                    size = len(line)
+                except Exception:
+                    # Half-written or corrupt record - nothing we can send
+                    counts["skipped"] += 1
+                    continue
+
+                if pending_events and (
+                    key != pending_key
+                    or len(pending_events) + len(events) > batch_size
+                    or pending_size + size > MAX_PAYLOAD_BYTES
+                ):
+                    send_pending(line_start)
+
+                pending_key = key
+                pending_events.extend(events)
+                pending_size += size
+
+            send_pending(offset)
+
+    except Exception as e:
+        counts["failed"] += 1
+        if logging_level in ["error", "all"]:
+            print(f"Failed to replay {path}: {e!r} (will resume from checkpoint)")
+        return counts
+
+    # Everything in the file has been sent
+    os.remove(path)
+    if os.path.exists(path + CHECKPOINT_SUFFIX):
+        os.remove(path + CHECKPOINT_SUFFIX)
+
+    return counts
+
+
+def _read_checkpoint(path: str) -> int:
+    try:
+        with open(path + CHECKPOINT_SUFFIX) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_checkpoint(path: str, offset: int):
+    # Write then rename so a crash can't leave a half-written checkpoint
+    temp_path = path + CHECKPOINT_SUFFIX + ".tmp"
+    with open(temp_path, "w") as checkpoint:
+        checkpoint.write(str(offset))
+    os.replace(temp_path, path + CHECKPOINT_SUFFIX)
+
+
+def _after_fork_in_child():
+    global _write_lock
+    _write_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
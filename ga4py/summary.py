@@ -0,0 +1,177 @@
+"""
+Aggregated summary mode for functions which are called very often.
+
+Rather than sending start/end hits for every call, each call is recorded
+locally (count, errors by exception type and a compact duration histogram)
+and a single "summary" hit is sent per function every summary_interval
+seconds. Summaries are sent by the first call after the interval is up, and
+any unsent summary is sent when the interpreter exits.
+
+The histogram uses logarithmic buckets which are about 5% wide, so the
+percentiles in the summary are accurate to within about 5% while the
+histogram itself stays small however many calls are recorded.
+"""
+
+
+import os
+import math
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+
+# Each bucket is this much wider than the one below it
+BUCKET_GROWTH = 1.05
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+DEFAULT_INTERVAL = 60.0
+
+# Error type counts are sent as "TypeA:3,TypeB:1" and GA4 limits how long
+# parameter values can be
+MAX_ERROR_TYPES_LENGTH = 100
+
+
+_summaries: "weakref.WeakSet[CallSummary]" = weakref.WeakSet()
+
+
+class CallSummary:
+    """
+    Running summary of calls to one function since the last summary hit.
+    """
+
+    def __init__(self, func_name: str):
+        self.func_name = func_name
+        self.last_plan = None # Plan to send the at-exit summary with
+        self._lock = threading.Lock()
+        self._reset(time.monotonic())
+
+        _summaries.add(self)
+
+    def _after_fork(self):
+        # The counts so far are the parent's to report
+        self._lock = threading.Lock()
+        self.last_plan = None
+        self._reset(time.monotonic())
+
+    def _reset(self, now: float):
+        self._window_start = now
+        self._calls = 0
+        self._errors: Dict[str, int] = {}
+        self._buckets: Dict[int, int] = {}
+        self._max = 0.0
+
+    def record(self, plan, duration: float, error: Optional[BaseException] = None) -> Optional[Dict]:
+        """
+        Record one call.
+
+        Parameters:
+        - plan (TrackingPlan): the plan for the call (gives the interval)
+        - duration (float): how long the call took in seconds
+        - error (exception - optional): [default None] the error the call raised
+
+        Returns:
+        - summary (dictionary - or None): the summary parameters to send if
+                                            the interval is up
+        """
+
+        with self._lock:
+            self.last_plan = plan
+            self._calls += 1
+
+            if error is not None:
+                error_type = type(error).__name__
+                self._errors[error_type] = self._errors.get(error_type, 0) + 1
+
+            bucket = _bucket(duration)
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+            if duration > self._max:
+                self._max = duration
+
+            now = time.monotonic()
+            if now - self._window_start < plan.summary_interval:
+                return None
+
+            return self._take(now)
+
+    def take(self) -> Optional[Dict]:
+        """
+        Return the summary parameters for whatever has been recorded and
+        start a new interval (None if nothing has been recorded).
+        """
+
+        with self._lock:
+            if not self._calls:
+                return None
+            return self._take(time.monotonic())
+
+    def _take(self, now: float) -> Dict:
+        percentiles = _percentiles(self._buckets, self._calls, (50, 95, 99))
+
+        error_types = ",".join(
+            f"{name}:{count}"
+            for name, count in sorted(self._errors.items(), key=lambda item: -item[1])
+        )
+
+        summary = {
+            "calls": self._calls,
+            "errors": sum(self._errors.values()),
+            "error_types": error_types[:MAX_ERROR_TYPES_LENGTH],
+            "p50_ms": round(min(percentiles[50], self._max) * 1000, 3),
+            "p95_ms": round(min(percentiles[95], self._max) * 1000, 3),
+            "p99_ms": round(min(percentiles[99], self._max) * 1000, 3),
+            "max_ms": round(self._max * 1000, 3),
+            "interval_s": round(now - self._window_start, 1),
+        }
+
+        self._reset(now)
+        return summary
+
+
+def all_summaries():
+    """
+    Every live CallSummary (used to send what's left at exit).
+    """
+    return list(_summaries)
+
+
+def _bucket(duration: float) -> int:
+    # Durations are bucketed in microseconds, anything under 1us is bucket 0
+    micros = duration * 1e6
+    if micros <= 1:
+        return 0
+    return math.ceil(math.log(micros) / _LOG_GROWTH)
+
+
+def _bucket_upper_bound(bucket: int) -> float:
+    # Upper edge of the bucket, in seconds
+    return (BUCKET_GROWTH ** bucket) / 1e6
+
+
+def _percentiles(buckets: Dict[int, int], total: int, wanted) -> Dict[int, float]:
+    """
+    Estimate percentiles (in seconds) from a bucket histogram.
+    """
+
+    results = {}
+    targets = sorted(wanted)
+    seen = 0
+
+    for bucket in sorted(buckets):
+        seen += buckets[bucket]
+        while targets and seen >= math.ceil(total * targets[0] / 100):
+            results[targets.pop(0)] = _bucket_upper_bound(bucket)
+
+    for target in targets:
+        results[target] = _bucket_upper_bound(max(buckets)) if buckets else 0.0
+
+    return results
+
+
+def _after_fork_in_child():
+    for summary in list(_summaries):
+        summary._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,284 @@
+"""
+Process-wide registry of GA4 trackers.
+
+Instead of building a new GtagMP (and a new random client id) for every
+tracked call, one tracker is created per measurement id and shared by every
+call in the process. The trackers send through the pooled session in
+ga4py/sessions.py rather than opening a new connection for each request.
+Hits sent inside ga4py.tracking_context(client_id=...) use a tracker for that
+client id instead (see ga4py/context.py).
+
+ga4mp (and requests) take a while to import, so the shared trackers are
+light SharedTracker objects which only import them and build their GtagMP
+the first time they actually send something - usually on the background
+worker thread. Tracking that never sends (testing mode, the memory, file and
+null transports, no credentials) never imports them at all.
+"""
+
+
+import os
+import time
+import random
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import ga4py.sessions as sessions
+
+
+_pooled_class = None
+_class_lock = threading.Lock()
+
+
+def pooled_gtag_class():
+    """
+    Return the PooledGtagMP class, importing ga4mp and creating the class
+    the first time it is needed.
+    """
+    global _pooled_class
+
+    if _pooled_class is not None:
+        return _pooled_class
+
+    with _class_lock:
+        if _pooled_class is None:
+            _pooled_class = _create_pooled_class()
+        return _pooled_class
+
+
+def _create_pooled_class():
+    import json
+    from ga4mp import GtagMP # type: ignore
+
+    class PooledGtagMP(GtagMP):
+        """
+        GtagMP which sends its requests through the shared keep-alive session and
+        is safe to use from several threads at once.
+        """
+
+        def __init__(self, api_secret, measurement_id, client_id):
+            super().__init__(
+                api_secret=api_secret,
+                measurement_id=measurement_id,
+                client_id=client_id,
+            )
+            self._lock = threading.Lock()
+
+        def _add_session_id_and_engagement_time(self, events):
+            # This reads and updates the tracker's session store, so only one
+            # thread can do it at a time
+            with self._lock:
+                super()._add_session_id_and_engagement_time(events)
+
+        def _http_post(self, batched_event_list, validation_hit=False, postpone=False, date=None):
+            """
+            Same behaviour as GtagMP._http_post, but using the shared session.
+            """
+
+            self._check_date_not_in_future(date)
+            status_code = None
+
+            domain = self._base_domain
+            if validation_hit is True:
+                domain = self._validation_domain
+
+            url = self._build_url(domain=domain)
+            session = sessions.get_session()
+
+            for batch in batched_event_list:
+                request = self._build_request(batch=batch)
+                self._add_user_props_to_hit(request)
+
+                # make adjustments for postponed hit
+                if postpone:
+                    request["events"] = {"name": batch["name"], "params": batch["params"]}
+                    request["timestamp_micros"] = batch["_timestamp_micros"]
+
+                if date is not None:
+                    ts = self._datetime_to_timestamp(date)
+                    request["timestamp_micros"] = int(self._get_timestamp(ts))
+
+                response = session.post(
+                    url,
+                    data=json.dumps(request).encode("utf-8"),
+                    headers={"Content-Type": "application/json; charset=utf-8"},
+                    timeout=sessions.DEFAULT_TIMEOUT,
+                )
+                # Fail the same way urllib would for a bad status
+                response.raise_for_status()
+                status_code = response.status_code
+
+            return status_code
+
+    return PooledGtagMP
+
+
+def __getattr__(name):
+    # "from ga4py.tracker_registry import PooledGtagMP" still works, it just
+    # imports ga4mp at that point
+    if name == "PooledGtagMP":
+        return pooled_gtag_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class SharedTracker:
+    """
+    The tracker shared by every call for one measurement id.
+
+    It has the measurement id and client id straight away (which is all
+    building, batching, spooling and forwarding hits need) and creates the
+    PooledGtagMP which actually sends on its first send.
+
+    assigned_client_id is True for trackers whose client id was set with
+    ga4py.tracking_context rather than chosen at random.
+    """
+
+    def __init__(self, api_secret: str, measurement_id: str, client_id: str,
+                 assigned_client_id: bool = False):
+        self.api_secret = api_secret
+        self.measurement_id = measurement_id
+        self.client_id = client_id
+        self.assigned_client_id = assigned_client_id
+        self._gtag = None
+        self._endpoint: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def gtag(self):
+        """
+        The PooledGtagMP used to send (created the first time).
+        """
+
+        gtag = self._gtag
+        if gtag is not None:
+            return gtag
+
+        with self._lock:
+            if self._gtag is None:
+                gtag = pooled_gtag_class()(
+                    api_secret=self.api_secret,
+                    measurement_id=self.measurement_id,
+                    client_id=self.client_id,
+                )
+                if self._endpoint is not None:
+                    gtag._base_domain = self._endpoint
+                self._gtag = gtag
+
+            return self._gtag
+
+    def set_endpoint(self, url: str):
+        """
+        Send to a different Measurement Protocol endpoint (e.g. a local stub
+        server) rather than GA4.
+        """
+
+        with self._lock:
+            self._endpoint = url
+            if self._gtag is not None:
+                self._gtag._base_domain = url
+
+    # Code which pointed GtagMP trackers somewhere else keeps working
+    _base_domain = property(
+        lambda self: self._endpoint if self._gtag is None else self._gtag._base_domain,
+        set_endpoint,
+    )
+
+    def create_new_event(self, name: str) -> Dict:
+        # Same shape as a ga4mp Event, without needing ga4mp
+        return {"name": name}
+
+    def send(self, events):
+        self.gtag().send(events=events)
+
+
+def random_client_id() -> str:
+    """
+    A client id in the usual GA format (the same as GtagMP.random_client_id):
+    10 random digits and the UNIX timestamp in seconds, joined by a period.
+    """
+    return "%0.10d" % random.randint(0, 9999999999) + "." + str(int(time.time()))
+
+
+_trackers: Dict[Tuple[str, str, Optional[str]], SharedTracker] = {}
+_trackers_lock = threading.Lock()
+
+# Trackers for client ids set with ga4py.tracking_context are kept for this
+# many client ids, oldest forgotten first (a forgotten one is just created
+# again if that client comes back)
+MAX_CLIENT_TRACKERS = 1000
+_client_keys: Deque[Tuple[str, str, Optional[str]]] = deque()
+
+
+def get_tracker(api_secret: str, measurement_id: str, client_id: Optional[str] = None) -> SharedTracker:
+    """
+    Return the shared tracker for a measurement id, creating it (with a
+    random client id) the first time it is asked for.
+
+    Looking up an existing tracker doesn't take a lock, so many threads can
+    track at once without waiting on each other.
+
+    Parameters:
+    - api_secret (string): GA4 API secret
+    - measurement_id (string): GA4 measurement id
+    - client_id (string - optional): [default None] send with this client id
+                                    rather than the process-wide random one
+
+    Returns:
+    - gtag_tracker (SharedTracker)
+    """
+
+    key = (measurement_id, api_secret, client_id)
+
+    gtag_tracker = _trackers.get(key)
+    if gtag_tracker is not None:
+        return gtag_tracker
+
+    with _trackers_lock:
+        gtag_tracker = _trackers.get(key)
+        if gtag_tracker is None:
+            if client_id is None:
+                # Create a random client id
+                # (for now - may come up with a better use for users in future)
+                gtag_tracker = SharedTracker(
+                    api_secret=api_secret,
+                    measurement_id=measurement_id,
+                    client_id=random_client_id(),
+                )
+            else:
+                gtag_tracker = SharedTracker(
+                    api_secret=api_secret,
+                    measurement_id=measurement_id,
+                    client_id=client_id,
+                    assigned_client_id=True,
+                )
+
+                _client_keys.append(key)
+                if len(_client_keys) > MAX_CLIENT_TRACKERS:
+                    _trackers.pop(_client_keys.popleft(), None)
+
+            _trackers[key] = gtag_tracker
+
+        return gtag_tracker
+
+
+def reset_trackers():
+    """
+    Forget every shared tracker (new ones are created on next use).
+    """
+
+    with _trackers_lock:
+        _trackers.clear()
+        _client_keys.clear()
+
+
+def _after_fork_in_child():
+    # Trackers hold locks which may have been held at the time of the fork
+    global _trackers_lock, _class_lock
+
+    _trackers.clear()
+    _client_keys.clear()
+    _trackers_lock = threading.Lock()
+    _class_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
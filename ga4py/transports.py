@@ -0,0 +1,274 @@
+"""
+Transports - where tracking hits are actually sent.
+
+Every send (inline, background batches, async wrappers, process pool
+collectors and spool replay) ends with a transport's send(). The built in
+transports are:
+
+- "http": send to GA4 with the tracker (the default)
+- "memory": keep the events in memory, for tests - nothing leaves the process
+- "file": append each request to a newline-delimited JSON file
+  (GA4_TRANSPORT_FILE, default ga4py-events.ndjson) in the same format as
+  the spool, so the file can be replayed to GA4 later
+- "null": throw the events away (useful to measure the library's own cost)
+
+The transport is chosen with the GA4_TRANSPORT environment variable, or per
+function with {transport: "memory"} in the decorator arguments. A Transport
+object can be passed instead of a name, and register_transport() adds new
+names.
+"""
+
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Union
+
+import ga4py.config as config
+import ga4py.metrics as metrics
+from ga4py.batching import stamp_events
+
+
+class Transport:
+    """
+    Base class for transports. Subclasses implement _send().
+
+    Attributes:
+    - name (string)
+    - needs_credentials (bool): False if hits can be sent without
+                                GA4_CLI_SEC/GA4_MID being set
+    - sent_requests (int): successful send() calls
+    - sent_events (int): events in those calls
+    """
+
+    name = "transport"
+    needs_credentials = False
+
+    def __init__(self):
+        self.sent_requests = 0
+        self.sent_events = 0
+        self._count_lock = threading.Lock()
+
+    def send(self, gtag_tracker, events: List[Dict]):
+        """
+        Send one request's worth of events. Raises if the send failed.
+
+        Parameters:
+        - gtag_tracker (tracker object): gives the measurement id and client id
+        - events (list): the events to send
+        """
+
+        started = time.perf_counter()
+
+        try:
+            self._send(gtag_tracker, events)
+        except Exception:
+            metrics.increment("requests_failed", label=self.name)
+            raise
+        finally:
+            metrics.observe("send_seconds", time.perf_counter() - started, self.name)
+
+        metrics.increment("requests_sent", label=self.name)
+        metrics.increment("events_sent", len(events), self.name)
+
+        with self._count_lock:
+            self.sent_requests += 1
+            self.sent_events += len(events)
+
+    def _send(self, gtag_tracker, events: List[Dict]):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name!r}>"
+
+
+class HttpTransport(Transport):
+    """
+    Send events to GA4 with the tracker's own send (through the shared
+    keep-alive session for shared trackers).
+    """
+
+    name = "http"
+    needs_credentials = True
+
+    def _send(self, gtag_tracker, events: List[Dict]):
+        gtag_tracker.send(events=events)
+
+
+class MemoryTransport(Transport):
+    """
+    Keep sent requests in memory so tests can check them.
+
+    Parameters:
+    - max_requests (int - optional): [default 10000] oldest requests are
+                                        forgotten after this many
+    """
+
+    name = "memory"
+
+    def __init__(self, max_requests: int = 10000):
+        super().__init__()
+        self._requests = deque(maxlen=max_requests)
+
+    def _send(self, gtag_tracker, events: List[Dict]):
+        self._requests.append({
+            "measurement_id": getattr(gtag_tracker, "measurement_id", None),
+            "client_id": getattr(gtag_tracker, "client_id", None),
+            "events": list(events),
+        })
+
+    @property
+    def requests(self) -> List[Dict]:
+        """
+        Every request kept, oldest first.
+        """
+        return list(self._requests)
+
+    @property
+    def events(self) -> List[Dict]:
+        """
+        Every event kept, oldest first.
+        """
+        return [event for request in list(self._requests) for event in request["events"]]
+
+    def clear(self):
+        self._requests.clear()
+
+
+class FileTransport(Transport):
+    """
+    Append each request to a newline-delimited JSON file as
+    {"m": measurement id, "c": client id, "e": [events]}.
+
+    Each record is a single O_APPEND write so several threads or processes
+    can share the file without records interleaving.
+
+    Parameters:
+    - path (string - optional): [default GA4_TRANSPORT_FILE]
+    """
+
+    name = "file"
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__()
+        self.path = path
+
+    def _send(self, gtag_tracker, events: List[Dict]):
+        self.write_record(gtag_tracker, events)
+
+    def write_record(self, gtag_tracker, events: List[Dict]) -> int:
+        """
+        Write one record.
+
+        Returns:
+        - size (int): size of the file after the write
+        """
+
+        path = self.path or config.get_config().transport_file
+
+        record = {
+            "m": gtag_tracker.measurement_id,
+            "c": gtag_tracker.client_id,
+            "e": stamp_events(list(events)),
+        }
+        line = (json.dumps(record, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            os.write(fd, line)
+            return os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+
+class NullTransport(Transport):
+    """
+    Accept and discard every event.
+    """
+
+    name = "null"
+
+    def _send(self, gtag_tracker, events: List[Dict]):
+        pass
+
+
+TRANSPORT_CLASSES = {
+    "http": HttpTransport,
+    "memory": MemoryTransport,
+    "file": FileTransport,
+    "null": NullTransport,
+}
+
+_transports: Dict[str, Transport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(transport: Union[str, Transport, None] = None) -> Transport:
+    """
+    Return the transport to send with.
+
+    Parameters:
+    - transport (string, Transport or None): a transport name, a Transport
+                                            (returned as it is) or None for
+                                            GA4_TRANSPORT (default "http")
+
+    Returns:
+    - transport (Transport): one shared instance per name
+    """
+
+    if isinstance(transport, Transport):
+        return transport
+
+    name = transport or config.get_config().transport
+
+    instance = _transports.get(name)
+    if instance is not None:
+        return instance
+
+    with _transports_lock:
+        instance = _transports.get(name)
+        if instance is None:
+            transport_class = TRANSPORT_CLASSES.get(name)
+            if transport_class is None:
+                raise ValueError(
+                    f"Unknown transport {name!r} - expected one of {sorted(TRANSPORT_CLASSES)}"
+                )
+            instance = _transports[name] = transport_class()
+
+        return instance
+
+
+def register_transport(name: str, transport: Transport):
+    """
+    Make a transport available by name (e.g. for GA4_TRANSPORT).
+    """
+
+    with _transports_lock:
+        _transports[name] = transport
+
+
+def reset_transports():
+    """
+    Forget the shared transports (new ones are created on next use).
+    """
+
+    with _transports_lock:
+        _transports.clear()
+
+
+def _after_fork_in_child():
+    global _transports_lock
+    _transports_lock = threading.Lock()
+
+    for transport in list(_transports.values()):
+        transport._count_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,27 @@
+import pytest
+
+import ga4py.add_tracker as add_tracker
+
+
+@pytest.fixture
+def recorded_hits(request, monkeypatch):
+    """
+    Replace send_hit with a recorder for the whole test - nothing is sent,
+    the keyword arguments of each hit are appended to the list returned.
+
+    unittest test cases use it with @pytest.mark.usefixtures("recorded_hits")
+    and find the list in self.sent.
+    """
+
+    sent = []
+
+    def recording_send_hit(**kwargs):
+        sent.append(kwargs)
+        return None, True
+
+    monkeypatch.setattr(add_tracker, "send_hit", recording_send_hit)
+
+    if request.instance is not None:
+        request.instance.sent = sent
+
+    return sent
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import unittest
+from unittest import mock
+
+import ga4py.alerts as alerts
+import ga4py.config as config
+from ga4py.alerts import AlertChannel
+from ga4py.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class RecordingPost:
+    def __init__(self, status_code=200, delay=0):
+        self.status_code = status_code
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, url, data, timeout):
+        time.sleep(self.delay)
+        self.calls.append(json.loads(data))
+        return FakeResponse(self.status_code)
+
+
+class TestAlertChannel(unittest.TestCase):
+
+    def test_submit_does_not_wait_for_endpoint(self):
+        post = RecordingPost(delay=0.5)
+        channel = AlertChannel("http://alerts", digest_interval=0, post=post)
+
+        started = time.perf_counter()
+        channel.submit("'boom'", "send_hit", "{}")
+        self.assertLess(time.perf_counter() - started, 0.1)
+
+        self.assertTrue(channel.flush(timeout=5))
+        self.assertEqual(len(post.calls), 1)
+
+    def test_alerts_are_coalesced_into_digest(self):
+        post = RecordingPost()
+        channel = AlertChannel("http://alerts", digest_interval=60, post=post)
+
+        channel.submit("'No page location set'", "my_function", "{}")
+        channel.submit("'No page location set'", "my_function", "{}")
+        channel.submit("'Too many parameters'", "my_function", "{}")
+
+        self.assertTrue(channel.flush(timeout=5))
+
+        self.assertEqual(len(post.calls), 1)
+        self.assertIn("3 tracking errors", post.calls[0]["subject"])
+        self.assertIn("Count: 2", post.calls[0]["body"])
+
+    def test_queue_is_bounded(self):
+        channel = AlertChannel("http://alerts", digest_interval=60, max_alerts=2, post=RecordingPost())
+
+        for i in range(5):
+            channel.submit(f"'error {i}'", "my_function", "{}")
+
+        self.assertEqual(channel.dropped_alerts, 3)
+        channel.flush(timeout=5)
+
+    def test_breaker_stops_contacting_failing_endpoint(self):
+        post = RecordingPost(status_code=500)
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        channel = AlertChannel("http://alerts", digest_interval=0, breaker=breaker, post=post)
+
+        with mock.patch.object(alerts, "BACKOFF_BASE", 0):
+            channel.submit("'first'", "my_function", "{}")
+            channel.flush(timeout=5)
+            self.assertEqual(len(post.calls), alerts.MAX_ATTEMPTS)
+
+            channel.submit("'second'", "my_function", "{}")
+            channel.flush(timeout=5)
+
+        # Breaker is open so the second digest was never posted
+        self.assertEqual(len(post.calls), alerts.MAX_ATTEMPTS)
+        self.assertEqual(channel.dropped_alerts, 1)
+
+
+    def test_channel_settings_from_config(self):
+        settings = {
+            "GA4_ERROR_DIGEST_INTERVAL": "10",
+            "GA4_ERROR_TIMEOUT": "soon",
+            "GA4_ERROR_QUEUE_SIZE": "7",
+        }
+
+        with mock.patch.dict(os.environ, settings):
+            config.reload_config()
+            channel = alerts.get_channel("http://alerts-from-config")
+
+        config.reload_config()
+
+        self.assertEqual(channel.digest_interval, 10.0)
+        self.assertEqual(channel.timeout, 5.0)
+        self.assertEqual(channel.max_alerts, 7)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_half_open_close(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+        now[0] = 10
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow()) # Only one probe at a time
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_failed_probe_reopens(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        now[0] = 10
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, OPEN)
@@ -0,0 +1,54 @@
+import unittest
+
+import requests
+
+from benchmarks import bench_overhead
+from benchmarks.stub_server import StubServer
+
+
+class TestStubServer(unittest.TestCase):
+
+    def test_failure_rate_and_counts(self):
+        with StubServer(failure_rate=1.0) as server:
+            response = requests.post(server.collect_url, data=b'{"events": [{}, {}]}', timeout=5)
+            self.assertEqual(response.status_code, 500)
+
+            server.failure_rate = 0.0
+            response = requests.post(server.alert_url, data=b"{}", timeout=5)
+            self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(server.failures, 1)
+        self.assertEqual(server.events, 2)
+        self.assertEqual(server.alerts, 1)
+
+
+class TestOverheadBenchmark(unittest.TestCase):
+
+    def test_quick_run(self):
+        options = bench_overhead.parse_args([
+            "--calls", "20", "--threads", "2", "--latency-ms", "0",
+            "--scenario", "skip_stages", "--scenario", "inline",
+        ])
+        results = bench_overhead.run(options)
+
+        self.assertEqual([result["scenario"] for result in results], ["skip_stages", "inline"])
+        # Only the inline scenario talks to the (stub) server
+        self.assertEqual(results[0]["requests"], 0)
+        self.assertGreater(results[1]["requests"], 0)
+
+    def test_failing_scenario_keeps_sending(self):
+        options = bench_overhead.parse_args([
+            "--calls", "20", "--threads", "2", "--latency-ms", "0",
+            "--failure-rate", "1", "--scenario", "inline_failing",
+        ])
+        result, = bench_overhead.run(options)
+
+        # Every timed call tried its two sends - the breaker never got to
+        # stay open and turn the scenario into the open-breaker path
+        self.assertGreaterEqual(result["requests"], 2 * 20)
+        self.assertEqual(result["failures"], result["requests"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,223 @@
+import os
+import time
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import ga4py
+import ga4py.config as config
+import ga4py.context as context
+import ga4py.dispatcher as dispatcher
+import ga4py.tracker_registry as tracker_registry
+import ga4py.transports as transports
+from ga4py.add_tracker import analytics_hit_decorator
+
+
+class ContextTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {"GA4_DISPATCH_MODE": "inline"})
+        self.env.start()
+        config.reload_config()
+        tracker_registry.reset_trackers()
+        self.memory = transports.MemoryTransport()
+
+    def tearDown(self):
+        self.env.stop()
+        config.reload_config()
+        tracker_registry.reset_trackers()
+
+    def hits(self, stage):
+        return [
+            (request["client_id"], event["params"])
+            for request in self.memory.requests
+            for event in request["events"]
+            if event["params"]["stage"] == stage
+        ]
+
+
+class TestTrackingContext(ContextTestCase):
+
+    def test_client_id_and_parameters(self):
+
+        @analytics_hit_decorator(page_location="context_test", transport=self.memory)
+        def tool():
+            return 1
+
+        with ga4py.tracking_context(client_id="111.222", route="/report"):
+            with ga4py.tracking_context(user_type="admin"):
+                tool()
+        tool()
+
+        (client_id, params), (default_client_id, default_params) = self.hits("start")
+        self.assertEqual(client_id, "111.222")
+        self.assertEqual(params["route"], "/report")
+        self.assertEqual(params["user_type"], "admin")
+
+        self.assertNotEqual(default_client_id, "111.222")
+        self.assertNotIn("route", default_params)
+        self.assertEqual(context.current(), context.EMPTY_CONTEXT)
+
+    def test_invocation_ids_for_nested_calls(self):
+
+        @analytics_hit_decorator(page_location="inner", transport=self.memory, invocation_ids=True)
+        def inner():
+            pass
+
+        @analytics_hit_decorator(page_location="outer", transport=self.memory, invocation_ids=True)
+        def outer():
+            with ga4py.span("step"):
+                inner()
+
+        outer()
+
+        hits = {params["page_location"]: params for _, params in self.hits("end")}
+        self.assertEqual(hits["inner"]["parent_invocation_id"], hits["outer"]["invocation_id"])
+        self.assertEqual(hits["inner"]["parent_span"], "step")
+        self.assertNotIn("parent_invocation_id", hits["outer"])
+
+        # Start and end hits of a call share its id
+        starts = {params["page_location"]: params for _, params in self.hits("start")}
+        self.assertEqual(starts["outer"]["invocation_id"], hits["outer"]["invocation_id"])
+
+    def test_invocation_ids_off_by_default(self):
+
+        @analytics_hit_decorator(page_location="no_ids", transport=self.memory)
+        def tool():
+            pass
+
+        tool()
+
+        self.assertNotIn("invocation_id", self.hits("end")[0][1])
+
+
+class TestPropagation(ContextTestCase):
+
+    def test_concurrent_threads_keep_their_own_client_id(self):
+
+        @analytics_hit_decorator(page_location="threads", transport=self.memory)
+        def handle(request_number):
+            time.sleep(0.001)
+            return request_number
+
+        def request(request_number):
+            with ga4py.tracking_context(client_id=f"{request_number}.1", request=request_number):
+                return handle(request_number)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            self.assertEqual(list(pool.map(request, range(32))), list(range(32)))
+
+        end_hits = self.hits("end")
+        self.assertEqual(len(end_hits), 32)
+        for client_id, params in end_hits:
+            self.assertEqual(client_id, f"{params['request']}.1")
+
+    def test_wrap_and_submit_pass_the_context_to_other_threads(self):
+
+        @analytics_hit_decorator(page_location="worker", transport=self.memory, invocation_ids=True)
+        def work():
+            pass
+
+        @analytics_hit_decorator(page_location="parent", transport=self.memory, invocation_ids=True)
+        def parent():
+            thread = threading.Thread(target=context.wrap(work))
+            thread.start()
+            thread.join()
+
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                context.submit(pool, work).result()
+
+        with ga4py.tracking_context(client_id="333.444"):
+            parent()
+
+        hits = self.hits("end")
+        parent_id = next(params["invocation_id"] for _, params in hits if params["page_location"] == "parent")
+        workers = [(client_id, params) for client_id, params in hits if params["page_location"] == "worker"]
+
+        self.assertEqual(len(workers), 2)
+        for client_id, params in workers:
+            self.assertEqual(client_id, "333.444")
+            self.assertEqual(params["parent_invocation_id"], parent_id)
+
+    def test_async_tasks_keep_their_own_context(self):
+
+        @analytics_hit_decorator(page_location="async_context", transport=self.memory)
+        async def handle():
+            await asyncio.sleep(0.001)
+
+        async def request(request_number):
+            with ga4py.tracking_context(client_id=f"{request_number}.2"):
+                await handle()
+
+        async def main():
+            await asyncio.gather(*(request(i) for i in range(5)))
+
+        asyncio.run(main())
+
+        client_ids = sorted(client_id for client_id, _ in self.hits("end"))
+        self.assertEqual(client_ids, [f"{i}.2" for i in range(5)])
+
+
+class TestClientTrackers(unittest.TestCase):
+
+    def tearDown(self):
+        tracker_registry.reset_trackers()
+
+    def test_client_trackers_are_bounded(self):
+        with mock.patch.object(tracker_registry, "MAX_CLIENT_TRACKERS", 3):
+            first = tracker_registry.get_tracker("secret", "G-CLIENT", client_id="0.0")
+            self.assertIs(tracker_registry.get_tracker("secret", "G-CLIENT", client_id="0.0"), first)
+            self.assertTrue(first.assigned_client_id)
+
+            for i in range(1, 4):
+                tracker_registry.get_tracker("secret", "G-CLIENT", client_id=f"{i}.0")
+
+            # The oldest client's tracker was forgotten
+            self.assertIsNot(tracker_registry.get_tracker("secret", "G-CLIENT", client_id="0.0"), first)
+
+        shared = tracker_registry.get_tracker("secret", "G-CLIENT")
+        self.assertFalse(shared.assigned_client_id)
+
+
+class TestHandoff(unittest.TestCase):
+
+    def test_many_producers_one_consumer(self):
+        handoff = dispatcher.Handoff()
+        received = []
+
+        def consume():
+            while len(received) < 4000:
+                try:
+                    received.append(handoff.get(timeout=5))
+                except IndexError:
+                    return
+                handoff.task_done()
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+
+        def produce(producer):
+            for i in range(500):
+                handoff.put((producer, i))
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(produce, range(8)))
+
+        self.assertTrue(handoff.wait(time.monotonic() + 5))
+        consumer.join(5)
+
+        self.assertEqual(len(received), 4000)
+        self.assertEqual(handoff.unfinished(), 0)
+        # Each producer's items arrive in order
+        for producer in range(8):
+            self.assertEqual([i for p, i in received if p == producer], list(range(500)))
+
+    def test_get_times_out(self):
+        with self.assertRaises(IndexError):
+            dispatcher.Handoff().get(timeout=0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,198 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import ga4py
+import ga4py.config as config
+import ga4py.error_handling as error_handling
+import ga4py.dedup as dedup
+import ga4py.transports as transports
+from ga4py.add_tracker import analytics_hit_decorator
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDedupCache(unittest.TestCase):
+
+    def test_window_and_suppressed_count(self):
+        clock = FakeClock()
+        cache = dedup.DedupCache(clock=clock)
+
+        self.assertEqual(cache.check("key", 10), 0)
+        self.assertIsNone(cache.check("key", 10))
+        self.assertIsNone(cache.check("key", 10))
+        self.assertEqual(cache.check("other", 10), 0)
+
+        clock.now += 11
+        self.assertEqual(cache.check("key", 10), 2)
+        self.assertIsNone(cache.check("key", 10))
+
+    def test_size_bound_keeps_evicted_counts(self):
+        cache = dedup.DedupCache(max_entries=2, clock=FakeClock())
+
+        cache.check("a", 60)
+        cache.check("a", 60)
+        cache.check("b", 60)
+        cache.check("c", 60)
+
+        self.assertEqual(len(cache), 2)
+        # "a" was pushed out with one skipped hit, which only goes on the
+        # next hit with its key
+        self.assertEqual(cache.check("d", 60), 0)
+        self.assertEqual(cache.check("a", 60), 1)
+        self.assertEqual(cache.check("e", 60), 0)
+
+    def test_evicted_counts_stay_with_their_keys(self):
+        clock = FakeClock()
+        cache = dedup.DedupCache(max_entries=2, clock=clock)
+
+        cache.check("a", 10)
+        cache.check("a", 10)
+        cache.check("b", 10)
+        cache.check("b", 10)
+        cache.check("b", 10)
+
+        # Both windows run out, so both keys are dropped by the next check
+        clock.now += 11
+        self.assertEqual(cache.check("c", 10), 0)
+        self.assertEqual(len(cache), 1)
+
+        self.assertEqual(cache.check("b", 10), 2)
+        self.assertEqual(cache.check("a", 10), 1)
+
+    def test_saved_between_runs(self):
+        clock = FakeClock()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "dedup", "cache.json")
+
+            first_run = dedup.DedupCache(path=path, clock=clock)
+            first_run.check("key", 60)
+            first_run.check("key", 60)
+            first_run.save()
+
+            second_run = dedup.DedupCache(path=path, clock=clock)
+            self.assertIsNone(second_run.check("key", 60))
+
+            clock.now += 61
+            self.assertEqual(dedup.DedupCache(path=path, clock=clock).check("key", 60), 0)
+
+    def test_malformed_file_is_an_empty_cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "cache.json")
+
+            for content in ("[]", "{", '{"entries": []}', '{"entries": {"key": 5}}', "null"):
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write(content)
+
+                cache = dedup.DedupCache(path=path, clock=FakeClock())
+                self.assertEqual(len(cache), 0)
+                self.assertEqual(cache.check("key", 60), 0)
+
+    def test_key_only_uses_chosen_parameters(self):
+        first = dedup.dedup_key("tool", "page", {"tool": "a", "run": 1}, ["tool"])
+        second = dedup.dedup_key("tool", "page", {"tool": "a", "run": 2}, ["tool"])
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(
+            dedup.dedup_key("tool", "page", {"tool": "a", "run": 1}),
+            dedup.dedup_key("tool", "page", {"tool": "a", "run": 2}),
+        )
+
+
+class TestDedupDecorator(unittest.TestCase):
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {"GA4_DISPATCH_MODE": "inline"})
+        self.env.start()
+        config.reload_config()
+        dedup.reset_cache()
+        self.memory = transports.MemoryTransport()
+
+    def tearDown(self):
+        self.env.stop()
+        config.reload_config()
+        dedup.reset_cache()
+
+    def test_reruns_are_collapsed(self):
+
+        clock = FakeClock()
+        dedup._cache = dedup.DedupCache(clock=clock)
+
+        @analytics_hit_decorator(page_location="app", transport=self.memory, dedup_window=60)
+        def app():
+            pass
+
+        for _ in range(5):
+            app()
+
+        self.assertEqual([event["params"]["stage"] for event in self.memory.events], ["start", "end"])
+
+        # Once the window is over the next hit reports the skipped reruns
+        clock.now += 61
+        app()
+
+        self.assertEqual(self.memory.events[2]["params"]["dedup_suppressed"], 4)
+
+    def test_sessions_are_deduplicated_separately(self):
+
+        @analytics_hit_decorator(page_location="app", transport=self.memory,
+                                 dedup_window=60, skip_stage=["end"])
+        def app():
+            pass
+
+        for client_id in ("1.1", "2.2", "1.1"):
+            with ga4py.tracking_context(client_id=client_id):
+                app()
+
+        self.assertEqual([request["client_id"] for request in self.memory.requests], ["1.1", "2.2"])
+
+    def test_summary_hits_are_not_deduplicated(self):
+
+        @analytics_hit_decorator(page_location="app", transport=self.memory,
+                                 dedup_window=60, summary_mode=True, summary_interval=0)
+        def app():
+            pass
+
+        app()
+        app()
+
+        self.assertEqual([event["params"]["stage"] for event in self.memory.events], ["summary", "summary"])
+
+    def test_bad_dedup_arguments_use_defaults(self):
+
+        with mock.patch.object(error_handling, "send_tracking_error_alert") as alert:
+
+            @analytics_hit_decorator(page_location="app", transport=self.memory,
+                                     dedup_window="a minute", dedup_params=5)
+            def app():
+                return "ran"
+
+            self.assertEqual(app(), "ran")
+            self.assertEqual(app(), "ran")
+
+        # Treated as no window, so nothing is deduplicated
+        self.assertEqual(len(self.memory.events), 4)
+        self.assertIn("dedup_window, dedup_params", str(alert.call_args))
+
+    def test_broken_dedup_check_does_not_raise(self):
+
+        @analytics_hit_decorator(page_location="app", transport=self.memory, dedup_window=60)
+        def app():
+            return "ran"
+
+        with mock.patch.object(dedup, "check", side_effect=AttributeError), \
+                mock.patch.object(error_handling, "send_tracking_error_alert"):
+            self.assertEqual(app(), "ran")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import time
+import unittest
+
+import ga4py.delivery as delivery
+import ga4py.error_handling as error_handling
+import ga4py.transports as transports
+from ga4py.circuit_breaker import OPEN
+
+
+class Tracker:
+    def __init__(self, delay=0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.sends = 0
+
+    def send(self, events):
+        self.sends += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("GA4 unreachable")
+
+
+class TestDelivery(unittest.TestCase):
+
+    def setUp(self):
+        delivery.get_breaker().reset()
+
+    def tearDown(self):
+        delivery.get_breaker().reset()
+
+    def test_latency_budget_bounds_wait(self):
+        tracker = Tracker(delay=0.5)
+
+        started = time.perf_counter()
+        with self.assertRaises(error_handling.LatencyBudgetExceeded):
+            delivery.deliver(tracker, [{"name": "pageview", "params": {}}], latency_budget_ms=50)
+
+        self.assertLess(time.perf_counter() - started, 0.3)
+
+    def test_late_send_is_recorded_once(self):
+        tracker = Tracker(delay=0.2)
+        breaker = delivery.get_breaker()
+
+        with self.assertRaises(error_handling.LatencyBudgetExceeded):
+            delivery.deliver(tracker, [{"name": "pageview", "params": {}}], latency_budget_ms=20)
+
+        # The send finishing late doesn't undo (or add to) the timeout
+        time.sleep(0.4)
+        self.assertEqual(tracker.sends, 1)
+        self.assertEqual(breaker._failures, 1)
+
+    def test_breaker_per_transport(self):
+        tracker = Tracker(fail=True)
+        breaker = delivery.get_breaker()
+
+        for _ in range(breaker.failure_threshold):
+            with self.assertRaises(ConnectionError):
+                delivery.deliver(tracker, [{"name": "pageview", "params": {}}])
+
+        self.assertEqual(delivery.breaker_states()["http"], OPEN)
+
+        # Other transports keep sending
+        memory = transports.MemoryTransport()
+        delivery.deliver(tracker, [{"name": "pageview", "params": {}}], transport=memory)
+
+        self.assertEqual(len(memory.events), 1)
+        self.assertIsNot(delivery.get_breaker(memory), breaker)
+
+    def test_breaker_opens_and_skips_sends(self):
+        tracker = Tracker(fail=True)
+        breaker = delivery.get_breaker()
+
+        for _ in range(breaker.failure_threshold):
+            with self.assertRaises(ConnectionError):
+                delivery.deliver(tracker, [{"name": "pageview", "params": {}}])
+
+        self.assertEqual(breaker.state, OPEN)
+
+        with self.assertRaises(error_handling.CircuitOpenError):
+            delivery.deliver(tracker, [{"name": "pageview", "params": {}}])
+
+        # The refused send never reached the tracker
+        self.assertEqual(tracker.sends, breaker.failure_threshold)
+
+    def test_success_keeps_breaker_closed(self):
+        tracker = Tracker()
+        delivery.deliver(tracker, [{"name": "pageview", "params": {}}], latency_budget_ms=1000)
+        self.assertEqual(tracker.sends, 1)
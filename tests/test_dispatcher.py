@@ -0,0 +1,211 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import ga4py.config as config
+import ga4py.dispatcher as dispatcher
+import ga4py.spool as spool
+import ga4py.delivery as delivery
+from ga4py.batching import EventBatcher
+
+
+class SlowTracker:
+    """
+    Stand-in for a GtagMP tracker which takes a while to "send" and
+    records what it was given.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.sent = []
+
+    def send(self, events):
+        time.sleep(self.delay)
+        self.sent.extend(events)
+
+
+class FailingTracker:
+    def send(self, events):
+        raise RuntimeError("GA4 is down")
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        # Failed sends count towards the GA4 circuit breaker
+        delivery.get_breaker().reset()
+
+    def test_enqueue_does_not_wait_for_send(self):
+        tracker = SlowTracker(delay=0.2)
+
+        started = time.perf_counter()
+        dispatcher.enqueue_events(tracker, [{"name": "pageview", "params": {}}])
+        elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.1)
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(len(tracker.sent), 1)
+
+    def test_flush_respects_deadline(self):
+        tracker = SlowTracker(delay=0.5)
+        dispatcher.enqueue_events(tracker, [{"name": "pageview", "params": {}}])
+
+        self.assertFalse(dispatcher.flush(timeout=0.05))
+        self.assertTrue(dispatcher.flush(timeout=5))
+
+    def test_worker_survives_failed_send(self):
+        dispatcher.enqueue_events(FailingTracker(), [{"name": "pageview", "params": {}}])
+
+        tracker = SlowTracker(delay=0)
+        dispatcher.enqueue_events(tracker, [{"name": "pageview", "params": {}}])
+
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(len(tracker.sent), 1)
+
+
+class TestBoundedQueue(unittest.TestCase):
+
+    def fill(self, handoff, items):
+        return [handoff.put(i, events=1, size=10) for i in range(items)]
+
+    def test_drop_newest(self):
+        handoff = dispatcher.Handoff(max_events=3)
+
+        self.assertEqual(self.fill(handoff, 5), [None, None, None, "drop_newest", "drop_newest"])
+        self.assertEqual(handoff.dropped, {"drop_newest": 2})
+        self.assertEqual([handoff.get(0) for _ in range(3)], [0, 1, 2])
+
+    def test_drop_oldest(self):
+        handoff = dispatcher.Handoff(max_events=3, overflow="drop_oldest")
+
+        self.assertEqual(self.fill(handoff, 5), [None] * 5)
+        self.assertEqual(handoff.dropped, {"drop_oldest": 2})
+        self.assertEqual([handoff.get(0) for _ in range(3)], [2, 3, 4])
+        self.assertEqual(handoff.events, 0)
+
+    def test_byte_limit(self):
+        handoff = dispatcher.Handoff(max_bytes=25)
+
+        self.assertEqual(self.fill(handoff, 3), [None, None, "drop_newest"])
+        self.assertEqual(handoff.bytes, 20)
+
+    def test_block_waits_for_room(self):
+        handoff = dispatcher.Handoff(max_events=1, overflow="block", block_timeout=5)
+        handoff.put("first", events=1)
+
+        threading.Timer(0.05, handoff.get).start()
+        started = time.monotonic()
+        self.assertIsNone(handoff.put("second", events=1))
+
+        self.assertLess(time.monotonic() - started, 4)
+        self.assertEqual(handoff.get(0), "second")
+
+    def test_block_times_out(self):
+        handoff = dispatcher.Handoff(max_events=1, overflow="block", block_timeout=0.01)
+        handoff.put("first", events=1)
+
+        self.assertEqual(handoff.put("second", events=1), "block_timeout")
+        self.assertEqual(handoff.dropped, {"block_timeout": 1})
+
+    def test_flush_marker_is_never_dropped(self):
+        handoff = dispatcher.Handoff(max_events=1, overflow="drop_oldest")
+        handoff.put("first", events=1)
+        handoff.put("flush")
+
+        self.assertEqual(handoff.put("second", events=1), None)
+        self.assertEqual(handoff.put("third", events=1), "drop_newest")
+        self.assertEqual([handoff.get(0) for _ in range(2)], ["flush", "second"])
+
+    def test_spill_to_spool(self):
+        handoff = dispatcher.Handoff(max_events=1, overflow="spill")
+        handoff.put("waiting", events=1)
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                mock.patch.dict(os.environ, {"GA4_SPOOL_DIR": temp_dir}), \
+                mock.patch.object(dispatcher, "_queue", handoff), \
+                mock.patch.object(dispatcher, "_ensure_worker"), \
+                mock.patch.object(dispatcher, "_apply_limits"):
+            config.reload_config()
+
+            dispatcher.enqueue_events(FakeTracker(), [{"name": "pageview", "params": {}}])
+            self.assertEqual(os.listdir(temp_dir), [spool.SPOOL_FILE_NAME])
+            self.assertEqual(dispatcher.spilled_events(), 1)
+
+            os.environ["GA4_SPOOL_DIR"] = ""
+            config.reload_config()
+            dispatcher.enqueue_events(FakeTracker(), [{"name": "pageview", "params": {}}])
+            self.assertEqual(dispatcher.dropped_events(), {"spill_failed": 1})
+
+        config.reload_config()
+
+
+class FakeTracker:
+    measurement_id = "G-QUEUE"
+    client_id = "1.1"
+
+
+class RecordingTracker:
+    def __init__(self):
+        self.requests = []
+
+    def send(self, events):
+        self.requests.append(list(events))
+
+
+class TestBatching(unittest.TestCase):
+
+    def test_events_from_many_calls_share_requests(self):
+        tracker = RecordingTracker()
+
+        for i in range(30):
+            dispatcher.enqueue_events(tracker, [{"name": "pageview", "params": {"i": i}}])
+
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual([len(request) for request in tracker.requests], [25, 5])
+
+    def test_events_keep_original_timestamp(self):
+        tracker = RecordingTracker()
+
+        dispatcher.enqueue_events(tracker, [{"name": "pageview", "params": {}}])
+        time.sleep(0.05)
+        dispatcher.enqueue_events(tracker, [{"name": "pageview", "params": {}}])
+
+        self.assertTrue(dispatcher.flush(timeout=5))
+        first, second = tracker.requests[0]
+        self.assertGreaterEqual(second["timestamp_micros"] - first["timestamp_micros"], 40000)
+
+    def test_batcher_limits(self):
+        now = [0.0]
+        batcher = EventBatcher(max_events=25, max_age=1.0, max_bytes=200, clock=lambda: now[0])
+        tracker = object()
+
+        # Size limit - each of these events is over half of max_bytes
+        self.assertEqual(batcher.add(tracker, [{"name": "a" * 120, "params": {}}]), [])
+        ready = batcher.add(tracker, [{"name": "b" * 120, "params": {}}])
+        self.assertEqual(len(ready), 1)
+        self.assertEqual(len(ready[0].events), 1)
+
+        # Age limit
+        self.assertEqual(batcher.due(), [])
+        now[0] = 1.5
+        self.assertEqual(len(batcher.due()), 1)
+        self.assertEqual(len(batcher), 0)
+
+        # Requests never go over 25 events even if asked to
+        self.assertEqual(EventBatcher(max_events=100).max_events, 25)
+
+    def test_batcher_settings_from_config(self):
+        settings = {"GA4_BATCH_SIZE": "10", "GA4_BATCH_MAX_AGE": "later", "GA4_BATCH_MAX_BYTES": "5000"}
+
+        with mock.patch.dict(os.environ, settings):
+            config.reload_config()
+            batcher = dispatcher._create_batcher()
+
+        config.reload_config()
+
+        # A bad value only loses that setting
+        self.assertEqual(batcher.max_events, 10)
+        self.assertEqual(batcher.max_age, 1.0)
+        self.assertEqual(batcher.max_bytes, 5000)
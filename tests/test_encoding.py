@@ -0,0 +1,162 @@
+import io
+import os
+import enum
+import unittest
+import contextlib
+from unittest import mock
+
+import ga4py.config as config
+import ga4py.encoding as encoding
+import ga4py.error_handling as error_handling
+import ga4py.transports as transports
+from ga4py.add_tracker import analytics_hit_decorator, send_hit
+
+
+class Colour(enum.IntEnum):
+    RED = 1
+
+
+class TestEncodeValue(unittest.TestCase):
+
+    def test_strings_are_sent_as_they_are(self):
+        self.assertEqual(encoding.encode_value("hello"), "hello")
+
+    def test_values_are_cut_to_the_limit(self):
+        self.assertEqual(len(encoding.encode_value("x" * 500)), encoding.MAX_VALUE_LENGTH)
+        self.assertEqual(len(encoding.encode_value(list(range(500)))), encoding.MAX_VALUE_LENGTH)
+        self.assertEqual(
+            len(encoding.encode_value("x" * 500, "page_location")), encoding.MAX_PAGE_VALUE_LENGTH
+        )
+
+    def test_numbers_stay_numbers(self):
+        self.assertEqual(encoding.encode_value(12), 12)
+        self.assertEqual(encoding.encode_value(1.5), 1.5)
+        self.assertEqual(encoding.encode_value(float("nan")), "nan")
+        self.assertEqual(encoding.encode_value(True), "True")
+        self.assertEqual(encoding.encode_value(None), "None")
+
+    def test_subclasses_use_their_base_encoder(self):
+        self.assertEqual(encoding.encode_value(Colour.RED), Colour.RED)
+        self.assertIn(Colour, encoding._ENCODERS)
+
+    def test_broken_repr(self):
+        class Broken:
+            def __repr__(self):
+                raise RuntimeError("no repr")
+
+        self.assertEqual(encoding.encode_value(Broken()), "<Broken>")
+
+
+class TestEncodeName(unittest.TestCase):
+
+    def test_names_are_cleaned(self):
+        self.assertEqual(encoding.encode_name("my-param name"), "my_param_name")
+        self.assertEqual(encoding.encode_name("1st"), "p_1st")
+        self.assertEqual(encoding.encode_name("ga_session"), "p_ga_session")
+        self.assertEqual(len(encoding.encode_name("n" * 60)), encoding.MAX_NAME_LENGTH)
+
+
+class TestEncodeParameters(unittest.TestCase):
+
+    def test_count_limit(self):
+        parameters = {f"param_{i}": i for i in range(30)}
+        params, dropped = encoding.encode_parameters(parameters)
+
+        self.assertEqual(len(params), encoding.MAX_CUSTOM_PARAMETERS)
+        self.assertEqual(dropped, 30 - encoding.MAX_CUSTOM_PARAMETERS)
+        self.assertEqual(list(params)[0], "param_0")
+
+    def test_library_parameters_are_kept_first(self):
+        parameters = {f"param_{i}": i for i in range(25)}
+        parameters.update({"duration_ms": 12.5, "span_load_ms": 3.0, "sample_dropped": 0})
+
+        params, dropped = encoding.encode_parameters(
+            parameters, library_keys={"duration_ms", "span_load_ms", "sample_dropped"}
+            )
+
+        self.assertEqual(len(params), encoding.MAX_CUSTOM_PARAMETERS)
+        self.assertEqual(dropped, 28 - encoding.MAX_CUSTOM_PARAMETERS)
+        for name in ("duration_ms", "span_load_ms", "sample_dropped"):
+            self.assertIn(name, params)
+
+        # The caller's parameters fill the rest, first ones first
+        self.assertIn("param_0", params)
+        self.assertNotIn("param_24", params)
+
+    def test_caller_parameters_named_like_library_ones_are_not_kept_first(self):
+        parameters = {f"param_{i}": i for i in range(25)}
+        parameters.update({"calls": 3, "errors": 0, "testing": "yes"})
+
+        params, dropped = encoding.encode_parameters(parameters)
+
+        self.assertEqual(dropped, 28 - encoding.MAX_CUSTOM_PARAMETERS)
+        self.assertEqual(list(params), [f"param_{i}" for i in range(encoding.MAX_CUSTOM_PARAMETERS)])
+
+    def test_clashing_names_keep_the_first(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            params, dropped = encoding.encode_parameters(
+                {"a-b": 1, "a_b": 2, "c": 3}, logging_level="error"
+                )
+
+        self.assertEqual(params, {"a_b": 1, "c": 3})
+        self.assertEqual(dropped, 1)
+        self.assertIn("'a_b' not sent", output.getvalue())
+
+        # Nothing printed unless asked for
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            encoding.encode_parameters({"a-b": 1, "a_b": 2})
+        self.assertEqual(output.getvalue(), "")
+
+    def test_tracked_call_keeps_its_own_parameters_first(self):
+        memory = transports.MemoryTransport()
+        parameters = {f"param_{i}": i for i in range(25)}
+        parameters["duration-ms"] = "mine"
+
+        @analytics_hit_decorator(
+            page_location="encoding_test", transport=memory, logging_level="", **parameters
+            )
+        def tool():
+            pass
+
+        with mock.patch.dict(os.environ, {"GA4_DISPATCH_MODE": "inline", "GA4_ERROR_API_ENDPOINT": ""}):
+            config.reload_config()
+            tool()
+
+        config.reload_config()
+
+        end, = [event["params"] for event in memory.events if event["params"]["stage"] == "end"]
+        # The timings this call added are kept, the caller's parameters fill
+        # the rest in order
+        self.assertIn("cpu_ms", end)
+        self.assertIsInstance(end["duration_ms"], float)
+        self.assertIn("param_0", end)
+        self.assertNotIn("param_24", end)
+
+    def test_send_hit_keeps_within_limits(self):
+        memory = transports.MemoryTransport()
+        parameters = {f"param_{i}": "v" * 200 for i in range(30)}
+
+        with mock.patch.dict(os.environ, {"GA4_ERROR_API_ENDPOINT": ""}), \
+                mock.patch.object(error_handling, "send_tracking_error_alert") as alert:
+            config.reload_config()
+            send_hit(
+                parameters,
+                page_location="encoding_test",
+                stage="start",
+                transport=memory,
+                logging_level="",
+            )
+
+        config.reload_config()
+
+        params = memory.events[0]["params"]
+        self.assertLessEqual(len(params), encoding.MAX_PARAMETERS_PER_EVENT - 2)
+        self.assertEqual(params["stage"], "start")
+        self.assertTrue(all(len(str(value)) <= encoding.MAX_VALUE_LENGTH for value in params.values()))
+        self.assertIn("Too many parameters", alert.call_args.kwargs["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,9 @@
+import os
 import unittest
+from unittest import mock
 import requests #type: ignore
+import ga4py.alerts as alerts
+import ga4py.config as config
 import ga4py.error_handling as error_handling
 import ga4py.add_tracker as add_tracker
 from ga4py.custom_arguments import MeasurementArguments
@@ -45,3 +49,39 @@ class TestError(unittest.TestCase):
 
 
 
+
+    def test_caller_name_only_used_for_errors(self):
+        from unittest import mock
+
+        @error_handling.handle_analytics_errors
+        def failing_send(logging_level=""):
+            raise RuntimeError("send failed")
+
+        def calling_function():
+            return failing_send(logging_level="")
+
+        with mock.patch.object(error_handling, "send_tracking_error_alert") as alert:
+            self.assertIsNone(calling_function())
+
+        self.assertEqual(alert.call_args.kwargs["function"], "calling_function")
+
+        # The dependency check is only done once and then cached
+        self.assertIsNone(error_handling._missing_modules_error())
+        self.assertEqual(error_handling._missing_modules_error.cache_info().currsize, 1)
+
+
+class TestErrorAlertEndpoint(unittest.TestCase):
+
+    def test_endpoint_from_config(self):
+        channel = mock.Mock()
+
+        with mock.patch.object(alerts, "get_channel", return_value=channel) as get_channel:
+            with mock.patch.dict(os.environ, {"GA4_ERROR_API_ENDPOINT": "http://alerts"}):
+                config.reload_config()
+                error_handling.send_tracking_error_alert("boom", "tracked", [{}], logging_level="")
+
+            config.reload_config()
+            error_handling.send_tracking_error_alert("boom", "tracked", [{}], logging_level="")
+
+        get_channel.assert_called_once_with("http://alerts")
+        channel.submit.assert_called_once()
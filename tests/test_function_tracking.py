@@ -1,7 +1,15 @@
+import os
+import asyncio
+import time
+import threading
 import unittest
+from unittest import mock
 import requests
+import pytest
 import ga4py.add_tracker as add_tracker
 import ga4py.error_handling as error_handling
+import ga4py.config as config
+import ga4py.transports as transports
 from ga4py.custom_arguments import MeasurementArguments
 
 @add_tracker.analytics_hit_decorator
@@ -78,3 +86,280 @@ class TestTracking(unittest.TestCase):
 
         
         
+
+
+@add_tracker.analytics_hit_decorator
+async def simple_coroutine_to_track(delay):
+    """
+    An async function with the tracking decorator added.
+    """
+
+    await asyncio.sleep(delay)
+    return "finished"
+
+
+class TestAsyncTracking(unittest.IsolatedAsyncioTestCase):
+
+    async def test_tracking_coroutine(self):
+        tracking_args_dict: MeasurementArguments = {
+            "testing_mode": True,
+            "page_location": "any_location_you_want", 
+            "logging_level": "all"
+        }
+
+        result = await simple_coroutine_to_track(0, ga4py_args_remove = tracking_args_dict)
+        self.assertEqual(result, "finished")
+
+    @pytest.mark.usefixtures("recorded_hits")
+    async def test_end_hit_sent_after_coroutine_finishes(self):
+
+        @add_tracker.analytics_hit_decorator(page_location="any_location_you_want")
+        async def slow_coroutine():
+            await asyncio.sleep(0.01)
+            # Marks when the coroutine itself finished among the hits
+            self.sent.append({"stage": "coroutine finished"})
+
+        await slow_coroutine()
+
+        self.assertEqual(
+            [hit["stage"] for hit in self.sent], ["start", "coroutine finished", "end"]
+            )
+
+    async def test_hits_sent_on_ga4py_threads(self):
+        thread_names = []
+
+        def recording_send_hit(**kwargs):
+            thread_names.append(threading.current_thread().name)
+            return None, True
+
+        @add_tracker.analytics_hit_decorator(page_location="any_location_you_want")
+        async def coroutine():
+            pass
+
+        # Not the loop's default executor, which asyncio needs for DNS lookups
+        with mock.patch.object(add_tracker, "send_hit", side_effect=recording_send_hit):
+            await coroutine()
+
+        self.assertEqual(len(thread_names), 2)
+        self.assertTrue(all(name.startswith("ga4py-async") for name in thread_names))
+
+    async def test_error_in_coroutine(self):
+        @add_tracker.analytics_hit_decorator
+        async def failing_coroutine():
+            raise error_handling.AnalyticsException("Error message", "Async analytics message")
+
+        with self.assertRaises(error_handling.AnalyticsException):
+            await failing_coroutine(ga4py_args_remove = {
+                "testing_mode": True,
+                "page_location": "any_location_you_want", 
+            })
+
+
+class TestTrackingPlan(unittest.TestCase):
+
+    @pytest.mark.usefixtures("recorded_hits")
+    def test_static_decorator_arguments(self):
+        @add_tracker.analytics_hit_decorator(
+            page_location="static_location", 
+            skip_stage=["end"],
+            testing_mode=True,
+            tool="my_tool"
+            )
+        def function_with_static_args(value):
+            return value * 2
+
+        self.assertEqual(function_with_static_args(2), 4)
+
+        # Per-call arguments override the static ones
+        function_with_static_args(3, ga4py_args_remove={"page_location": "override"})
+
+        self.assertEqual([hit["stage"] for hit in self.sent], ["start", "start"])
+        self.assertEqual(self.sent[0]["page_location"], "static_location")
+        self.assertEqual(dict(self.sent[0]["parameter_dictionary"]), {"tool": "my_tool"})
+        self.assertEqual(self.sent[1]["page_location"], "override")
+
+    @pytest.mark.usefixtures("recorded_hits")
+    def test_reload_config_recompiles_plan(self):
+        @add_tracker.analytics_hit_decorator(skip_stage=["start", "end"])
+        def tracked():
+            pass
+
+        with mock.patch.dict(os.environ, {"GA4_ANALYTICS_TEST": "TRUE"}):
+            config.reload_config()
+            tracked(ga4py_args_remove={"stage": "custom", "testing_mode": True})
+
+        config.reload_config()
+
+        self.assertEqual(self.sent[0]["parameter_dictionary"]["testing"], "TRUE")
+
+    def test_bad_tracking_arguments_use_defaults(self):
+        memory = transports.MemoryTransport()
+
+        with mock.patch.object(error_handling, "send_tracking_error_alert") as alert:
+
+            # Reported when the plan is compiled, i.e. when decorating
+            @add_tracker.analytics_hit_decorator(
+                page_location="bad_args", transport=memory, latency_budget_ms="soon", skip_stage=5
+                )
+            def tracked(value):
+                return value
+
+            self.assertEqual(tracked(1), 1)
+
+        self.assertEqual([event["params"]["stage"] for event in memory.events], ["start", "end"])
+        self.assertIn("latency_budget_ms, skip_stage", str(alert.call_args))
+
+    @pytest.mark.usefixtures("recorded_hits")
+    def test_call_overrides_only_recompile_when_needed(self):
+        @add_tracker.analytics_hit_decorator(page_location="static_location", tool="my_tool")
+        def tracked():
+            pass
+
+        with mock.patch.object(
+                add_tracker.plan_module, "compile_plan", wraps=add_tracker.plan_module.compile_plan
+                ) as compile_plan:
+            tracked(ga4py_args_remove={"page_location": "override", "run": 1})
+            self.assertEqual(compile_plan.call_count, 0)
+
+            tracked(ga4py_args_remove={"skip_stage": ["end"]})
+            self.assertEqual(compile_plan.call_count, 1)
+
+        self.assertEqual([hit["stage"] for hit in self.sent], ["start", "end", "start"])
+        self.assertEqual(self.sent[0]["page_location"], "override")
+        self.assertEqual(dict(self.sent[0]["parameter_dictionary"]), {"tool": "my_tool", "run": 1})
+        self.assertEqual(self.sent[2]["page_location"], "static_location")
+
+    def test_plan_failure_runs_function_untracked(self):
+        memory = transports.MemoryTransport()
+
+        @add_tracker.analytics_hit_decorator(page_location="no_plan", transport=memory)
+        def tracked(value):
+            return value
+
+        with mock.patch.object(add_tracker.plan_module, "with_overrides", side_effect=TypeError), \
+                mock.patch.object(error_handling, "send_tracking_error_alert") as alert:
+            self.assertEqual(tracked(2, ga4py_args_remove={"tool": "x"}), 2)
+
+        self.assertEqual(memory.events, [])
+        alert.assert_called_once()
+
+
+@pytest.mark.usefixtures("recorded_hits")
+class TestTiming(unittest.TestCase):
+
+    def test_end_and_error_hits_include_timing(self):
+        @add_tracker.analytics_hit_decorator(page_location="timed")
+        def timed_function(fail=False):
+            time.sleep(0.05)
+            if fail:
+                raise ValueError("failed")
+
+        timed_function()
+        with self.assertRaises(ValueError):
+            timed_function(fail=True)
+
+        self.assertEqual([hit["stage"] for hit in self.sent], ["start", "end", "start", "error"])
+        self.assertNotIn("duration_ms", self.sent[0]["parameter_dictionary"])
+
+        for hit in (self.sent[1], self.sent[3]):
+            self.assertGreaterEqual(hit["parameter_dictionary"]["duration_ms"], 50)
+            self.assertIn("cpu_ms", hit["parameter_dictionary"])
+
+    def test_slow_hit_only_over_threshold(self):
+        @add_tracker.analytics_hit_decorator(
+            page_location="budgeted", 
+            slow_threshold_ms=30, 
+            skip_stage=["start", "end"]
+            )
+        def budgeted_function(delay):
+            time.sleep(delay)
+
+        budgeted_function(0)
+        budgeted_function(0.05)
+
+        self.assertEqual([hit["stage"] for hit in self.sent], ["slow"])
+
+    def test_bad_slow_threshold_means_no_threshold(self):
+        with mock.patch.object(error_handling, "send_tracking_error_alert") as alert:
+
+            @add_tracker.analytics_hit_decorator(
+                page_location="timed", skip_stage=["start", "end"], slow_threshold_ms="x"
+                )
+            def unbudgeted_function():
+                return "ran"
+
+            self.assertEqual(unbudgeted_function(), "ran")
+
+        self.assertEqual(self.sent, [])
+        self.assertIn("slow_threshold_ms", str(alert.call_args))
+
+
+@pytest.mark.usefixtures("recorded_hits")
+class TestGeneratorTracking(unittest.IsolatedAsyncioTestCase):
+
+    def test_generator_tracked_lazily(self):
+        @add_tracker.analytics_hit_decorator(page_location="stream")
+        def numbers(count):
+            for i in range(count):
+                yield i
+            return "done"
+
+        generator = numbers(3)
+        self.assertEqual(self.sent, [])
+
+        self.assertEqual(next(generator), 0)
+        self.assertEqual([hit["stage"] for hit in self.sent], ["start"])
+
+        self.assertEqual(list(generator), [1, 2])
+
+        self.assertEqual([hit["stage"] for hit in self.sent], ["start", "end"])
+        self.assertEqual(self.sent[1]["parameter_dictionary"]["items_yielded"], 3)
+        self.assertIn("stream_ms", self.sent[1]["parameter_dictionary"])
+
+    def test_generator_error_and_close(self):
+        @add_tracker.analytics_hit_decorator(page_location="stream")
+        def failing():
+            yield 1
+            raise ValueError("broken stream")
+
+        @add_tracker.analytics_hit_decorator(page_location="stream")
+        def endless():
+            while True:
+                received = yield
+                if received == "stop":
+                    return
+
+        with self.assertRaises(ValueError):
+            list(failing())
+
+        generator = endless()
+        next(generator)
+        generator.close()
+
+        self.assertEqual([hit["stage"] for hit in self.sent], ["start", "error", "start", "end"])
+        self.assertEqual(self.sent[1]["parameter_dictionary"]["items_yielded"], 1)
+
+    def test_generator_send_is_passed_through(self):
+        @add_tracker.analytics_hit_decorator(page_location="stream")
+        def echo():
+            received = None
+            while True:
+                received = yield received
+
+        generator = echo()
+        next(generator)
+        self.assertEqual(generator.send("hello"), "hello")
+        generator.close()
+
+    async def test_async_generator(self):
+        @add_tracker.analytics_hit_decorator(page_location="async_stream")
+        async def async_numbers(count):
+            for i in range(count):
+                await asyncio.sleep(0)
+                yield i
+
+        items = [item async for item in async_numbers(4)]
+
+        self.assertEqual(items, [0, 1, 2, 3])
+        self.assertEqual([hit["stage"] for hit in self.sent], ["start", "end"])
+        self.assertEqual(self.sent[1]["parameter_dictionary"]["items_yielded"], 4)
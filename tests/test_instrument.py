@@ -0,0 +1,212 @@
+import os
+import types
+import asyncio
+import unittest
+from unittest import mock
+
+import ga4py
+import ga4py.config as config
+import ga4py.transports as transports
+
+
+LIBRARY_SOURCE = '''
+from os.path import join
+
+from ga4py.add_tracker import analytics_hit_decorator
+
+
+def load(name):
+    return f"loaded {name}"
+
+
+def debug_dump():
+    return "dump"
+
+
+def _helper():
+    return "private"
+
+
+async def fetch():
+    return "fetched"
+
+
+@analytics_hit_decorator(page_location="by_hand")
+def tracked_by_hand():
+    return "by hand"
+
+
+class Report:
+
+    def __init__(self, title):
+        self.title = title
+
+    def render(self):
+        return f"<h1>{self.title}</h1>"
+
+    @staticmethod
+    def formats():
+        return ["html"]
+
+    @classmethod
+    def blank(cls):
+        return cls("")
+
+    @property
+    def size(self):
+        return len(self.title)
+'''
+
+
+def make_library():
+    library = types.ModuleType("instrument_test_library")
+    exec(LIBRARY_SOURCE, library.__dict__)
+    return library
+
+
+class InstrumentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {"GA4_DISPATCH_MODE": "inline"})
+        self.env.start()
+        config.reload_config()
+        self.memory = transports.MemoryTransport()
+        self.library = make_library()
+
+    def tearDown(self):
+        ga4py.uninstrument(self.library)
+        self.env.stop()
+        config.reload_config()
+
+    def summaries(self):
+        return {
+            event["params"]["page_location"]: event["params"]["calls"]
+            for event in self.memory.events
+            if event["params"]["stage"] == "summary"
+        }
+
+
+class TestInstrumentModule(InstrumentTestCase):
+
+    def test_public_functions_and_methods_are_wrapped(self):
+        instrumented = ga4py.instrument_module(self.library, transport=self.memory)
+
+        self.assertEqual(sorted(instrumented), [
+            "instrument_test_library.Report.blank",
+            "instrument_test_library.Report.formats",
+            "instrument_test_library.Report.render",
+            "instrument_test_library.debug_dump",
+            "instrument_test_library.fetch",
+            "instrument_test_library.load",
+        ])
+
+        # Behaviour is unchanged
+        self.assertEqual(self.library.load("data"), "loaded data")
+        self.assertEqual(asyncio.run(self.library.fetch()), "fetched")
+        report = self.library.Report("Sales")
+        self.assertEqual(report.render(), "<h1>Sales</h1>")
+        self.assertEqual(report.size, 5)
+        self.assertEqual(self.library.Report.formats(), ["html"])
+        self.assertIsInstance(self.library.Report.blank(), self.library.Report)
+        self.assertEqual(self.library.tracked_by_hand(), "by hand")
+
+    def test_summary_mode_by_default(self):
+        ga4py.instrument_module(self.library, transport=self.memory)
+
+        for _ in range(3):
+            self.library.load("data")
+
+        # Aggregated, so nothing is sent until the interval is up
+        self.assertEqual(self.memory.events, [])
+
+        # Removing the instrumentation sends what's waiting
+        ga4py.uninstrument(self.library)
+        self.assertEqual(self.summaries(), {"instrument_test_library.load": 3})
+
+    def test_sampling_replaces_summary_mode(self):
+        ga4py.instrument_module(self.library, include=["load"], transport=self.memory, sample_rate=1)
+
+        self.library.load("data")
+
+        self.assertEqual([event["params"]["stage"] for event in self.memory.events], ["start", "end"])
+
+    def test_include_and_exclude(self):
+        instrumented = ga4py.instrument_module(
+            self.library, include=["load", "Report.*"], exclude=["render"], transport=self.memory
+            )
+
+        self.assertEqual(sorted(instrumented), [
+            "instrument_test_library.Report.blank",
+            "instrument_test_library.Report.formats",
+            "instrument_test_library.load",
+        ])
+
+    def test_uninstrument_restores_originals(self):
+        original_load = self.library.load
+        original_render = self.library.Report.render
+        original_formats = vars(self.library.Report)["formats"]
+
+        ga4py.instrument_module(self.library, transport=self.memory)
+        self.assertIsNot(self.library.load, original_load)
+
+        restored = ga4py.uninstrument(self.library)
+
+        self.assertIn("instrument_test_library.load", restored)
+        self.assertIs(self.library.load, original_load)
+        self.assertIs(self.library.Report.render, original_render)
+        self.assertIs(vars(self.library.Report)["formats"], original_formats)
+
+        # Instrumenting twice doesn't wrap twice
+        ga4py.instrument_module(self.library, transport=self.memory)
+        self.assertEqual(ga4py.instrument_module(self.library, transport=self.memory), [])
+
+    def test_functions_replaced_since_are_left_alone(self):
+        ga4py.instrument_module(self.library, include=["load"], transport=self.memory)
+
+        def patched(name):
+            return "patched"
+
+        self.library.load = patched
+        self.assertEqual(ga4py.uninstrument(self.library), [])
+        self.assertIs(self.library.load, patched)
+
+
+class TestInstrumentClass(InstrumentTestCase):
+
+    def test_class_decorator(self):
+
+        @ga4py.instrument_class(transport=self.memory, summary_interval=0)
+        class Greeter:
+
+            def hello(self):
+                return "hello"
+
+            def _private(self):
+                return "private"
+
+        self.assertEqual(Greeter().hello(), "hello")
+        self.assertEqual(Greeter()._private(), "private")
+
+        self.assertEqual(len(self.summaries()), 1)
+        self.assertTrue(next(iter(self.summaries())).endswith("Greeter.hello"))
+
+        ga4py.uninstrument(Greeter)
+        Greeter().hello()
+        self.assertEqual(len(self.memory.events), 1)
+
+    def test_bare_class_decorator(self):
+
+        @ga4py.instrument_class
+        class Plain:
+
+            def run(self):
+                return 1
+
+        self.assertIsInstance(Plain, type)
+        self.assertTrue(hasattr(vars(Plain)["run"], "_ga4py_summary"))
+        ga4py.uninstrument(Plain)
+        self.assertFalse(hasattr(vars(Plain)["run"], "_ga4py_summary"))
+
+
+if __name__ == "__main__":
+    unittest.main()
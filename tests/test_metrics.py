@@ -0,0 +1,158 @@
+import os
+import tempfile
+import threading
+import unittest
+import urllib.request
+from unittest import mock
+
+import ga4py
+import ga4py.config as config
+import ga4py.metrics as metrics
+import ga4py.transports as transports
+from ga4py.add_tracker import analytics_hit_decorator
+
+
+class FailingTransport(transports.Transport):
+
+    name = "failing"
+
+    def _send(self, gtag_tracker, events):
+        raise ConnectionError("GA4 unreachable")
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {"GA4_DISPATCH_MODE": "inline"})
+        self.env.start()
+        config.reload_config()
+        metrics.reset()
+        self.memory = transports.MemoryTransport()
+
+    def tearDown(self):
+        self.env.stop()
+        config.reload_config()
+        metrics.reset()
+
+
+class TestStats(MetricsTestCase):
+
+    def test_tracked_calls_are_counted(self):
+
+        @analytics_hit_decorator(page_location="metrics", transport=self.memory)
+        def tool():
+            return 1
+
+        for _ in range(3):
+            tool()
+
+        stats = ga4py.stats()
+        self.assertEqual(stats["hits_built"], {"end": 3, "start": 3})
+        self.assertEqual(stats["requests_sent"], {"memory": 6})
+        self.assertEqual(stats["events_sent"], {"memory": 6})
+        self.assertEqual(stats["tracking_overhead_seconds"]["count"], 3)
+        self.assertEqual(stats["send_seconds"]["memory"]["count"], 6)
+        self.assertEqual(stats["send_seconds"]["memory"]["buckets"][float("inf")], 6)
+
+    def test_failed_sends_are_dropped_without_a_spool(self):
+
+        @analytics_hit_decorator(page_location="metrics", transport=FailingTransport(),
+                                 skip_stage=["end"], logging_level="")
+        def tool():
+            pass
+
+        with mock.patch("ga4py.error_handling.send_tracking_error_alert"):
+            tool()
+
+        stats = ga4py.stats()
+        self.assertEqual(stats["requests_failed"], {"failing": 1})
+        self.assertEqual(stats["events_dropped"]["send_failed"], 1)
+        self.assertNotIn("requests_sent", stats)
+
+    def test_sampled_out_calls(self):
+
+        @analytics_hit_decorator(page_location="metrics", transport=self.memory, sample_rate=0)
+        def tool():
+            pass
+
+        tool()
+        tool()
+
+        self.assertEqual(ga4py.stats()["calls_sampled_out"], 2)
+
+    def test_counts_from_finished_threads_are_kept(self):
+
+        def work():
+            for _ in range(100):
+                metrics.increment("hits_built", label="thread")
+            metrics.observe("send_seconds", 0.002, "thread")
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(ga4py.stats()["hits_built"]["thread"], 400)
+        # Still there once the finished threads have been folded together
+        stats = ga4py.stats()
+        self.assertEqual(stats["hits_built"]["thread"], 400)
+        self.assertEqual(stats["send_seconds"]["thread"]["buckets"][0.0025], 4)
+        self.assertEqual(stats["send_seconds"]["thread"]["buckets"][0.001], 0)
+
+    def test_finished_threads_are_let_go_without_reading(self):
+
+        def work():
+            metrics.increment("hits_built", label="thread")
+
+        registered = len(metrics._all_threads)
+        for _ in range(50):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+
+        # Each new thread folds in the ones which finished before it
+        self.assertLessEqual(len(metrics._all_threads), registered + 1)
+        self.assertEqual(ga4py.stats()["hits_built"]["thread"], 50)
+
+
+class TestPrometheus(MetricsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.increment("hits_built", 2, "start")
+        metrics.observe("send_seconds", 0.02, "http")
+
+    def test_text_format(self):
+        text = metrics.prometheus_text()
+
+        self.assertIn("# TYPE ga4py_hits_built_total counter", text)
+        self.assertIn('ga4py_hits_built_total{stage="start"} 2', text)
+        self.assertIn("# TYPE ga4py_send_seconds histogram", text)
+        self.assertIn('ga4py_send_seconds_bucket{transport="http",le="0.025"} 1', text)
+        self.assertIn('ga4py_send_seconds_bucket{transport="http",le="+Inf"} 1', text)
+        self.assertIn('ga4py_send_seconds_count{transport="http"} 1', text)
+        self.assertIn("ga4py_queue_events 0", text)
+
+    def test_write_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "textfile", "ga4py.prom")
+            metrics.write_prometheus(path)
+
+            with open(path, encoding="utf-8") as file:
+                self.assertIn('ga4py_hits_built_total{stage="start"} 2', file.read())
+
+    def test_http_server(self):
+        server = metrics.start_http_server(0)
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertEqual(response.status, 200)
+                self.assertIn('ga4py_hits_built_total{stage="start"} 2', response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
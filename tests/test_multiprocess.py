@@ -0,0 +1,158 @@
+import os
+import unittest
+import multiprocessing
+from unittest import mock
+
+import ga4py.config as config
+import ga4py.dispatcher as dispatcher
+import ga4py.metrics as metrics
+import ga4py.multiprocess as multiprocess
+import ga4py.summary as summary
+import ga4py.tracker_registry as tracker_registry
+import ga4py.transports as transports
+from ga4py.add_tracker import analytics_hit_decorator
+
+
+@analytics_hit_decorator
+def tracked_square(number, ga4py_args_remove=None):
+    return number * number
+
+
+def _square_in_child(number):
+    return tracked_square(number, ga4py_args_remove={
+        "page_location": "pool_test",
+        "skip_stage": ["start"],
+    })
+
+
+def _square_in_child_to_memory(number):
+    return tracked_square(number, ga4py_args_remove={
+        "page_location": "pool_memory",
+        "skip_stage": ["start"],
+        "transport": "memory",
+    })
+
+
+def _child_state(_):
+    # Report what the per-process state looks like after the fork
+    return {
+        "pending": dispatcher.pending(),
+        "trackers": len(tracker_registry._trackers),
+        "forwarding": multiprocess.forward_queue() is not None,
+        "summary_calls": [item._calls for item in summary.all_summaries()],
+    }
+
+
+@unittest.skipUnless(
+    "fork" in multiprocessing.get_all_start_methods(), "needs the fork start method"
+)
+class TestMultiprocess(unittest.TestCase):
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {
+            "GA4_CLI_SEC": "secret",
+            "GA4_MID": "G-TEST",
+            "GA4_DISPATCH_MODE": "inline",
+        })
+        self.env.start()
+        config.reload_config()
+
+        self.context = multiprocessing.get_context("fork")
+        self.sent = []
+
+    def tearDown(self):
+        self.env.stop()
+        config.reload_config()
+
+    def test_child_hits_are_sent_from_the_parent(self):
+        with mock.patch.object(
+                multiprocess, "_send_from_parent",
+                side_effect=lambda measurement_id, client_id, events, transport: self.sent.append((measurement_id, events))):
+
+            collector = multiprocess.start_collector(self.context)
+            try:
+                with self.context.Pool(2) as pool:
+                    results = pool.map(_square_in_child, range(4))
+            finally:
+                collector.stop(timeout=5)
+
+        self.assertEqual(results, [0, 1, 4, 9])
+        self.assertEqual(collector.received, 4)
+
+        measurement_ids = {measurement_id for measurement_id, _ in self.sent}
+        self.assertEqual(measurement_ids, {"G-TEST"})
+
+        for _, events in self.sent:
+            self.assertEqual(events[0]["params"]["stage"], "end")
+            # Stamped in the child so the original time is kept
+            self.assertIn("timestamp_micros", events[0])
+
+        self.assertIsNone(multiprocess.forward_queue())
+
+    def test_child_transport_is_used_by_the_parent(self):
+        memory = transports.get_transport("memory")
+        memory.clear()
+
+        collector = multiprocess.start_collector(self.context)
+        try:
+            with self.context.Pool(1) as pool:
+                pool.map(_square_in_child_to_memory, range(2))
+        finally:
+            collector.stop(timeout=5)
+
+        # Sent through the memory transport the function chose, not http
+        self.assertEqual(len(memory.events), 2)
+        self.assertEqual({event["params"]["page_location"] for event in memory.events}, {"pool_memory"})
+
+    def test_state_is_reset_after_fork(self):
+        tracker_registry.get_tracker("secret", "G-TEST")
+        summary.CallSummary("parent_function").record(
+            mock.Mock(summary_interval=60.0), 0.01
+        )
+
+        with self.context.Pool(1) as pool:
+            state, = pool.map(_child_state, [0])
+
+        self.assertEqual(state["trackers"], 0)
+        self.assertEqual(state["pending"], 0)
+        self.assertFalse(state["forwarding"])
+        self.assertEqual(sum(state["summary_calls"]), 0)
+
+        tracker_registry.reset_trackers()
+
+
+class TestSendFromParent(unittest.TestCase):
+
+    def tearDown(self):
+        config.reload_config()
+
+    def dropped(self):
+        return metrics.stats().get("events_dropped", {}).get("no_credentials", 0)
+
+    def test_credentials_only_needed_for_http(self):
+        events = [{"name": "pageview", "params": {"stage": "end"}}]
+        memory = transports.get_transport("memory")
+        memory.clear()
+
+        with mock.patch.dict(os.environ, {"GA4_TRANSPORT": "memory"}):
+            os.environ.pop("GA4_CLI_SEC", None)
+            config.reload_config()
+
+            multiprocess._send_from_parent("G-TEST", None, events)
+            self.assertTrue(dispatcher.flush(timeout=5))
+
+        self.assertEqual(len(memory.events), 1)
+
+        # GA4 itself can't be sent to without them - counted, not lost silently
+        dropped = self.dropped()
+        with mock.patch.dict(os.environ, {"GA4_TRANSPORT": "http"}):
+            os.environ.pop("GA4_CLI_SEC", None)
+            config.reload_config()
+
+            multiprocess._send_from_parent("G-TEST", None, events)
+
+        self.assertEqual(self.dropped(), dropped + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import asyncio
+import pstats
+import tempfile
+import tracemalloc
+import unittest
+from unittest import mock
+
+import ga4py.config as config
+import ga4py.profiling as profiling
+import ga4py.transports as transports
+from ga4py.add_tracker import analytics_hit_decorator
+
+
+def build_list(size):
+    return [str(i) for i in range(size)]
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {"GA4_DISPATCH_MODE": "inline", "GA4_PROFILE_DIR": ""})
+        self.env.start()
+        config.reload_config()
+        self.memory = transports.MemoryTransport()
+
+    def tearDown(self):
+        self.env.stop()
+        config.reload_config()
+
+    def end_hits(self, stage="end"):
+        return [event["params"] for event in self.memory.events if event["params"]["stage"] == stage]
+
+    def test_profile_added_to_end_hit(self):
+
+        @analytics_hit_decorator(page_location="profile_test", transport=self.memory, profile_rate=1)
+        def allocate():
+            return len(build_list(50000))
+
+        allocate()
+
+        end, = self.end_hits()
+        self.assertIn("build_list", end["profile_top"])
+        self.assertEqual(len(end["profile_top"].split(",")), 3)
+        # 50,000 short strings is well over 1MB
+        self.assertGreater(end["profile_peak_kib"], 1000)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_not_profiled_by_default(self):
+
+        @analytics_hit_decorator(page_location="profile_test", transport=self.memory)
+        def plain():
+            return 1
+
+        plain()
+
+        end, = self.end_hits()
+        self.assertNotIn("profile_top", end)
+
+    def test_profile_added_to_error_hit(self):
+
+        @analytics_hit_decorator(page_location="profile_test", transport=self.memory, profile_rate=1)
+        def broken():
+            build_list(10)
+            raise ValueError("broken")
+
+        with self.assertRaises(ValueError):
+            broken()
+
+        error, = self.end_hits("error")
+        self.assertIn("profile_top", error)
+
+    def test_one_call_profiled_at_a_time(self):
+
+        @analytics_hit_decorator(page_location="inner", transport=self.memory, profile_rate=1)
+        def inner():
+            return build_list(10)
+
+        @analytics_hit_decorator(page_location="outer", transport=self.memory, profile_rate=1)
+        def outer():
+            return inner()
+
+        outer()
+
+        ends = {hit["page_location"]: hit for hit in self.end_hits()}
+        self.assertIn("profile_top", ends["outer"])
+        self.assertNotIn("profile_top", ends["inner"])
+
+    def test_profile_file_written(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+
+            @analytics_hit_decorator(
+                page_location="profile_test",
+                transport=self.memory,
+                profile_rate=1,
+                profile_dir=profile_dir,
+            )
+            def allocate():
+                return build_list(100)
+
+            allocate()
+
+            end, = self.end_hits()
+            path = os.path.join(profile_dir, end["profile_file"])
+            stats = pstats.Stats(path)
+
+        self.assertTrue(any(name == "build_list" for _, _, name in stats.stats))
+
+    def test_cancelled_and_interrupted_calls_release_the_profiler(self):
+
+        @analytics_hit_decorator(page_location="profile_test", transport=self.memory, profile_rate=1)
+        async def slow():
+            await asyncio.sleep(10)
+
+        @analytics_hit_decorator(page_location="profile_test", transport=self.memory, profile_rate=1)
+        def interrupted():
+            raise KeyboardInterrupt
+
+        async def cancel():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(slow(), 0.01)
+
+        asyncio.run(cancel())
+        with self.assertRaises(KeyboardInterrupt):
+            interrupted()
+
+        self.assertFalse(profiling._profiling_lock.locked())
+        self.assertFalse(tracemalloc.is_tracing())
+
+        # Later calls can still be profiled
+        @analytics_hit_decorator(page_location="profile_test", transport=self.memory, profile_rate=1)
+        def allocate():
+            return build_list(100)
+
+        allocate()
+        self.assertIn("profile_top", self.end_hits()[-1])
+
+    def test_bad_profile_arguments_turn_profiling_off(self):
+
+        with mock.patch("ga4py.error_handling.send_tracking_error_alert"):
+
+            @analytics_hit_decorator(
+                page_location="profile_test", transport=self.memory, profile_rate="often", profile_top="x"
+                )
+            def allocate():
+                return build_list(100)
+
+            allocate()
+
+        self.assertNotIn("profile_top", self.end_hits()[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
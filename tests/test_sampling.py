@@ -0,0 +1,97 @@
+import unittest
+from unittest import mock
+
+import pytest
+
+import ga4py.add_tracker as add_tracker
+from ga4py.sampling import CallSampler, sampling_settings
+
+
+class TestSampling(unittest.TestCase):
+
+    def test_no_settings_means_no_sampling(self):
+        self.assertIsNone(sampling_settings())
+        self.assertIsNone(sampling_settings(sample_rate=1))
+
+    def test_bad_values_are_ignored_and_out_of_range_values_clamped(self):
+        invalid = {}
+        settings = sampling_settings(
+            sample_rate="half", rate_limit=-5, rate_limit_burst=0,
+            adaptive_sample_target=float("nan"), invalid=invalid
+            )
+
+        self.assertEqual(settings.sample_rate, 1.0)
+        self.assertEqual(settings.rate_limit, 0.0)
+        self.assertEqual(settings.rate_limit_burst, 1.0)
+        self.assertIsNone(settings.adaptive_sample_target)
+        self.assertEqual(sorted(invalid), ["adaptive_sample_target", "sample_rate"])
+
+        self.assertEqual(sampling_settings(sample_rate=7), None)
+        self.assertEqual(sampling_settings(sample_rate=-1).sample_rate, 0.0)
+
+    @pytest.mark.usefixtures("recorded_hits")
+    def test_decorator_with_bad_sample_rate(self):
+        @add_tracker.analytics_hit_decorator(page_location="sampled")
+        def tracked(value):
+            return value
+
+        with mock.patch("ga4py.error_handling.send_tracking_error_alert") as alert:
+            self.assertEqual(tracked(1, ga4py_args_remove={"sample_rate": "half"}), 1)
+
+        # Tracked as if no sample_rate was given
+        self.assertEqual([hit["stage"] for hit in self.sent], ["start", "end"])
+        self.assertIn("sample_rate", str(alert.call_args))
+
+    def test_sample_rate_and_dropped_counts(self):
+        draws = iter([0.9, 0.9, 0.1, 0.9, 0.1])
+        sampler = CallSampler(sampling_settings(sample_rate=0.5), rng=lambda: next(draws))
+
+        decisions = [sampler.decide() for _ in range(5)]
+
+        self.assertEqual([keep for keep, _ in decisions], [False, False, True, False, True])
+        self.assertEqual(decisions[2][1], {"sample_rate": 0.5, "sample_dropped": 2})
+        self.assertEqual(decisions[4][1]["sample_dropped"], 1)
+
+    def test_token_bucket(self):
+        now = [0.0]
+        sampler = CallSampler(
+            sampling_settings(rate_limit=2, rate_limit_burst=2), clock=lambda: now[0]
+            )
+
+        self.assertEqual([sampler.decide()[0] for _ in range(3)], [True, True, False])
+
+        # Half a second later one more token has been added
+        now[0] = 0.5
+        self.assertEqual([sampler.decide()[0] for _ in range(2)], [True, False])
+
+    def test_adaptive_rate_follows_call_rate(self):
+        now = [0.0]
+        sampler = CallSampler(
+            sampling_settings(adaptive_sample_target=10), clock=lambda: now[0], rng=lambda: 0.99
+            )
+
+        # 100 calls in the first second - all tracked as the rate isn't known yet
+        for i in range(100):
+            now[0] = i / 100
+            sampler.decide()
+
+        # Once the window closes the sample rate drops to roughly 10 / 100
+        sampler._rng = lambda: 0.05
+        now[0] = 1.0
+        keep, parameters = sampler.decide()
+
+        self.assertTrue(keep)
+        self.assertAlmostEqual(parameters["sample_rate"], 0.1, places=1)
+        self.assertEqual(parameters["sample_dropped"], 0)
+
+    @pytest.mark.usefixtures("recorded_hits")
+    def test_decorator_skips_sampled_out_calls(self):
+        @add_tracker.analytics_hit_decorator(page_location="sampled", rate_limit=1, rate_limit_burst=1)
+        def often_called(value):
+            return value
+
+        results = [often_called(i) for i in range(5)]
+
+        self.assertEqual(results, list(range(5)))
+        self.assertEqual([hit["stage"] for hit in self.sent], ["start", "end"])
+        self.assertEqual(self.sent[0]["parameter_dictionary"]["sample_dropped"], 0)
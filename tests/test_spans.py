@@ -0,0 +1,199 @@
+import os
+import asyncio
+import unittest
+from unittest import mock
+
+import ga4py
+import ga4py.config as config
+import ga4py.spans as spans
+import ga4py.transports as transports
+from ga4py.add_tracker import analytics_hit_decorator
+
+
+class SpanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {"GA4_DISPATCH_MODE": "inline"})
+        self.env.start()
+        config.reload_config()
+        self.memory = transports.MemoryTransport()
+
+    def tearDown(self):
+        self.env.stop()
+        config.reload_config()
+
+    def hits(self, stage):
+        return [event["params"] for event in self.memory.events if event["params"]["stage"] == stage]
+
+
+class TestSpans(SpanTestCase):
+
+    def test_spans_are_added_to_the_end_hit(self):
+
+        @analytics_hit_decorator(page_location="span_test", transport=self.memory)
+        def tool():
+            with ga4py.span("load"):
+                pass
+            with ga4py.span("report"):
+                with ga4py.span("charts"):
+                    pass
+            for _ in range(3):
+                with ga4py.span("load"):
+                    pass
+
+        tool()
+
+        start, = self.hits("start")
+        end, = self.hits("end")
+
+        self.assertNotIn("span_count", start)
+        self.assertEqual(end["span_count"], 6)
+        for name in ("span_load_ms", "span_report_ms", "span_report_charts_ms"):
+            self.assertIn(name, end)
+        # Only one hit per stage - spans aren't sent on their own
+        self.assertEqual(len(self.memory.events), 2)
+
+    def test_spans_are_added_to_the_error_hit(self):
+
+        @analytics_hit_decorator(page_location="span_test", transport=self.memory)
+        def broken():
+            with ga4py.span("before_error"):
+                raise ValueError("broken")
+
+        with self.assertRaises(ValueError):
+            broken()
+
+        error, = self.hits("error")
+        self.assertIn("span_before_error_ms", error)
+
+    def test_only_the_slowest_spans_are_sent(self):
+
+        @analytics_hit_decorator(page_location="span_test", transport=self.memory)
+        def many_spans():
+            for i in range(20):
+                with ga4py.span(f"step_{i}"):
+                    pass
+
+        many_spans()
+
+        end, = self.hits("end")
+        span_parameters = [name for name in end if name.startswith("span_") and name.endswith("_ms")]
+        self.assertEqual(len(span_parameters), spans.MAX_SPAN_PARAMETERS)
+        self.assertEqual(end["span_count"], 20)
+
+    def test_nested_tracked_functions_keep_their_own_spans(self):
+
+        @analytics_hit_decorator(page_location="inner", transport=self.memory)
+        def inner():
+            with ga4py.span("inner_block"):
+                pass
+
+        @analytics_hit_decorator(page_location="outer", transport=self.memory)
+        def outer():
+            with ga4py.span("outer_block"):
+                inner()
+
+        outer()
+
+        ends = {hit["page_location"]: hit for hit in self.hits("end")}
+        self.assertIn("span_inner_block_ms", ends["inner"])
+        self.assertNotIn("span_inner_block_ms", ends["outer"])
+        self.assertIn("span_outer_block_ms", ends["outer"])
+
+    def test_span_outside_tracked_function(self):
+        with ga4py.span("untracked") as block:
+            pass
+
+        self.assertIsNotNone(block.duration_ms)
+        self.assertEqual(self.memory.events, [])
+
+    def test_interrupted_call_leaves_no_invocation_behind(self):
+
+        @analytics_hit_decorator(page_location="span_test", transport=self.memory)
+        def interrupted():
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            interrupted()
+
+        self.assertIsNone(spans._current.get())
+
+    def test_spans_inside_a_generator(self):
+
+        @analytics_hit_decorator(page_location="span_test", transport=self.memory)
+        def rows():
+            for i in range(3):
+                with ga4py.span("fetch"):
+                    pass
+                yield i
+
+        for _ in rows():
+            # The caller's own spans aren't part of the generator's call
+            self.assertIsNone(spans._current.get())
+            with ga4py.span("caller"):
+                pass
+
+        end, = self.hits("end")
+        self.assertEqual(end["span_count"], 3)
+        self.assertIn("span_fetch_ms", end)
+        self.assertNotIn("span_caller_ms", end)
+        self.assertIsNone(spans._current.get())
+
+
+class TestAsyncSpans(SpanTestCase):
+
+    def test_async_spans(self):
+
+        @analytics_hit_decorator(page_location="async_span_test", transport=self.memory)
+        async def tool():
+            async with ga4py.span("wait"):
+                await asyncio.sleep(0.01)
+
+        asyncio.run(tool())
+
+        end, = self.hits("end")
+        self.assertGreaterEqual(end["span_wait_ms"], 5)
+
+    def test_spans_inside_an_async_generator(self):
+
+        @analytics_hit_decorator(page_location="async_span_test", transport=self.memory)
+        async def rows():
+            for i in range(2):
+                async with ga4py.span("fetch"):
+                    await asyncio.sleep(0)
+                yield i
+
+        async def main():
+            async for _ in rows():
+                self.assertIsNone(spans._current.get())
+
+        asyncio.run(main())
+
+        end, = self.hits("end")
+        self.assertEqual(end["span_count"], 2)
+        self.assertIn("span_fetch_ms", end)
+
+    def test_cancelled_call_leaves_no_invocation_behind(self):
+
+        @analytics_hit_decorator(page_location="async_span_test", transport=self.memory)
+        async def slow():
+            await asyncio.sleep(10)
+
+        async def request():
+            try:
+                await slow()
+            except asyncio.CancelledError:
+                # Still in the cancelled call's context
+                return spans._current.get()
+
+        async def main():
+            task = asyncio.create_task(request())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            return await task
+
+        self.assertIsNone(asyncio.run(main()))
+
+
+if __name__ == "__main__":
+    unittest.main()
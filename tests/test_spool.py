@@ -0,0 +1,73 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+import ga4py.spool as spool
+from ga4py.tracker_registry import PooledGtagMP
+
+
+class FakeTracker:
+    measurement_id = "G-SPOOL"
+    client_id = "123.456"
+
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spool_dir = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def spool_some_events(self, count):
+        for i in range(count):
+            spool.spool_events(
+                FakeTracker(), [{"name": "pageview", "params": {"i": i}}], spool_dir=self.spool_dir
+                )
+
+    def test_records_are_compact_lines(self):
+        self.spool_some_events(2)
+
+        with open(os.path.join(self.spool_dir, spool.SPOOL_FILE_NAME)) as spool_file:
+            lines = spool_file.readlines()
+
+        self.assertEqual(len(lines), 2)
+        record = json.loads(lines[0])
+        self.assertEqual(record["m"], "G-SPOOL")
+        self.assertIn("timestamp_micros", record["e"][0])
+        self.assertNotIn(" ", lines[0])
+
+    def test_disabled_without_folder(self):
+        self.assertFalse(spool.spool_events(FakeTracker(), [{"name": "pageview", "params": {}}], spool_dir=""))
+
+    def test_replay_batches_and_removes_files(self):
+        self.spool_some_events(30)
+        requests = []
+
+        with mock.patch.object(PooledGtagMP, "send", lambda tracker, events: requests.append(len(events))):
+            totals = spool.replay(spool_dir=self.spool_dir, api_secret="secret", logging_level="")
+
+        self.assertEqual(requests, [25, 5])
+        self.assertEqual(totals["events"], 30)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_replay_resumes_from_checkpoint(self):
+        self.spool_some_events(30)
+        sent = []
+
+        def fail_second_request(tracker, events):
+            if sent:
+                raise ConnectionError("GA4 unreachable")
+            sent.extend(events)
+
+        with mock.patch.object(PooledGtagMP, "send", fail_second_request):
+            totals = spool.replay(spool_dir=self.spool_dir, api_secret="secret", logging_level="")
+        self.assertEqual(totals["failed"], 1)
+
+        with mock.patch.object(PooledGtagMP, "send", lambda tracker, events: sent.extend(events)):
+            spool.replay(spool_dir=self.spool_dir, api_secret="secret", logging_level="")
+
+        self.assertEqual([event["params"]["i"] for event in sent], list(range(30)))
@@ -0,0 +1,81 @@
+import unittest
+from unittest import mock
+
+import pytest
+
+import ga4py.add_tracker as add_tracker
+from ga4py.summary import CallSummary
+
+
+class FakePlan:
+    summary_interval = 60.0
+
+
+class TestSummary(unittest.TestCase):
+
+    def test_percentiles_and_errors(self):
+        summary = CallSummary("summarised")
+
+        for i in range(1, 101):
+            summary.record(FakePlan(), i / 1000)
+        summary.record(FakePlan(), 0.001, ValueError("bad"))
+        summary.record(FakePlan(), 0.001, ValueError("bad"))
+        summary.record(FakePlan(), 0.001, KeyError("missing"))
+
+        parameters = summary.take()
+
+        self.assertEqual(parameters["calls"], 103)
+        self.assertEqual(parameters["errors"], 3)
+        self.assertEqual(parameters["error_types"], "ValueError:2,KeyError:1")
+        self.assertEqual(parameters["max_ms"], 100)
+
+        # Buckets are about 5% wide
+        self.assertAlmostEqual(parameters["p50_ms"], 49, delta=49 * 0.06)
+        self.assertAlmostEqual(parameters["p99_ms"], 99, delta=99 * 0.06)
+
+        # Taking the summary starts a new interval
+        self.assertIsNone(summary.take())
+
+    @pytest.mark.usefixtures("recorded_hits")
+    def test_decorator_sends_one_summary_per_interval(self):
+        @add_tracker.analytics_hit_decorator(page_location="hot_function", summary_mode=True, summary_interval=0)
+        def hot_function(value):
+            if value == 3:
+                raise ValueError("three")
+            return value
+
+        hot_function(1)
+        with self.assertRaises(ValueError):
+            hot_function(3)
+
+        # With an interval of 0 every call closes an interval
+        self.assertEqual([hit["stage"] for hit in self.sent], ["summary", "summary"])
+        self.assertEqual(self.sent[1]["parameter_dictionary"]["error_types"], "ValueError:1")
+
+    def test_no_hits_until_interval_is_up(self):
+        @add_tracker.analytics_hit_decorator(summary_mode=True, summary_interval=3600)
+        def hot_function():
+            pass
+
+        with mock.patch.object(add_tracker, "send_hit") as send_hit:
+            for _ in range(100):
+                hot_function()
+
+        send_hit.assert_not_called()
+
+    @pytest.mark.usefixtures("recorded_hits")
+    def test_bad_interval_uses_default(self):
+        for interval in (None, "often"):
+
+            @add_tracker.analytics_hit_decorator(
+                page_location="hot_function", summary_mode=True, summary_interval=interval
+                )
+            def hot_function():
+                return "ran"
+
+            self.assertEqual(hot_function(), "ran")
+
+            # Still tracked in summary mode, with the 60 second default
+            self.assertEqual(self.sent, [])
+            add_tracker.send_pending_summary(hot_function)
+            self.assertEqual(self.sent.pop()["parameter_dictionary"]["calls"], 1)
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import threading
+import unittest
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ga4py.tracker_registry as tracker_registry
+
+
+class CollectHandler(BaseHTTPRequestHandler):
+    """
+    Minimal Measurement Protocol endpoint which records each request body and
+    the client port it arrived on (one port per TCP connection).
+    """
+
+    protocol_version = "HTTP/1.1" # Allow keep-alive
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.received.append((self.client_address[1], json.loads(body)))
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTrackerRegistry(unittest.TestCase):
+
+    def setUp(self):
+        tracker_registry.reset_trackers()
+
+    def tearDown(self):
+        tracker_registry.reset_trackers()
+
+    def test_one_tracker_per_measurement_id(self):
+        first = tracker_registry.get_tracker("secret", "G-ONE")
+        self.assertIs(tracker_registry.get_tracker("secret", "G-ONE"), first)
+        self.assertIsNot(tracker_registry.get_tracker("secret", "G-TWO"), first)
+
+    def test_tracker_shared_across_threads(self):
+        trackers = []
+        threads = [
+            threading.Thread(
+                target=lambda: trackers.append(tracker_registry.get_tracker("secret", "G-THREADS"))
+                )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len({id(tracker) for tracker in trackers}), 1)
+
+    def test_requests_reuse_connection(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), CollectHandler)
+        server.received = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            tracker = tracker_registry.get_tracker("secret", "G-POOL")
+            tracker._base_domain = f"http://127.0.0.1:{server.server_port}/mp/collect"
+
+            for i in range(3):
+                tracker.send(events=[{"name": "pageview", "params": {"i": i}}])
+
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(len(server.received), 3)
+        self.assertEqual(server.received[0][1]["client_id"], tracker.client_id)
+        self.assertEqual(len({port for port, _ in server.received}), 1)
+
+    def test_gtag_created_on_first_send(self):
+        tracker = tracker_registry.get_tracker("secret", "G-LAZY")
+        self.assertIsNone(tracker._gtag)
+
+        self.assertEqual(tracker.create_new_event(name="pageview"), {"name": "pageview"})
+        self.assertIsNone(tracker._gtag)
+
+        self.assertIs(tracker.gtag(), tracker.gtag())
+        self.assertEqual(tracker.gtag().client_id, tracker.client_id)
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_tracking_without_sending_skips_heavy_imports(self):
+        script = (
+            "import sys, ga4py.transports as transports\n"
+            "from ga4py.add_tracker import analytics_hit_decorator\n"
+            "@analytics_hit_decorator(page_location='lazy', transport='memory', logging_level='none')\n"
+            "def tool(): return 1\n"
+            "tool()\n"
+            "print(len(transports.get_transport('memory').events))\n"
+            "print(','.join(m for m in ('ga4mp', 'requests') if m in sys.modules))\n"
+        )
+        env = {key: value for key, value in os.environ.items() if key not in ("GA4_CLI_SEC", "GA4_MID")}
+        env["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        output = subprocess.run(
+            [sys.executable, "-c", script], env=env, check=True, capture_output=True, text=True
+        ).stdout.splitlines()
+
+        self.assertEqual(output[0], "2")
+        self.assertEqual(output[1], "")
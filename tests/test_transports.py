@@ -0,0 +1,146 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+import ga4py.config as config
+import ga4py.dispatcher as dispatcher
+import ga4py.spool as spool
+import ga4py.transports as transports
+from ga4py.add_tracker import analytics_hit_decorator
+
+
+class FakeTracker:
+    measurement_id = "G-TRANSPORT"
+    client_id = "123.456"
+
+
+def without_credentials():
+    # Patch the environment so GA4_CLI_SEC/GA4_MID aren't set
+    patcher = mock.patch.dict(os.environ)
+    patcher.start()
+    for name in ("GA4_CLI_SEC", "GA4_MID", "GA4_TRANSPORT", "GA4_DISPATCH_MODE"):
+        os.environ.pop(name, None)
+    config.reload_config()
+    return patcher
+
+
+class TestTransports(unittest.TestCase):
+
+    def setUp(self):
+        self.env = without_credentials()
+        transports.reset_transports()
+
+    def tearDown(self):
+        self.env.stop()
+        config.reload_config()
+        transports.reset_transports()
+
+    def test_memory_transport_from_decorator(self):
+        memory = transports.MemoryTransport()
+
+        @analytics_hit_decorator(page_location="memory_test", transport=memory)
+        def add(a, b):
+            return a + b
+
+        self.assertEqual(add(1, 2), 3)
+
+        stages = [event["params"]["stage"] for event in memory.events]
+        self.assertEqual(stages, ["start", "end"])
+        self.assertEqual(memory.sent_requests, 2)
+
+    def test_transport_from_environment(self):
+        os.environ["GA4_TRANSPORT"] = "memory"
+        config.reload_config()
+
+        @analytics_hit_decorator(page_location="env_test")
+        def identity(value):
+            return value
+
+        identity(1)
+
+        self.assertEqual(len(transports.get_transport("memory").events), 2)
+
+    def test_http_transport_still_needs_credentials(self):
+        with mock.patch.object(transports.HttpTransport, "_send") as http_send:
+
+            @analytics_hit_decorator(page_location="http_test", transport="http")
+            def identity(value):
+                return value
+
+            identity(1)
+
+        http_send.assert_not_called()
+
+    def test_null_transport(self):
+        null = transports.get_transport("null")
+        null.send(FakeTracker(), [{"name": "pageview", "params": {}}])
+        self.assertEqual((null.sent_requests, null.sent_events), (1, 1))
+
+    def test_unknown_transport(self):
+        with self.assertRaises(ValueError):
+            transports.get_transport("carrier_pigeon")
+
+    def test_file_transport_can_be_replayed(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Write straight into the spool folder as a rotated file
+            path = os.path.join(temp_dir, "ga4py-spool-1.ndjson")
+            file_transport = transports.FileTransport(path)
+
+            for i in range(3):
+                file_transport.send(FakeTracker(), [{"name": "pageview", "params": {"i": i}}])
+
+            with open(path) as records:
+                self.assertEqual(json.loads(records.readline())["m"], "G-TRANSPORT")
+
+            memory = transports.MemoryTransport()
+            totals = spool.replay(
+                spool_dir=temp_dir, api_secret="secret", logging_level="", transport=memory
+            )
+
+        self.assertEqual(totals["events"], 3)
+        self.assertEqual(memory.requests[0]["client_id"], "123.456")
+        self.assertEqual([event["params"]["i"] for event in memory.events], [0, 1, 2])
+
+    def test_background_batches_per_transport(self):
+        first = transports.MemoryTransport()
+        second = transports.MemoryTransport()
+        tracker = FakeTracker()
+
+        for i in range(4):
+            dispatcher.enqueue_events(tracker, [{"name": "pageview", "params": {"i": i}}], transport=first)
+            dispatcher.enqueue_events(tracker, [{"name": "pageview", "params": {"i": i}}], transport=second)
+
+        self.assertTrue(dispatcher.flush(timeout=5))
+
+        self.assertEqual(len(first.events), 4)
+        self.assertEqual(len(second.events), 4)
+        # Batched rather than one request per event
+        self.assertLess(first.sent_requests, 4)
+
+
+class TestAsyncTransport(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.env = without_credentials()
+
+    async def asyncTearDown(self):
+        self.env.stop()
+        config.reload_config()
+
+    async def test_async_function_uses_transport(self):
+        memory = transports.MemoryTransport()
+
+        @analytics_hit_decorator(page_location="async_test", transport=memory)
+        async def wait_and_return(value):
+            await asyncio.sleep(0)
+            return value
+
+        self.assertEqual(await wait_and_return(5), 5)
+        self.assertEqual(len(memory.events), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()